@@ -1,6 +1,12 @@
 """PySundials CVODE wrapper to automate routine steps."""
 # pylint: disable=W0401
 
-from .core import *
-from .odeint import *
+from .common import *
+try:
+    from pysundials import cvode as _cvode
+except ImportError: # only the scipy backend is available, see scipyint
+    _cvode = None
+if _cvode is not None:
+    from .core import *
+    from .odeint import *
 from . import example_ode
@@ -0,0 +1,112 @@
+"""
+Compiled inner loop of :meth:`cgp.cvodeint.core.Cvodeint.integrate`.
+
+Optional: if this extension module has been built (see setup_steploop.py),
+:meth:`~cgp.cvodeint.core.Cvodeint._integrate_adaptive_steps` uses it in
+place of its Python loop. CVode() is called directly rather than through
+ctypes, and each step is written into the output buffer through raw pointers.
+Control returns to Python only at the end of the interval, at a root, on
+error, or when the buffer is full.
+
+The right-hand side is still called through the ctypes callback that
+pysundials registered with CVODE, so the savings are per-step overhead:
+a ctypes call, a flag lookup and an NVector-to-ndarray copy.
+
+The loop runs without the GIL. A Python right-hand side reacquires it in its
+ctypes callback, but a compiled one registered with :func:`set_rhs` does not,
+so that several threads can integrate separate solver objects in parallel.
+"""
+
+cimport cython
+cimport numpy as np
+from libc.string cimport memcpy
+
+cdef extern from "sundials/sundials_nvector.h":
+    ctypedef struct _generic_N_Vector:
+        pass
+    ctypedef _generic_N_Vector* N_Vector
+
+cdef extern from "nvector/nvector_serial.h":
+    double* NV_DATA_S(N_Vector v) nogil
+
+ctypedef int (*CVRhsFn)(double t, N_Vector y, N_Vector ydot, void* f_data)
+
+cdef extern from "cvode/cvode.h":
+    int CVode(void* cvode_mem, double tout, N_Vector yout, double* tret,
+        int itask) nogil
+    int CVodeSetFdata(void* cvode_mem, void* f_data)
+    int CVodeReInit(void* cvode_mem, CVRhsFn f, double t0, N_Vector y0,
+        int itol, double reltol, void* abstol)
+    enum:
+        CV_SUCCESS
+        CV_TSTOP_RETURN
+        CV_ROOT_RETURN
+        CV_ONE_STEP_TSTOP
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def adaptive_steps(size_t cvode_mem, size_t yout, size_t tret,
+    np.ndarray[np.float64_t, ndim=1] t,
+    np.ndarray[np.float64_t, ndim=2, mode="c"] Y,
+    int i, int imax, double tstop):
+    """
+    Take CVODE steps towards *tstop*, storing each in rows *i, i+1, ...*
+
+    :param int cvode_mem: Address of the CVODE memory block.
+    :param int yout: Address of the N_Vector for the solver state.
+    :param int tret: Address of the double for the time of return.
+    :param t, Y: Output arrays for time and state, at least *imax* rows.
+    :param int i: First row to write.
+    :param int imax: Stop before writing this row.
+    :param float tstop: End time, as set by CVodeSetStopTime.
+    :return tuple: *(i, flag)*, where *i* is the number of rows filled and
+        *flag* the last value returned by CVode(), or ``None`` if no step
+        was taken. Stops early at a root or if CVode() returns an error
+        (flag < 0); the row for a failed step is not written.
+    """
+    cdef void* mem = <void*>cvode_mem
+    cdef N_Vector y = <N_Vector>yout
+    cdef double* ptret = <double*>tret
+    cdef double* py = NV_DATA_S(y)
+    cdef double* pt = <double*>t.data
+    cdef double* pY = <double*>Y.data
+    cdef Py_ssize_t n = Y.shape[1]
+    cdef int flag = 0
+    cdef bint stepped = False
+    with nogil:
+        while (ptret[0] < tstop) and (i < imax):
+            flag = CVode(mem, tstop, y, ptret, CV_ONE_STEP_TSTOP)
+            stepped = True
+            if flag < 0:
+                break
+            pt[i] = ptret[0]
+            memcpy(pY + i * n, py, n * sizeof(double))
+            i += 1
+            if flag == CV_ROOT_RETURN:
+                break
+    return i, (flag if stepped else None)
+
+def set_rhs(size_t cvode_mem, size_t f, size_t f_data, size_t t0, size_t y0,
+    int itol, double reltol, size_t abstol):
+    """
+    Reinitialize CVODE with a compiled right-hand side and its *f_data*.
+
+    :param int cvode_mem: Address of the CVODE memory block.
+    :param int f: Address of a C function with the signature of CVRhsFn,
+        e.g. ``nogil_rhs`` of a model module from :mod:`cgp.physmod.cythonize`.
+    :param int f_data: Pointer passed as the last argument to *f*.
+    :param int t0: Address of the double for the initial time.
+    :param int y0: Address of the N_Vector for the initial state.
+    :param int itol, reltol, abstol: As for CVodeReInit(); *abstol* is the
+        address of a double (CV_SS) or an N_Vector (CV_SV).
+    :return int: Flag returned by CVodeSetFdata() or CVodeReInit().
+
+    Pass *f* = *f_data* = 0 to only reset *f_data* to NULL, e.g. before a
+    solver object is reinitialized with a Python right-hand side.
+    """
+    cdef void* mem = <void*>cvode_mem
+    cdef int flag = CVodeSetFdata(mem, <void*>f_data)
+    if (flag == CV_SUCCESS) and f:
+        flag = CVodeReInit(mem, <CVRhsFn>f, (<double*>t0)[0], <N_Vector>y0,
+            itol, reltol, <void*>abstol)
+    return flag
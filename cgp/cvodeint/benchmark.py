@@ -0,0 +1,318 @@
+"""
+Compare integrator backends on test problems.
+
+Each problem is a tuple *(f_ode, t, y, kwargs)* that can be passed to
+:class:`~cgp.cvodeint.core.Cvodeint` or
+:class:`~cgp.cvodeint.scipyint.Scipyint` as
+``backend(f_ode, t, y, **kwargs)``. :func:`compare_backends` times each
+backend on each problem, so that the faster one can be chosen per workload.
+
+>>> result = compare_backends(example_problems(), repeat=1)
+>>> result.dtype.names
+('problem', 'backend', 'seconds', 'nsteps', 'nfevals', 'error')
+>>> sorted(set(result.backend))
+['bdf', 'cvode', 'lsoda']
+
+:func:`work_precision` sweeps the tolerances and other options of
+:class:`~cgp.cvodeint.core.Cvodeint`, to choose settings for production runs
+from data. Besides :func:`example_problems`, there are classic stiff
+problems in :func:`stiff_problems` and the bundled CellML models in
+:func:`cellml_problems`.
+
+To include a realistic heart cell model (which is downloaded from the CellML
+repository on first use), and print work-precision tables for all problems,
+run this module as a script.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from functools import partial
+
+import numpy as np
+
+from .core import Cvodeint, CvodeException, Solverstats
+from .scipyint import Scipyint
+
+__all__ = ("example_problems", "stiff_problems", "cellml_problems", 
+    "bondarenko", "default_backends", "compare_backends", "work_precision", 
+    "work_precision_table", "warm_restart_steps")
+
+def example_problems():
+    """
+    Test problems from :mod:`~cgp.cvodeint.example_ode`.
+
+    :return OrderedDict: name -> *(f_ode, t, y, kwargs)*
+    """
+    from . import example_ode as e
+    return OrderedDict([
+        ("exp_growth", (e.exp_growth, [0, 2], [0.1], {})),
+        ("logistic_growth", (e.logistic_growth, [0, 10], [0.1], {})),
+        ("vdp", (e.vdp, [0, 20], [0, -2], {})),
+        ("markov_chain", (e.markov_chain, [0, 10], np.eye(1, 40)[0], {}))])
+
+def stiff_problems():
+    """
+    Classic stiff test problems from :mod:`~cgp.cvodeint.example_ode`.
+
+    Robertson's chemical kinetics, HIRES, and the van der Pol equation with 
+    damping parameter 1000.
+
+    :return OrderedDict: name -> *(f_ode, t, y, kwargs)*
+    """
+    from . import example_ode as e
+    return OrderedDict([
+        ("robertson", (e.robertson, [0, 40], [1.0, 0.0, 0.0], {})),
+        ("hires", (e.hires, [0, 321.8122], 
+            [1.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0057], {})),
+        ("stiff_vdp", (e.stiff_vdp, [0, 3000], [2.0, 0.0], {}))])
+
+def cellml_problems(names=None, t=(0, 100)):
+    """
+    Problems for the CellML models bundled with :mod:`cgp.physmod`.
+
+    :param list names: Model names, i.e. the ``.py.orig`` files in 
+        ``cgp/physmod/_cellml2py`` without extension; default: all of them.
+    :param t: Time interval, in the time unit of each model (often ms).
+    :return OrderedDict: name -> *(f_ode, t, y, kwargs)*, starting from 
+        the default initial state of each model.
+    """
+    import glob
+    from ..physmod import cellmlmodel
+    from ..physmod.cellmlmodel import Cellmlmodel
+    if names is None:
+        pattern = os.path.join(os.path.dirname(cellmlmodel.__file__), 
+            "_cellml2py", "*.py.orig")
+        names = sorted(os.path.basename(f)[:-len(".py.orig")] 
+            for f in glob.glob(pattern))
+    problems = OrderedDict()
+    for name in names:
+        model = Cellmlmodel("/" + name, t=t)
+        problems[name] = (model.f_ode, t, np.array(model.y), 
+            dict(f_data=model.f_data))
+    return problems
+
+def bondarenko(t=(0, 100)):
+    """
+    Problem *(f_ode, t, y, kwargs)* for a stimulated mouse ventricular myocyte.
+
+    Bondarenko et al. 2004, as in
+    :meth:`~cgp.physmod.cellmlmodel.Cellmlmodel.rates_and_algebraic`.
+    """
+    from ..physmod.cellmlmodel import Cellmlmodel
+    bond = Cellmlmodel("b0b1820b1376263e16c6086ca64d513e/"
+        "bondarenko_szigeti_bett_kim_rasmusson_2004_apical", t=t)
+    bond.yr.V = 100 # simulate stimulus
+    return bond.f_ode, t, np.array(bond.y), dict(f_data=bond.f_data)
+
+def default_backends():
+    """
+    Backends to compare: CVODE and scipy's LSODA and BDF.
+
+    :return OrderedDict: name -> callable of *(f_ode, t, y, **kwargs)*
+    """
+    return OrderedDict([("cvode", Cvodeint),
+        ("lsoda", partial(Scipyint, method="LSODA")),
+        ("bdf", partial(Scipyint, method="BDF"))])
+
+def compare_backends(problems=None, backends=None, reltol=1e-6, abstol=1e-8,
+    repeat=3):
+    """
+    Time integration of each problem with each backend.
+
+    :param dict problems: name -> *(f_ode, t, y, kwargs)*,
+        default :func:`example_problems`.
+    :param dict backends: name -> integrator class,
+        default :func:`default_backends`.
+    :param float reltol, abstol: Tolerances for all backends.
+    :param int repeat: Time the best of this many integrations.
+    :return: Record array with one row per problem and backend:
+
+        * **seconds**: wall-clock time for :meth:`integrate`, best of *repeat*
+        * **nsteps**, **nfevals**: internal steps and right-hand side
+          evaluations, see :class:`~cgp.cvodeint.core.Solverstats`
+        * **error**: maximum absolute difference between the final state and
+          that of the first backend run at tolerances one thousand times
+          tighter
+
+    Only :meth:`integrate` is timed, not the construction of the integrator.
+    """
+    if problems is None:
+        problems = example_problems()
+    if backends is None:
+        backends = default_backends()
+    rows = []
+    for problem, (f_ode, t, y, kwargs) in problems.items():
+        reference = backends.values()[0](f_ode, t, y, reltol=1e-3 * reltol,
+            abstol=1e-3 * abstol, maxsteps=np.inf, **kwargs)
+        yref = reference.integrate()[1][-1]
+        for backend, cls in backends.items():
+            integrator = cls(f_ode, t, y, reltol=reltol, abstol=abstol,
+                **kwargs)
+            best = np.inf
+            for _i in range(repeat):
+                start = time.time()
+                _t, Y, _flag = integrator.integrate(t=t, y=y)
+                best = min(best, time.time() - start)
+            stats = integrator.stats
+            rows.append((problem, backend, best, stats["nsteps"],
+                stats["nfevals"], abs(Y[-1] - yref).max()))
+    return np.rec.fromrecords(rows,
+        names="problem backend seconds nsteps nfevals error".split())
+
+def work_precision(problems=None, reltols=10.0 ** -np.arange(3, 9), 
+    abstol_ratio=1e-2, settings=None, nout=20, repeat=3):
+    """
+    Measure cost and accuracy of :class:`~cgp.cvodeint.core.Cvodeint` 
+    over a range of tolerances.
+
+    :param dict problems: name -> *(f_ode, t, y, kwargs)*,
+        default :func:`example_problems`.
+    :param array_like reltols: Relative tolerances to try.
+    :param float abstol_ratio: Absolute tolerance as a fraction of the 
+        relative one, *abstol = abstol_ratio * reltol*.
+    :param dict settings: name -> dict of further keyword arguments to 
+        :class:`~cgp.cvodeint.core.Cvodeint`, e.g. ``dict(method="bdf")`` 
+        or ``dict(chunksize=100)``, to compare at each tolerance. 
+        Default: ``{"default": {}}``.
+    :param int nout: Number of evenly spaced output times where the error 
+        is measured.
+    :param int repeat: Time the best of this many integrations.
+    :return: Record array with one row per problem, setting and tolerance:
+
+        * **seconds**: wall-clock time for :meth:`integrate`, best of *repeat*
+        * **nsteps**: internal time steps
+        * **nrhs**: right-hand side evaluations, including those for 
+          difference-quotient Jacobians
+        * **error**: maximum over output times and state variables of the 
+          absolute error, relative to the largest magnitude of that 
+          variable (plus *abstol*). The reference solution uses default 
+          settings and tolerances one thousand times tighter than the 
+          tightest in *reltols*.
+        * **method**: method used, see 
+          :attr:`~cgp.cvodeint.core.Cvodeint.method_used`
+
+    If an integration fails, e.g. because *maxsteps* is exceeded, its 
+    *seconds* and *error* are NaN, and the statistics are for the failed 
+    attempt.
+
+    >>> result = work_precision(example_problems(), reltols=[1e-4, 1e-6], 
+    ...     repeat=1)
+    >>> result.dtype.names[4:]
+    ('seconds', 'nsteps', 'nrhs', 'error', 'method')
+    >>> len(result)
+    8
+    """
+    if problems is None:
+        problems = example_problems()
+    if settings is None:
+        settings = OrderedDict([("default", {})])
+    rows = []
+    for problem, (f_ode, t, y, kwargs) in problems.items():
+        tout = np.linspace(t[0], t[-1], nout)
+        tight = 1e-3 * min(reltols)
+        reference = Cvodeint(f_ode, t, y, reltol=tight, 
+            abstol=abstol_ratio * tight, maxsteps=np.inf, **kwargs)
+        Yref = np.array(reference.integrate(t=tout)[1])
+        scale = abs(Yref).max(axis=0)
+        for setting, options in settings.items():
+            for reltol in reltols:
+                abstol = abstol_ratio * reltol
+                opts = dict(kwargs)
+                opts.update(options)
+                opts.update(reltol=reltol, abstol=abstol)
+                integrator = Cvodeint(f_ode, t, y, **opts)
+                best = np.inf
+                try:
+                    for _i in range(repeat):
+                        start = time.time()
+                        _t, Y, _flag = integrator.integrate(t=tout, y=y)
+                        best = min(best, time.time() - start)
+                    error = (abs(np.array(Y) - Yref) / (scale + abstol)).max()
+                except CvodeException:
+                    best = error = np.nan
+                stats = integrator.stats
+                rows.append((problem, setting, reltol, abstol, best, 
+                    stats["nsteps"], stats["nfevals"] + stats["nfevalsLS"], 
+                    error, integrator.method_used))
+    return np.rec.fromrecords(rows, names="problem setting reltol abstol "
+        "seconds nsteps nrhs error method".split())
+
+def work_precision_table(result):
+    """
+    Format :func:`work_precision` results as one table per problem and setting.
+
+    :return str: Plain text, with a header line for each table.
+    """
+    lines = []
+    for problem in OrderedDict.fromkeys(result.problem):
+        for setting in OrderedDict.fromkeys(result.setting):
+            rows = result[(result.problem == problem) & 
+                (result.setting == setting)]
+            if not len(rows):
+                continue
+            lines.append("%s (%s)" % (problem, setting))
+            lines.append("%8s %8s %10s %8s %8s %10s %6s" % ("reltol", 
+                "abstol", "seconds", "nsteps", "nrhs", "error", "method"))
+            for r in rows:
+                lines.append("%8.0e %8.0e %10.4f %8d %8d %10.2e %6s" % (
+                    r.reltol, r.abstol, r.seconds, r.nsteps, r.nrhs, r.error, 
+                    r.method))
+            lines.append("")
+    return "\n".join(lines)
+
+def warm_restart_steps(model=None, n=5):
+    """
+    Solver work per action potential, with and without warm restarts.
+
+    See *warm_restart* in :class:`~cgp.cvodeint.core.Cvodeint`.
+
+    :param model: Model with the :meth:`ap` method of 
+        :class:`~cgp.virtexp.elphys.paceable.Paceable`; default: the 
+        Bondarenko model, :class:`~cgp.virtexp.elphys.examples.Bond`.
+    :param int n: Number of consecutive action potentials.
+    :return: Record array with one row per action potential and setting of 
+        *warm_restart*: **warm**, **beat**, **nsteps**, **nfevals** 
+        (including those for difference-quotient Jacobians), **netfails**, 
+        **seconds**.
+
+    Both series start from the same state.
+    """
+    if model is None:
+        from ..virtexp.elphys.examples import Bond
+        model = Bond()
+    rows = []
+    old = model.warm_restart
+    try:
+        for warm in False, True:
+            model.warm_restart = warm
+            with model.autorestore():
+                for beat in range(n):
+                    before = Solverstats(**model.totals)
+                    model.ap()
+                    delta = model.totals - before
+                    rows.append((warm, beat, delta["nsteps"], 
+                        delta["nfevals"] + delta["nfevalsLS"], 
+                        delta["netfails"], delta["seconds"]))
+    finally:
+        model.warm_restart = old
+    return np.rec.fromrecords(rows, 
+        names="warm beat nsteps nfevals netfails seconds".split())
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE)
+    problems = example_problems()
+    problems["bondarenko"] = bondarenko()
+    for row in compare_backends(problems):
+        print "%-16s %-6s %10.4f %8d %8d %10.2e" % tuple(row)
+    problems.update(stiff_problems())
+    problems.update(cellml_problems())
+    print
+    print work_precision_table(work_precision(problems, 
+        settings=OrderedDict((m, dict(method=m)) 
+            for m in ("adams", "bdf", "auto"))))
+    steps = warm_restart_steps()
+    for warm in False, True:
+        print "Bondarenko, warm_restart=%s: %.1f steps per beat" % (warm, 
+            steps.nsteps[steps.warm == warm].mean())
@@ -0,0 +1,253 @@
+"""
+Pieces of :mod:`cgp.cvodeint` that do not need :mod:`pysundials`.
+
+Return flags, :exc:`CvodeException`, :class:`Solverstats` and the 
+:func:`cvodefun` decorator are shared by the CVODE wrapper 
+:class:`~cgp.cvodeint.core.Cvodeint` and by backends that do not use 
+CVODE, such as :class:`~cgp.cvodeint.scipyint.Scipyint`. They are 
+re-exported by :mod:`cgp.cvodeint.core`.
+
+.. data:: flags
+
+   CVODE return flags: dict of messages for each return value, as 
+   returned by :func:`pysundials.cvode.CVodeGetReturnFlagName`.
+"""
+
+import traceback
+from collections import OrderedDict
+import numpy as np
+
+__all__ = ("CvodeException", "flags", "flag_name", "cvodefun", "Solverstats")
+
+# Return flags of CVODE 2.3, see cvode.h. 
+# Values are taken from pysundials when it is installed.
+return_flags = OrderedDict([("CV_SUCCESS", 0), ("CV_TSTOP_RETURN", 1), 
+    ("CV_ROOT_RETURN", 2), ("CV_WARNING", 99), ("CV_TOO_MUCH_WORK", -1), 
+    ("CV_TOO_MUCH_ACC", -2), ("CV_ERR_FAILURE", -3), ("CV_CONV_FAILURE", -4), 
+    ("CV_LINIT_FAIL", -5), ("CV_LSETUP_FAIL", -6), ("CV_LSOLVE_FAIL", -7), 
+    ("CV_RHSFUNC_FAIL", -8), ("CV_FIRST_RHSFUNC_ERR", -9), 
+    ("CV_REPTD_RHSFUNC_ERR", -10), ("CV_UNREC_RHSFUNC_ERR", -11), 
+    ("CV_RTFUNC_FAIL", -12), ("CV_MEM_FAIL", -20), ("CV_MEM_NULL", -21), 
+    ("CV_ILL_INPUT", -22), ("CV_NO_MALLOC", -23), ("CV_BAD_K", -24), 
+    ("CV_BAD_T", -25), ("CV_BAD_DKY", -26), ("CV_TOO_CLOSE", -27)])
+
+try:
+    from pysundials import cvode
+    cv_ = dict([(k, v) for k, v in cvode.__dict__.iteritems() 
+                if k.startswith("CV_")])
+except ImportError:
+    cv_ = dict(return_flags)
+for k in return_flags:
+    return_flags[k] = cv_.get(k, return_flags[k])
+del k
+
+# CVODE return flags: dict of messages for each return value. 
+# See also flag_name()
+flags = dict([(v, [k1 for k1, v1 in cv_.iteritems() if v1==v]) 
+    for v in np.unique(cv_.values())]) # example: flag = -12; print flags[flag]
+del cv_
+
+# Return flags set by backends other than CVODE, e.g. Scipyint
+CV_SUCCESS = return_flags["CV_SUCCESS"]
+CV_TSTOP_RETURN = return_flags["CV_TSTOP_RETURN"]
+CV_ROOT_RETURN = return_flags["CV_ROOT_RETURN"]
+CV_ERR_FAILURE = return_flags["CV_ERR_FAILURE"]
+CV_RHSFUNC_FAIL = return_flags["CV_RHSFUNC_FAIL"]
+
+def flag_name(flag):
+    """
+    Name of a CVODE return flag, like 
+    :func:`pysundials.cvode.CVodeGetReturnFlagName`.
+    
+    >>> flag_name(CV_ROOT_RETURN), flag_name(12345)
+    ('CV_ROOT_RETURN', 'NONE')
+    """
+    for k, v in return_flags.items():
+        if v == flag:
+            return k
+    return "NONE"
+
+class CvodeException(StandardError):
+    """
+    :func:`pysundials.cvode.CVode` returned a flag not in 
+    ``[CV_SUCCESS, CV_TSTOP_RETURN, CV_ROOT_RETURN]``
+    
+    The CvodeException object has a *result* attribute for 
+    ``t, Y, flag`` = results so far.
+    If the right-hand side function is decorated with 
+    :func:`cvodefun` and raised an exception, the traceback is 
+    available as ``ode.exc``, where ``ode`` is the wrapped function.
+    """
+    def __init__(self, flag_or_msg=None, result=None):
+        if type(flag_or_msg) == int:
+            flag = flag_or_msg
+            message = "CVode returned %s" % (
+                "None" if flag is None else flag_name(flag))
+        elif type(flag_or_msg) == str:
+            message = flag_or_msg
+        else:
+            raise TypeError("Type int (flag) or str expected")
+        super(CvodeException, self).__init__(message)
+        self.result = result
+
+def cvodefun(fun):
+    """
+    Wrap ODE right-hand side function for use with CVODE in Pysundials.
+    
+    A `CVRhsFn 
+    <https://computation.llnl.gov/casc/sundials/documentation/cv_guide/node5.html#SECTION00561000000000000000>`_ 
+    (CVODE right-hand side function) is called for its side effect,
+    modifying the *ydot* output vector. It should return 0 on success,
+    a positive value if a recoverable error occurs,
+    and a negative value if it failed unrecoverably.
+    
+    This decorator allows you to code the CVRhsFn without explicitly assigning
+    the return value. It returns a callable object that returns -1 on exception
+    and 0 otherwise. In case of exception, the traceback text is stored as a
+    "traceback" attribute of the object.
+    
+    Below, :func:`ode` does not return anything. 
+    It raises an exception if y[0] == 0.
+    
+    >>> @cvodefun
+    ... def ode(t, y, ydot, f_data):
+    ...     ydot[0] = 1 / y[0]
+    >>> ydot = [None]
+    >>> ode(0, [1], ydot, None)
+    0
+    >>> ydot
+    [1]
+    >>> ode(0, [0], ydot, None)
+    -1
+    >>> print ode.traceback
+    Traceback (most recent call last):
+    ...
+    ZeroDivisionError: integer division or modulo by zero
+
+    The wrapped function is a proper CVRhsFn with a return value. 
+    In case of exception, the return value is set to -1, otherwise the return 
+    value is passed through.
+    
+    >>> @cvodefun
+    ... def ode(t, y, ydot, f_data):
+    ...     ydot[0] = 1 / y[0]
+    ...     return y[0]
+    
+    >>> ode
+    @cvodefun wrapper around <function ode at 0x...>
+    >>> ode(0, [2], ydot, None)
+    2
+    >>> ode(0, [-2], ydot, None)
+    -2
+    >>> ode(0, [0], ydot, None)
+    -1
+    >>> print ode.traceback
+    Traceback (most recent call last):
+    ...
+    ZeroDivisionError: integer division or modulo by zero
+    
+    Pysundials relies on the ODE right-hand side behaving like a function.
+    
+    >>> ode.__name__
+    'ode'
+    >>> ode.func_name
+    'ode'
+    """
+    class odefun(object):
+        """Wrapper for a CVODE right-hand side function"""
+        def __init__(self):
+            self.__name__ = fun.__name__ # used by pysundials/cvode.py
+            self.func_name = fun.__name__ # used by pysundials/cvode.py
+            self.traceback = ""
+        def __call__(self, *args, **kwargs):
+            """Return function value if defined, -1 if exception, 0 otherwise"""
+            self.traceback = ""
+            try:
+                result = fun(*args, **kwargs)
+                if result is None:
+                    return 0
+                else:
+                    return result
+            except StandardError: # allow KeyboardInterrupt, etc., to work
+                self.traceback = traceback.format_exc()
+                return -1
+        def __repr__(self):
+            return "@cvodefun wrapper around %s" % fun
+    return odefun()
+
+class Solverstats(OrderedDict):
+    """
+    :class:`OrderedDict` of CVODE integrator statistics.
+    
+    * **nsteps**: internal time steps
+    * **nfevals**: right-hand-side evaluations by the solver proper
+    * **nfevalsLS**: right-hand-side evaluations for difference-quotient 
+      Jacobians, see :meth:`~cgp.cvodeint.core.Cvodeint.jacobian_stats`
+    * **njevals**: Jacobian evaluations
+    * **nlinsetups**: setups (typically factorizations) of the linear solver
+    * **netfails**: local error test failures
+    * **nniters**: nonlinear (Newton) iterations
+    * **nncfails**: nonlinear convergence failures
+    * **hlast**, **hcur**: step size of the last step and the next one
+    * **tcur**: current internal time of the solver
+    * **rhs_seconds**: wall-clock time spent in the right-hand side, if 
+      timed (see the *time_rhs* argument to 
+      :class:`~cgp.cvodeint.core.Cvodeint`)
+    * **seconds**: wall-clock time of the integration
+    
+    Adding or subtracting two records sums or differences the counts and 
+    times, and keeps the step sizes and time of the latter or former, 
+    respectively. Like :class:`cgp.utils.arrayjob.Timing`, a record converts 
+    to a one-element record array, e.g. for appending to a table.
+    
+    >>> s = Solverstats(nsteps=10, hlast=0.1)
+    >>> s + Solverstats(nsteps=5, hlast=0.2)
+    Solverstats([('nsteps', 15), ('nfevals', 0), ..., ('hlast', 0.2), ...])
+    >>> np.array(s).dtype.names
+    ('nsteps', 'nfevals', 'nfevalsLS', 'njevals', 'nlinsetups', 'netfails', 
+     'nniters', 'nncfails', 'hlast', 'hcur', 'tcur', 'rhs_seconds', 'seconds')
+    """
+    
+    _counts = ("nsteps nfevals nfevalsLS njevals nlinsetups netfails "
+        "nniters nncfails".split())
+    _times = "rhs_seconds seconds".split()
+    _fields = _counts + "hlast hcur tcur".split() + _times
+    _default = OrderedDict((k, np.nan) for k in _fields)
+    for k in _counts:
+        _default[k] = 0
+    for k in _times:
+        _default[k] = 0.0
+    del k
+    
+    def __init__(self, **kwargs):
+        super(Solverstats, self).__init__()
+        for k, v in self._default.items():
+            self[k] = v
+        for k, v in kwargs.items():
+            self[k] = v
+    
+    def _combine(self, other, sign):
+        """Add (sign=1) or subtract (sign=-1) counts and times."""
+        result = Solverstats(**(other if sign > 0 else self))
+        for k in self._counts + self._times:
+            result[k] = self[k] + sign * other[k]
+        return result
+    
+    def __add__(self, other):
+        return self._combine(other, 1)
+    
+    def __sub__(self, other):
+        return self._combine(other, -1)
+    
+    def __array__(self):
+        """Convert to record array."""
+        from ..utils.rec2dict import dict2rec
+        return dict2rec(self)
+    
+    def item(self):
+        """Emulate .item() method of np.recarray."""
+        return np.array(self).item()
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE)
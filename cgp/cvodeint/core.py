@@ -23,7 +23,11 @@ Simple example:
 
 The module :mod:`.example_ode` defines some functions that are used in 
 doctests. A replacement for :func:`scipy.integrate.odeint` is in module 
-:mod:`.odeint`.
+:mod:`.odeint`. Class :class:`~.scipyint.Scipyint` in module :mod:`.scipyint` 
+offers the same :meth:`~Cvodeint.integrate` using :mod:`scipy.integrate` 
+solvers instead; :mod:`.benchmark` compares the two. Module :mod:`.parareal` 
+integrates in parallel over time slices, and :mod:`.sensitivities` computes 
+forward sensitivities to parameters.
 
 .. data:: flags
 
@@ -32,12 +36,18 @@ doctests. A replacement for :func:`scipy.integrate.odeint` is in module
 """
 
 import traceback
+import time
+from math import factorial
+from collections import namedtuple
 import ctypes  # required for communicating with cvode
 from pysundials import cvode
 import numpy as np
 import logging
 
-__all__ = "CvodeException", "Cvodeint", "flags", "cvodefun"
+from .common import CvodeException, Solverstats, cvodefun, flags
+
+__all__ = ("CvodeException", "Cvodeint", "flags", "cvodefun", "jacfun", 
+    "Solverstats", "Recordpolicy", "Event", "Crossing")
 
 # cdef inline double* bufarr(x):
 #     """Fast access to internal data of ndarray"""
@@ -52,39 +62,12 @@ fmtstr = "%(" + ")s\t%(".join(
     "asctime levelname name lineno process message".split()) + ")s"
 log.handlers[0].setFormatter(logging.Formatter(fmtstr))
 
-# CVODE return flags: dict of messages for each return value. 
-# See also cvode.CVodeGetReturnFlagName()
-cv_ = dict([(k, v) for k, v in cvode.__dict__.iteritems() 
-            if k.startswith("CV_")])
-flags = dict([(v, [k1 for k1, v1 in cv_.iteritems() if v1==v]) 
-    for v in np.unique(cv_.values())]) # example: flag = -12; print flags[flag]
-del cv_
-
 nv = cvode.NVector # CVODE vector data type
 
-
-class CvodeException(StandardError):
-    """
-    :func:`pysundials.cvode.CVode` returned a flag not in 
-    ``[CV_SUCCESS, CV_TSTOP_RETURN, CV_ROOT_RETURN]``
-    
-    The CvodeException object has a *result* attribute for 
-    ``t, Y, flag`` = results so far.
-    If the right-hand side function is decorated with 
-    :func:`cvodefun` and raised an exception, the traceback is 
-    available as ``ode.exc``, where ``ode`` is the wrapped function.
-    """
-    def __init__(self, flag_or_msg=None, result=None):
-        if type(flag_or_msg) == int:
-            flag = flag_or_msg
-            message = "CVode returned %s" % (
-                "None" if flag is None else cvode.CVodeGetReturnFlagName(flag))
-        elif type(flag_or_msg) == str:
-            message = flag_or_msg
-        else:
-            raise TypeError("Type int (flag) or str expected")
-        super(CvodeException, self).__init__(message)
-        self.result = result
+try:
+    from . import _steploop # optional compiled loop, see setup_steploop.py
+except ImportError:
+    _steploop = None
 
 def assert_assigns_all(fun, y, f_data=None):
     """
@@ -137,80 +120,69 @@ def assert_assigns_all(fun, y, f_data=None):
         err.i = i
         raise err
 
-def cvodefun(fun):
+def jacfun(jac, n, mupper=None, mlower=None):
     """
-    Wrap ODE right-hand side function for use with CVODE in Pysundials.
-    
-    A `CVRhsFn 
-    <https://computation.llnl.gov/casc/sundials/documentation/cv_guide/node5.html#SECTION00561000000000000000>`_ 
-    (CVODE right-hand side function) is called for its side effect,
-    modifying the *ydot* output vector. It should return 0 on success,
-    a positive value if a recoverable error occurs,
-    and a negative value if it failed unrecoverably.
-    
-    This decorator allows you to code the CVRhsFn without explicitly assigning
-    the return value. It returns a callable object that returns -1 on exception
-    and 0 otherwise. In case of exception, the traceback text is stored as a
-    "traceback" attribute of the object.
-    
-    Below, :func:`ode` does not return anything. 
-    It raises an exception if y[0] == 0.
-    
-    >>> @cvodefun
-    ... def ode(t, y, ydot, f_data):
-    ...     ydot[0] = 1 / y[0]
-    >>> ydot = [None]
-    >>> ode(0, [1], ydot, None)
-    0
-    >>> ydot
-    [1]
-    >>> ode(0, [0], ydot, None)
-    -1
-    >>> print ode.traceback
-    Traceback (most recent call last):
-    ...
-    ZeroDivisionError: integer division or modulo by zero
-
-    The wrapped function is a proper CVRhsFn with a return value. 
-    In case of exception, the return value is set to -1, otherwise the return 
-    value is passed through.
-    
-    >>> @cvodefun
-    ... def ode(t, y, ydot, f_data):
-    ...     ydot[0] = 1 / y[0]
-    ...     return y[0]
-    
-    >>> ode
-    @cvodefun wrapper around <function ode at 0x...>
-    >>> ode(0, [2], ydot, None)
-    2
-    >>> ode(0, [-2], ydot, None)
-    -2
-    >>> ode(0, [0], ydot, None)
-    -1
-    >>> print ode.traceback
-    Traceback (most recent call last):
-    ...
-    ZeroDivisionError: integer division or modulo by zero
-    
-    Pysundials relies on the ODE right-hand side behaving like a function.
-    
-    >>> ode.__name__
-    'ode'
-    >>> ode.func_name
-    'ode'
+    Wrap a Jacobian function for use as a CVODE dense or band Jacobian.
+
+    :param function jac: Function of *(t, y, fy, J, jac_data)*, which writes
+        the Jacobian ``df_i/dy_j`` of the ODE right-hand side into the
+        (n, n) :class:`numpy.ndarray` *J*. *J* is zeroed before each call,
+        so only nonzero elements need be assigned. Here *fy* is the current
+        value of the right-hand side.
+    :param int n: Number of state variables.
+    :param int mupper, mlower: Upper and lower bandwidth if the Jacobian is
+        for the `CVBand` linear solver, otherwise ``None``.
+    :return: A callable with the signature expected by
+        :func:`~pysundials.cvode.CVDenseSetJacFn` (or
+        :func:`~pysundials.cvode.CVBandSetJacFn` if *mupper* is given).
+        Exceptions are handled as for :func:`cvodefun`.
+
+    This avoids CVODE's default difference-quotient Jacobian, which costs
+    *n* extra evaluations of the right-hand side each time the Jacobian is
+    updated. With CVBand, elements outside the band are ignored.
+
+    CVODE stores each matrix column contiguously, so the whole Jacobian is
+    copied in one vectorized operation rather than element by element.
+
+    >>> from example_ode import vdp_jac
+    >>> jac = jacfun(vdp_jac, 2)
+    >>> jac
+    @jacfun wrapper around <function vdp_jac at 0x...>
+    >>> jac.__name__
+    'vdp_jac'
     """
-    class odefun(object):
-        """Wrapper for a CVODE right-hand side function"""
+    J = np.zeros((n, n))
+    if mupper is not None:
+        i, j = np.indices((n, n))
+        inband = (i - j <= mlower) & (j - i <= mupper)
+        iband, jband = i[inband], j[inband]
+
+    class jacobian(object):
+        """Wrapper for a CVODE dense or band Jacobian function"""
         def __init__(self):
-            self.__name__ = fun.__name__ # used by pysundials/cvode.py
-            self.func_name = fun.__name__ # used by pysundials/cvode.py
+            self.__name__ = jac.__name__ # used by pysundials/cvode.py
+            self.func_name = jac.__name__ # used by pysundials/cvode.py
             self.traceback = ""
-        def __call__(self, *args, **kwargs):
+        def __call__(self, *args):
             """Return function value if defined, -1 if exception, 0 otherwise"""
             self.traceback = ""
             try:
-                result = fun(*args, **kwargs)
+                if mupper is None:
+                    _N, Jmat, t, y, fy, jac_data = args[:6]
+                else:
+                    _N, _mu, ml, Jmat, t, y, fy, jac_data = args[:8]
+                J.fill(0.0)
+                result = jac(t, y, fy, J, jac_data)
+                # Column j of CVODE's matrix starts at Jmat.data.contents.data[j]
+                col0 = Jmat.data.contents.data[0]
+                if mupper is None:
+                    colmajor = np.ctypeslib.as_array(col0, shape=(n, n))
+                    colmajor[:] = J.T
+                else:
+                    smu = Jmat.smu
+                    colmajor = np.ctypeslib.as_array(col0,
+                        shape=(n, smu + ml + 1))
+                    colmajor[jband, iband - jband + smu] = J[iband, jband]
                 if result is None:
                     return 0
                 else:
@@ -219,8 +191,253 @@ def cvodefun(fun):
                 self.traceback = traceback.format_exc()
                 return -1
         def __repr__(self):
-            return "@cvodefun wrapper around %s" % fun
-    return odefun()
+            return "@jacfun wrapper around %s" % jac
+    return jacobian()
+
+class Stepbuffer(object):
+    """
+    Growable output arrays for time and state, reused between integrations.
+    
+    :param int n: Number of state variables.
+    :param int size: Initial number of rows.
+    :param tuple out: Optional preallocated arrays *(t, Y)* of shape (m,) and 
+        (m, n) to use as storage instead of allocating new ones. They must 
+        have at least two rows: the initial state and one step.
+    
+    :meth:`Cvodeint.integrate` keeps one of these per solver object, so that 
+    repeated calls, e.g. pacing a cell model beat by beat, do not allocate and 
+    resize work arrays each time. Capacity is doubled whenever it runs out, 
+    so growing to *m* rows costs O(m) copying in total.
+    
+    >>> buf = Stepbuffer(n=2, size=3)
+    >>> buf.Y[:3, 0] = 1, 2, 3
+    >>> buf.grow(3)
+    3
+    >>> buf.Y.shape
+    (6, 2)
+    >>> buf.Y[:3, 0]
+    array([ 1.,  2.,  3.])
+    
+    :meth:`result` returns exact-size copies, which stay valid when the buffer 
+    is reused, or views if the arrays were supplied by the caller.
+    
+    >>> t, Y = np.zeros(4), np.zeros((4, 1))
+    >>> buf = Stepbuffer(1, out=(t, Y))
+    >>> buf.result(2)[1].base is Y
+    True
+    >>> Stepbuffer(1, out=(t[:1], Y[:1]))
+    Traceback (most recent call last):
+    ValueError: out must have at least 2 rows, got 1
+    """
+    offset = 0 # number of rows moved out of the arrays, see Spillbuffer
+    
+    def __init__(self, n, size=2000, out=None):
+        if out is None:
+            self.t = np.empty(shape=(size,))
+            self.Y = np.empty(shape=(size, n))
+        else:
+            self.t, self.Y = out
+            if (self.Y.ndim != 2) or (self.Y.shape[1] != n) or (
+                len(self.t) != len(self.Y)):
+                raise ValueError("out must be arrays of shape (m,) and "
+                    "(m, %s), got %s and %s" % (n, self.t.shape, self.Y.shape))
+            if len(self.t) < 2:
+                raise ValueError("out must have at least 2 rows, got %s" % 
+                    len(self.t))
+        self.out = out
+    
+    def __len__(self):
+        return len(self.t)
+    
+    def grow(self, i):
+        """
+        Double the capacity, keeping the first *i* rows.
+        
+        Returns the index of the next row to write, here *i*.
+        """
+        d1 = 2 * len(self.t)
+        log.warning("Enlarging arrays from %s to %s" % (i, d1))
+        t = np.empty(shape=(d1,))
+        Y = np.empty(shape=(d1, self.Y.shape[1]))
+        t[:i] = self.t[:i]
+        Y[:i] = self.Y[:i]
+        self.t, self.Y = t, Y
+        self.out = None # no longer the caller's arrays
+        return i
+    
+    def result(self, i):
+        """Return the first *i* rows of time and state."""
+        if self.out is None:
+            return self.t[:i].copy(), self.Y[:i].copy()
+        else:
+            return self.t[:i], self.Y[:i]
+
+class Spillbuffer(Stepbuffer):
+    """
+    Output arrays of fixed size, spilled to ``.npy`` files when full.
+    
+    :param int n: Number of state variables.
+    :param tuple filenames: Files *(tfile, Yfile)* for time and state.
+    :param int size: Number of rows kept in memory.
+    
+    Each time the arrays fill up, all rows but the last are appended to the 
+    files, and the last row is moved to the front, where the step loop 
+    expects the previous step. :meth:`result` writes the remaining rows and 
+    returns read-only memmaps of the files, so memory use is bounded by 
+    *size* however long the trajectory.
+    
+    >>> import tempfile, os, shutil
+    >>> dtemp = tempfile.mkdtemp()
+    >>> filenames = [os.path.join(dtemp, s) for s in ("t.npy", "Y.npy")]
+    >>> buf = Spillbuffer(1, filenames, size=3)
+    >>> buf.t[:3], buf.Y[:3, 0] = [0, 1, 2], [0, 10, 20]
+    >>> buf.grow(3), buf.offset
+    (1, 2)
+    >>> buf.t[1], buf.Y[1] = 3, 30
+    >>> t, Y = buf.result(2)
+    >>> t
+    memmap([ 0.,  1.,  2.,  3.])
+    >>> np.load(filenames[1]).squeeze()
+    array([  0.,  10.,  20.,  30.])
+    >>> del t, Y
+    >>> shutil.rmtree(dtemp)
+    """
+    def __init__(self, n, filenames, size=2000):
+        # deferred import so cvodeint can be used without load_memmap_offset
+        from ..utils.load_memmap_offset import create_appendable
+        super(Spillbuffer, self).__init__(n, size)
+        self.filenames = tuple(filenames)
+        if len(self.filenames) != 2:
+            raise ValueError("spill must be filenames (tfile, Yfile), got %s" 
+                % (filenames,))
+        tfile, Yfile = self.filenames
+        self.fp = create_appendable(tfile, float), create_appendable(Yfile, 
+            float, shape=(n,))
+    
+    def _spill(self, i):
+        """Append the first *i* rows to the files."""
+        tfp, Yfp = self.fp
+        self.t[:i].tofile(tfp)
+        self.Y[:i].tofile(Yfp)
+        self.offset += i
+    
+    def grow(self, i):
+        """
+        Spill all but row *i - 1*, which is moved to the front.
+        
+        Returns the index of the next row to write, i.e. 1.
+        """
+        self._spill(i - 1)
+        self.t[0], self.Y[0] = self.t[i - 1], self.Y[i - 1]
+        return 1
+    
+    def result(self, i):
+        """Spill the first *i* rows and return memmaps of the whole files."""
+        from ..utils.load_memmap_offset import update_shape, open_memmap
+        self._spill(i)
+        for fp in self.fp:
+            update_shape(fp)
+            fp.close()
+        return tuple(open_memmap(f, mode="r") for f in self.filenames)
+
+def rhstimer(fun):
+    """
+    Wrap a CVODE right-hand side to accumulate time spent inside it.
+    
+    The wrapper has attributes *seconds* and *ncalls*, and passes through 
+    *traceback* if *fun* is decorated with :func:`cvodefun`.
+    
+    >>> from example_ode import exp_growth
+    >>> f = rhstimer(cvodefun(exp_growth))
+    >>> ydot = [0.0]
+    >>> f(0, [1.0], ydot, None), ydot, f.ncalls
+    (0, [1.0], 1)
+    >>> f.__name__
+    'exp_growth'
+    """
+    class timed(object):
+        """Wrapper for a CVODE right-hand side function"""
+        def __init__(self):
+            self.__name__ = fun.__name__ # used by pysundials/cvode.py
+            self.func_name = fun.__name__ # used by pysundials/cvode.py
+            self.seconds = 0.0
+            self.ncalls = 0
+        @property
+        def traceback(self):
+            """Traceback of the last exception in the wrapped function."""
+            return getattr(fun, "traceback", "")
+        def __call__(self, *args):
+            start = time.time()
+            try:
+                return fun(*args)
+            finally:
+                self.seconds += time.time() - start
+                self.ncalls += 1
+        def __repr__(self):
+            return "@rhstimer wrapper around %s" % fun
+    return timed()
+
+class Recordpolicy(namedtuple("Recordpolicy", "every dt dy")):
+    """
+    Which adaptive time steps :meth:`Cvodeint.integrate` should record.
+    
+    :param int every: Record at most every *every*-th internal step.
+    :param float dt: Minimum time between recorded steps.
+    :param float dy: Record a step only if some state variable has changed 
+        by at least *dy* since the last recorded step. Default: no limit.
+    
+    A step is recorded if it satisfies all the criteria. The first and last 
+    time points, and roots, are always recorded. Unrecorded steps are never 
+    copied out of the solver.
+    
+    >>> Recordpolicy(dt=0.5)
+    Recordpolicy(every=1, dt=0.5, dy=None)
+    """
+    __slots__ = ()
+    
+    def __new__(cls, every=1, dt=0.0, dy=None):
+        return super(Recordpolicy, cls).__new__(cls, every, dt, dy)
+
+class Event(namedtuple("Event", "name g g_data direction terminal")):
+    """
+    Named event for :meth:`Cvodeint.integrate`, located by CVODE rootfinding.
+    
+    :param str name: Name used in the recorded :class:`Crossing`.
+    :param function g: Function of *(t, y, gout, g_data)* that writes the 
+        event function to ``gout[0]``, like rootfinding functions for 
+        :meth:`Cvodeint.RootInit` with ``nrtfn=1``, e.g. :meth:`~Cvodeint.ydoti`.
+    :param g_data: Data passed to *g*.
+    :param int direction: Record only crossings where *g* is rising (1) or 
+        falling (-1); default 0 for both.
+    :param terminal: True to stop the integration at a recorded crossing, 
+        or a function of the integrator object, called at the crossing, 
+        that returns True to stop. Default: record the crossing and continue.
+    
+    >>> Event("top", g=None, direction=-1)
+    Event(name='top', g=None, g_data=None, direction=-1, terminal=False)
+    """
+    __slots__ = ()
+    
+    def __new__(cls, name, g, g_data=None, direction=0, terminal=False):
+        return super(Event, cls).__new__(cls, name, g, g_data, direction, 
+            terminal)
+
+# Event crossing recorded by Cvodeint.integrate(events=...): time, state, 
+# name of the Event and direction (1 if rising, -1 if falling).
+Crossing = namedtuple("Crossing", "t y name direction")
+
+def order1_step(h, q):
+    """
+    Scale a step size accepted at order *q* for a restart at order 1.
+    
+    CVodeReInit() always restarts at order 1, whose local error grows faster 
+    with the step size. Halving the step for each order above 1 is a 
+    heuristic that avoids most error test failures on the first steps.
+    
+    >>> order1_step(0.8, 3)
+    0.2
+    """
+    return abs(h) * 0.5 ** (max(int(q), 1) - 1)
 
 def new_with_kwargs(cls, args, kwargs):
     """
@@ -228,7 +445,38 @@ def new_with_kwargs(cls, args, kwargs):
     
     http://stackoverflow.com/questions/5238252/unpickling-new-style-with-kwargs-not-possible
     """
-    return cls.__new__(cls, *args, **kwargs)
+    instance = cls.__new__(cls, *args, **kwargs)
+    instance.__init__(*args, **kwargs)
+    return instance
+
+# Instances created by unpickling with warm_unpickle set, keyed by a digest of 
+# class and constructor arguments, see Cvodeint.__reduce__
+warm_instances = {}
+
+def warm_with_kwargs(cls, args, kwargs, key):
+    """
+    Like :func:`new_with_kwargs`, but reuse an instance unpickled earlier.
+    
+    The first instance of each class and constructor arguments is kept in 
+    :data:`warm_instances`; later calls return it instead of constructing 
+    again. The pickled state is then applied by :meth:`Cvodeint.__setstate__`.
+    """
+    instance = warm_instances.get(key)
+    if instance is None:
+        instance = new_with_kwargs(cls, args, kwargs)
+        instance.warm_unpickle = True
+        warm_instances[key] = instance
+    return instance
+
+# Released CVODE solver objects, keyed by (n, linsolver_choice, method), 
+# see Cvodeint.release()
+mempool = {}
+mempool_size = 4 # maximum number of free solver objects per key
+
+# Linear multistep method and nonlinear iteration for each *method* option 
+# of Cvodeint, see Cvodeint._create_solver()
+methods = dict(bdf=(cvode.CV_BDF, cvode.CV_NEWTON), 
+    adams=(cvode.CV_ADAMS, cvode.CV_FUNCTIONAL))
 
 class Cvodeint(object):
     """
@@ -247,16 +495,69 @@ class Cvodeint(object):
     :param reltol, abstol, nrtfn, g_rtfn, f_data, g_data: Arguments passed 
         to CVODE (`details 
         <https://computation.llnl.gov/casc/sundials/documentation/cv_guide/cv_guide.html>`_)
-    :param int chunksize: When returning adaptive time steps, result 
-        vectors are allocated in chunks of *chunksize*. 
+    :param int chunksize: Initial number of rows of the work arrays for 
+        adaptive time steps, see :class:`Stepbuffer`. 
     :param int maxsteps: If the number of  time-steps exceeds *maxsteps*, 
         an exception is raised.
     :param int mupper, mlower: Upper and lower bandwidth for the 
         `CVBand 
         <https://computation.llnl.gov/casc/sundials/documentation/cv_guide/node5.html#SECTION00566000000000000000>`_
-        approximation to the Jacobian. CVDense is used by default if 
+        approximation to the Jacobian. CVDense is used by default if
         *mupper* and *mlower* are both ``None``.
+    :param function jac: Optional analytic Jacobian of *(t, y, fy, J,
+        jac_data)*, see :func:`jacfun`. By default, CVODE approximates the
+        Jacobian by difference quotients, at the cost of *n* extra
+        right-hand-side evaluations per Jacobian update.
+        :meth:`jacobian_stats` reports the counts.
+    :param str linsolver: CVODE linear solver: ``"dense"``, ``"band"``,
+        ``"spgmr"`` (Krylov with band preconditioner) or ``"auto"``.
+        Missing bandwidths, and the choice under ``"auto"``, are determined
+        by probing the Jacobian sparsity pattern, see
+        :mod:`~cgp.cvodeint.sparsity`. The default is ``"dense"``, or
+        ``"band"`` if *mupper* is given. The solver actually used is in
+        attribute *linsolver_choice*.
+    :param bool time_rhs: Measure wall-clock time spent in the right-hand 
+        side, see :func:`rhstimer`. This costs two calls to 
+        :func:`time.time` per evaluation.
+    :param bool validate: Check that *f_ode* assigns all rates and follows 
+        CVODE's return convention. This evaluates it a few times; 
+        :meth:`clone` skips it for functions already validated.
+    :param str method: Linear multistep method:
+        
+        * **"bdf"**: Backward differentiation formulas with Newton iteration, 
+          for stiff problems (the default).
+        * **"adams"**: Adams-Moulton formulas with functional iteration, 
+          which needs no Jacobian or linear solver. Cheaper for non-stiff 
+          problems.
+        * **"auto"**: Start with Adams and let :meth:`integrate` switch 
+          between the two, see :meth:`_auto_method`.
+    :param backend: ``"cvode"`` (the default), or the name of a solver class 
+        in :mod:`scipy.integrate` (e.g. ``"LSODA"``) to :meth:`integrate` 
+        with :class:`~cgp.cvodeint.scipyint.Scipyint` instead, see 
+        :meth:`_integrate_backend`. Model classes such as 
+        :class:`~cgp.physmod.cellmlmodel.Cellmlmodel` pass it on.
     
+    Integrator statistics for the last call to :meth:`integrate`, 
+    :meth:`iterate` or :meth:`ensemble` are in attribute *stats*, and 
+    cumulative totals for the object in *totals*, both :class:`Solverstats`. 
+    The method used for the last integration is in attribute *method_used*, 
+    and *method_totals* is a dict of totals for each method.
+    
+    If the optional extension module :mod:`cgp.cvodeint._steploop` has been 
+    built, adaptive steps are taken by a compiled loop, see 
+    :meth:`_integrate_compiled`. Set attribute *compiled_loop* to False 
+    to use the Python loop anyway.
+    
+    Each :meth:`integrate` with new time or state reinitializes CVODE, 
+    which then starts with a small step. Set attribute *warm_restart* to 
+    True to start from the last step size instead, e.g. when pacing a cell 
+    model beat by beat; see :meth:`_warm_step`.
+    
+    With the compiled loop, a subclass may also register a compiled 
+    right-hand side that CVODE calls directly, see :meth:`_set_c_rhs`. 
+    Integration then runs without the GIL, so that threads can integrate 
+    separate instances in parallel.
+
     **Usage example:**
     
     .. plot::
@@ -379,33 +680,49 @@ class Cvodeint(object):
     """  # pylint: disable=W0105
     def __init__(self, f_ode, t, y, reltol=1e-8, abstol=1e-8, nrtfn=None, 
         g_rtfn=None, f_data=None, g_data=None, chunksize=2000, maxsteps=1e4, 
-        mupper=None, mlower=None):
+        mupper=None, mlower=None, jac=None, linsolver=None, time_rhs=False, 
+        validate=True, method="bdf", backend="cvode"):
+        if method not in ("bdf", "adams", "auto"):
+            raise ValueError("method must be 'bdf', 'adams' or 'auto', "
+                "not %r" % method)
         # Ensure that t and y can be indexed
         t = np.array(t, dtype=float, ndmin=1)
         try:
             y = np.array(y, dtype=float, ndmin=1)
         except ValueError:
             raise ValueError("State vector y not interpretable as float: %s" % y)
-        # Ensure that f_ode assigns a value to all elements of the rate vector
-        assert_assigns_all(f_ode, y, f_data)
-        # Ensure that the function returns 0 on success and <0 on exception. 
-        # (CVODE's convention is 
-        # 0 = OK, >0 = recoverable error, <0 = unrecoverable error.)
-        # If not, decorate as if with @cvodefun.
         self.f_ode = f_ode # store this for use in __repr__ etc.
-        success_value = f_ode(t[0], nv(y), nv(y), f_data) # probably 0 or None
-        try:
-            error_value = f_ode(None, None, None, None) # <0 or raise exception
-        except StandardError:
-            error_value = None
-            try:
-                f_ode.traceback = ""
-            except AttributeError:
-                pass
-        if (success_value == 0) and (error_value < 0):
-            self.my_f_ode = f_ode
+        if not validate:
+            # Trusted to be like a function that passed validation before,
+            # see clone(). Decorate unless already decorated.
+            if hasattr(f_ode, "traceback"):
+                self.my_f_ode = f_ode
+            else:
+                self.my_f_ode = cvodefun(f_ode)
         else:
-            self.my_f_ode = cvodefun(f_ode)
+            # Ensure that f_ode assigns a value to all elements of the rate 
+            # vector
+            assert_assigns_all(f_ode, y, f_data)
+            # Ensure that the function returns 0 on success and <0 on 
+            # exception. (CVODE's convention is 
+            # 0 = OK, >0 = recoverable error, <0 = unrecoverable error.)
+            # If not, decorate as if with @cvodefun.
+            success_value = f_ode(t[0], nv(y), nv(y), f_data) # 0 or None
+            try:
+                error_value = f_ode(None, None, None, None) # <0 or exception
+            except StandardError:
+                error_value = None
+                try:
+                    f_ode.traceback = ""
+                except AttributeError:
+                    pass
+            if (success_value == 0) and (error_value < 0):
+                self.my_f_ode = f_ode
+            else:
+                self.my_f_ode = cvodefun(f_ode)
+        self.time_rhs = time_rhs
+        if time_rhs:
+            self.my_f_ode = rhstimer(self.my_f_ode)
         # Variables y, tret, abstol are written by CVode functions, and their 
         # pointers must remain constant. They are assigned here; later 
         # assignments will copy values into the existing variables, like so:
@@ -428,34 +745,372 @@ class Cvodeint(object):
         self.f_data = f_data # user data for right-hand-side of ODE
         self.g_data = g_data # user data for rootfinding function
         self.chunksize = chunksize
+        self.stepbuffer = None # allocated on first use
         self.maxsteps = maxsteps
+        self.compiled_loop = _steploop is not None
         self.last_flag = None
-        # CVODE solver object
-        self.cvode_mem = cvode.CVodeCreate(cvode.CV_BDF, cvode.CV_NEWTON)
-        cvode.CVodeMalloc(self.cvode_mem, self.my_f_ode, self.t0, self.y, 
-            self.itol, self.reltol, self.abstol) # allocate & initialize memory
-        if f_data is not None:
+        self.warm_unpickle = False # see __reduce__
+        self.init_step = None # step size for next ReInit, see restore()
+        self.warm_restart = False # see _ReInit_if_required
+        self.stats = Solverstats() # statistics for last integration
+        self.totals = Solverstats() # cumulative statistics
+        self.method = method
+        self.method_used = "adams" if method == "auto" else method
+        self.method_totals = dict(bdf=Solverstats(), adams=Solverstats())
+        self.next_method = None # switch on next integrate(), see _auto_method
+        self.max_fail_ratio = 0.2 # see _auto_method
+        self.max_stiffness = 1.0 # see _auto_method
+        self._rootinit = None, None, None # latest arguments to RootInit
+        self.events = None # list of Event, see set_events
+        self.crossings = [] # list of Crossing in the last integrate()
+        self.c_rhs = None # (address, f_data) of compiled RHS, see _set_c_rhs
+        self.backend = backend
+        self.scipyint = None # backend solver, see _integrate_backend
+        # Specify how the Jacobian should be approximated
+        self.linsolver = linsolver
+        self.linsolver_choice = self._choose_linsolver(linsolver, 
+            mupper, mlower, jac)
+        name, self.mupper, self.mlower = self.linsolver_choice
+        self.jac = jac # store this for use in __repr__ etc.
+        if jac is None:
+            self.my_jac = None
+        else:
+            self.my_jac = jacfun(jac, self.n, self.mupper, self.mlower)
+        self._create_solver(nrtfn, g_rtfn, g_data)
+    
+    def _create_solver(self, nrtfn=None, g_rtfn=None, g_data=None):
+        """
+        Set up a CVODE solver object for *method_used* as attribute *cvode_mem*.
+        
+        A solver object of the right kind is reused if one was 
+        :meth:`released <release>`, otherwise one is allocated. The 
+        linear solver and Jacobian are only set up for the BDF method, since 
+        Adams uses functional iteration.
+        """
+        name = self.linsolver_choice.name
+        free = mempool.get(self._pool_key())
+        if free:
+            self.cvode_mem, self.bp_data = free.pop()
+            cvode.CVodeSetInitStep(self.cvode_mem, 0.0) # let CVODE estimate
+            cvode.CVodeReInit(self.cvode_mem, self.my_f_ode, self.t0, self.y, 
+                self.itol, self.reltol, self.abstol)
+            if nrtfn is None:
+                nrtfn = 0 # disable rootfinding set by the previous owner
+        else:
+            self.cvode_mem = cvode.CVodeCreate(*methods[self.method_used])
+            cvode.CVodeMalloc(self.cvode_mem, self.my_f_ode, self.t0, self.y, 
+                self.itol, self.reltol, self.abstol) # allocate & init memory
+            self.bp_data = None
+            if self.method_used == "adams":
+                pass
+            elif name == "dense":
+                cvode.CVDense(self.cvode_mem, self.n)
+            elif name == "band":
+                cvode.CVBand(self.cvode_mem, self.n, self.mupper, self.mlower)
+            else:
+                self.bp_data = cvode.CVBandPrecAlloc(self.cvode_mem, self.n, 
+                    self.mupper, self.mlower)
+                cvode.CVBPSpgmr(self.cvode_mem, cvode.PREC_LEFT, 0, 
+                    self.bp_data)
+        if self.f_data is not None:
             cvode.CVodeSetFdata(self.cvode_mem, 
                 np.ctypeslib.as_ctypes(self.f_data))
         cvode.CVodeSetStopTime(self.cvode_mem, self.tstop) # set stop time
-        # Specify how the Jacobian should be approximated
-        if mupper is None:
-            cvode.CVDense(self.cvode_mem, self.n)
-        else:
-            cvode.CVBand(self.cvode_mem, self.n, mupper, mlower)        
+        self._reinit_rhs()
+        if (self.my_jac is not None) and (self.method_used == "bdf"):
+            if name == "dense":
+                cvode.CVDenseSetJacFn(self.cvode_mem, self.my_jac, None)
+            else:
+                cvode.CVBandSetJacFn(self.cvode_mem, self.my_jac, None)
         self.RootInit(nrtfn, g_rtfn, g_data)
     
+    def _pool_key(self):
+        """Key for this kind of solver object in :data:`mempool`."""
+        if self.method_used == "adams":
+            return self.n, None, "adams"
+        return self.n, self.linsolver_choice, self.method_used
+    
+    def _choose_linsolver(self, linsolver, mupper, mlower, jac):
+        """
+        Resolve the *linsolver* argument to a :class:`~.sparsity.Linsolver`.
+        
+        The Jacobian sparsity pattern is probed only if needed, and stored as 
+        attribute *pattern*.
+        
+        >>> from example_ode import markov_chain
+        >>> cvodeint = Cvodeint(markov_chain, t=[0, 1], y=np.ones(12), 
+        ...     linsolver="auto")
+        >>> cvodeint.linsolver_choice
+        Linsolver(name='band', mupper=1, mlower=1)
+        """
+        from .sparsity import (Linsolver, jacobian_pattern, bandwidth, 
+            choose_linsolver, coverage_bandwidth, reverse_cuthill_mckee)
+        if linsolver is None:
+            linsolver = "dense" if mupper is None else "band"
+        if linsolver not in ("auto", "dense", "band", "spgmr"):
+            raise ValueError("Unknown linear solver: %s" % linsolver)
+        if (linsolver == "spgmr") and (jac is not None):
+            raise CvodeException(
+                "The Krylov solver cannot use an analytic Jacobian.")
+        if linsolver == "dense":
+            return Linsolver("dense", None, None)
+        if (linsolver != "auto") and (mupper is not None):
+            return Linsolver(linsolver, mupper, mlower)
+        self.pattern = jacobian_pattern(self.f_ode, np.array(self.y), 
+            self.t[0], self.f_data)
+        if linsolver == "band":
+            return Linsolver("band", *bandwidth(self.pattern))
+        if linsolver == "spgmr":
+            width = coverage_bandwidth(self.pattern)
+            return Linsolver("spgmr", width, width)
+        choice = choose_linsolver(self.pattern, krylov=(jac is None))
+        if choice.name != "band":
+            mupper, mlower = bandwidth(self.pattern, 
+                reverse_cuthill_mckee(self.pattern))
+            if mupper + mlower + 1 <= self.n // 4:
+                log.info("Reordering state variables would reduce the "
+                    "Jacobian bandwidth to (%s, %s); see "
+                    "cgp.cvodeint.sparsity.permuted_ode" % (mupper, mlower))
+        return choice
+    
     def __new__(cls, *args, **kwargs):
         """Used for pickling."""
         instance = super(Cvodeint, cls).__new__(cls)
-        instance.__init__(*args, **kwargs)
         instance._init_args = args, kwargs
         return instance
     
     def __reduce__(self):
-        """Used for pickling."""
+        """
+        Used for pickling.
+        
+        The object is reconstructed from its constructor arguments, then 
+        the current time, state and tolerances are restored, see 
+        :meth:`__getstate__`.
+        
+        If attribute *warm_unpickle* is True, constructing is done only once 
+        per process for each class and set of constructor arguments. Later 
+        unpickling returns the same, warm instance with the new state 
+        applied, see :func:`warm_with_kwargs`. This makes it cheap to send 
+        models to worker processes task after task, but is only correct if 
+        each worker uses one model instance at a time.
+        
+        >>> import pickle
+        >>> from example_ode import logistic_growth
+        >>> cvodeint = Cvodeint(logistic_growth, t=[0, 2], y=[0.1])
+        >>> t, y, flag = cvodeint.integrate(t=1)
+        >>> cvodeint.warm_unpickle = True
+        >>> a = pickle.loads(pickle.dumps(cvodeint))
+        >>> a.tret.value, a.y == cvodeint.y
+        (1.0, True)
+        >>> b = pickle.loads(pickle.dumps(cvodeint))
+        >>> b is a
+        True
+        """
         args, kwargs = self._init_args
-        return new_with_kwargs, (self.__class__, args, kwargs), None
+        if self.warm_unpickle:
+            import hashlib
+            import cPickle
+            key = hashlib.sha1(cPickle.dumps((self.__class__, args, kwargs), 
+                cPickle.HIGHEST_PROTOCOL)).hexdigest()
+            return (warm_with_kwargs, (self.__class__, args, kwargs, key), 
+                self.__getstate__())
+        return (new_with_kwargs, (self.__class__, args, kwargs), 
+            self.__getstate__())
+    
+    def __getstate__(self):
+        """
+        Compact state for pickling: time, state vector and tolerances.
+        
+        Everything else is reconstructed from the constructor arguments.
+        """
+        return dict(t=np.copy(self.t), tret=self.tret.value, 
+            y=np.array(self.y), reltol=self.reltol, 
+            abstol=np.array(self.abstol.value 
+                if isinstance(self.abstol, cvode.realtype) else self.abstol))
+    
+    def __setstate__(self, state):
+        """Restore state from :meth:`__getstate__` and reinitialize CVODE."""
+        self.t = state["t"]
+        self.tstop = self.t[-1]
+        self.y[:] = state["y"]
+        self.reltol = state["reltol"]
+        if isinstance(self.abstol, cvode.realtype):
+            self.abstol.value = float(state["abstol"])
+        else:
+            self.abstol[:] = state["abstol"]
+        self.t0.value = self.tret.value = state["tret"]
+        cvode.CVodeSetStopTime(self.cvode_mem, self.tstop)
+        cvode.CVodeReInit(self.cvode_mem, self.my_f_ode, self.t0, self.y, 
+            self.itol, self.reltol, self.abstol)
+        self._reinit_rhs()
+    
+    def checkpoint(self, path):
+        """
+        Save the current time, state and step history to a ``.npz`` file.
+        
+        :param str path: File name, passed to :func:`numpy.savez`.
+        
+        The file holds the output times *t*, current time *tret* and state 
+        *y*, the tolerances, the step size and order of the last step 
+        (*hlast*, *qlast*) and the next one (*hcur*, *qcur*), the derivatives 
+        *dky* of the interpolating polynomial at *tret* (``dky[k]`` is the 
+        *k*-th derivative, so the Nordsieck array is 
+        ``h**k / k! * dky[k]``), and the cumulative statistics *totals*.
+        
+        Use :meth:`restore` to resume, e.g. after a batch job was killed 
+        during a long burn-in.
+        
+        .. note::
+           CVODE 2.3 has no public way to load a Nordsieck array, so resuming 
+           cannot be bit-identical to an uninterrupted run: CVODE restarts at 
+           order 1. The resumed run therefore diverges from an uninterrupted 
+           one, by differences of the order of the error tolerances that may 
+           accumulate over a long run. :meth:`restore` starts from the last 
+           accepted step size, scaled for order 1 by :func:`order1_step`, 
+           instead of CVODE's conservative initial estimate. This saves most 
+           of the ramp-up steps. The saved derivatives are for inspection 
+           only.
+        """
+        mem = self.cvode_mem
+        totals = np.array(self.totals)
+        if cvode.CVodeGetNumSteps(mem) == 0:
+            # No step taken since (re)initialization: no history to save
+            hlast = hcur = 0.0
+            qlast = qcur = 0
+            dky = np.array(self.y, ndmin=2)
+        else:
+            hlast = cvode.CVodeGetLastStep(mem)
+            hcur = cvode.CVodeGetCurrentStep(mem)
+            qlast = cvode.CVodeGetLastOrder(mem)
+            qcur = cvode.CVodeGetCurrentOrder(mem)
+            dky = np.empty((qlast + 1, self.n))
+            work = nv(np.zeros(self.n))
+            for k in range(qlast + 1):
+                cvode.CVodeGetDky(mem, self.tret.value, k, work)
+                dky[k] = work
+        state = self.__getstate__()
+        np.savez(path, hlast=hlast, hcur=hcur, qlast=qlast, qcur=qcur, 
+            dky=dky, totals=totals, **state)
+    
+    def restore(self, path):
+        """
+        Resume from a :meth:`checkpoint` file.
+        
+        Time, state and tolerances are restored. The next call to 
+        :meth:`integrate` starts at order 1 with the last saved step size, 
+        scaled by :func:`order1_step`. Results are not identical to an 
+        uninterrupted run; see the note in :meth:`checkpoint`.
+        
+        >>> import os, tempfile
+        >>> from example_ode import logistic_growth
+        >>> cvodeint = Cvodeint(logistic_growth, t=[0, 2], y=[0.1])
+        >>> t, y, flag = cvodeint.integrate(t=1)
+        >>> path = os.path.join(tempfile.mkdtemp(), "checkpoint.npz")
+        >>> cvodeint.checkpoint(path)
+        >>> resumed = Cvodeint(logistic_growth, t=[0, 2], y=[0.1])
+        >>> resumed.restore(path)
+        >>> resumed.tret.value, resumed.y == cvodeint.y
+        (1.0, True)
+        >>> t, y, flag = resumed.integrate(t=2)
+        >>> t[0]
+        1.0
+        """
+        f = np.load(path)
+        try:
+            history = "hlast hcur qlast qcur dky totals".split()
+            state = dict((k, f[k]) for k in f.files if k not in history)
+            state["tret"] = float(state["tret"])
+            state["reltol"] = float(state["reltol"])
+            self.__setstate__(state)
+            if f["hlast"] > 0:
+                self.init_step = order1_step(f["hlast"], f["qlast"])
+            self.totals = Solverstats(**dict(zip(f["totals"].dtype.names, 
+                f["totals"].item())))
+        finally:
+            f.close()
+    
+    def _clone_kwargs(self):
+        """Keyword arguments to reproduce the solver options of this object."""
+        name, mupper, mlower = self.linsolver_choice
+        return dict(reltol=self.reltol, abstol=self.abstol, 
+            f_data=self.f_data, chunksize=self.chunksize, 
+            maxsteps=self.maxsteps, mupper=mupper, mlower=mlower, 
+            jac=self.jac, linsolver=name, time_rhs=self.time_rhs, 
+            method=self.method, backend=self.backend)
+    
+    def clone(self, f_ode=None, y=None, t=None, validate=None, **kwargs):
+        """
+        New solver with the same options, optionally for a new ODE or state.
+        
+        :param function f_ode: New right-hand side. Default: the same one.
+        :param array_like y: Initial state. Default: a copy of the current 
+            state.
+        :param array_like t: Time as for :class:`Cvodeint`. Default: the 
+            same as this object.
+        :param bool validate: Whether to check *f_ode* as 
+            :class:`Cvodeint` normally does. The default is to skip the 
+            check if *f_ode* is the already validated right-hand side of 
+            this object. Pass ``validate=False`` for a new function that is 
+            known to behave, e.g. one that calls the validated one.
+        :param kwargs: Other arguments to :class:`Cvodeint`, overriding the 
+            options of this object.
+        
+        The linear solver choice and bandwidths are copied, so the Jacobian 
+        is not probed again. If a suitable solver object has been 
+        :meth:`released <release>`, it is reinitialized instead of allocating 
+        a new one.
+        
+        >>> from example_ode import vdp
+        >>> cvodeint = Cvodeint(vdp, t=[0, 20], y=[0, -2], reltol=1e-6)
+        >>> c = cvodeint.clone(y=[1, 1])
+        >>> c.y, c.reltol, c.cvode_mem is cvodeint.cvode_mem
+        ([1.0, 1.0], 1e-06, False)
+        """
+        if validate is None:
+            validate = (f_ode is not None) and (f_ode is not self.f_ode)
+        if f_ode is None:
+            f_ode = self.f_ode
+        if y is None:
+            y = np.copy(self.y)
+        if t is None:
+            t = self.t
+        options = self._clone_kwargs()
+        options.update(kwargs)
+        return self._clone_instance(f_ode, t, y, validate=validate, **options)
+    
+    def _clone_instance(self, f_ode, t, y, **kwargs):
+        """Construct the object returned by :meth:`clone`."""
+        return Cvodeint(f_ode, t, y, **kwargs)
+    
+    def release(self):
+        """
+        Give up the CVODE solver object, for reuse by new instances.
+        
+        Allocating and initializing CVODE memory is a large part of the cost 
+        of a short integration. A released solver object is reinitialized by 
+        the next :class:`Cvodeint` of the same size and linear solver, 
+        typically a :meth:`clone`. The released instance can no longer be 
+        used for integration.
+        
+        Solver objects with an analytic Jacobian or *f_data* are not 
+        pooled, since these settings would carry over to the next user.
+        
+        >>> from example_ode import vdp
+        >>> cvodeint = Cvodeint(vdp, t=[0, 20], y=[0, -2])
+        >>> mem = cvodeint.cvode_mem
+        >>> cvodeint.release()
+        >>> cvodeint.clone().cvode_mem is mem
+        True
+        """
+        if self.cvode_mem is None:
+            return
+        if self.c_rhs is not None:
+            self._reset_fdata()
+        free = mempool.setdefault(self._pool_key(), [])
+        if ((self.jac is None) and (self.f_data is None) and 
+            (len(free) < mempool_size)):
+            free.append((self.cvode_mem, self.bp_data))
+        self.cvode_mem = None
 
     
     def ydoti(self, index):
@@ -488,7 +1143,9 @@ class Cvodeint(object):
         return result
         
     def integrate(self, t=None, y=None, nrtfn=None, g_rtfn=None, g_data=None, 
-        assert_flag=None, ignore_flags=False):
+        assert_flag=None, ignore_flags=False, out=None, dense_output=False, 
+        interpolate=False, record=None, breakpoints=None, spill=None, 
+        events=None):
         """
         Integrate over time interval, init'ing solver or rootfinding as needed.
         
@@ -504,6 +1161,41 @@ class Cvodeint(object):
             CVode differs from *assert_flag* (see `flags`)
         :param bool ignore_flags: overrides assert_flag and does not check 
             CVode flag
+        :param tuple out: preallocated arrays *(t, Y)* of shape (m,) and 
+            (m, n). Output is written to their first rows, and views of these 
+            are returned. If more than *m* rows are needed, output is moved to 
+            new arrays as for ``out=None``.
+        :param dense_output: If True, return a 
+            :class:`~cgp.cvodeint.trajectory.Trajectory` in place of *Y*, 
+            which can be evaluated at any time within the interval. 
+            An existing Trajectory can be passed to extend it with successive 
+            intervals (e.g. one created with a *window* to bound memory).
+            The steps are not stored otherwise, and the returned *t* holds 
+            only the start and end times; the step times are ``traj.t``.
+            Requires adaptive steps, i.e. ``len(t) <= 2``, and cannot be 
+            combined with *record*.
+        :param bool interpolate: For fixed output times (``len(t) > 2``), 
+            let the solver take its own steps and interpolate all output 
+            times within each step at once, see 
+            :meth:`_integrate_interpolated`. Much faster for dense output 
+            grids.
+        :param record: For adaptive steps, a :class:`Recordpolicy` or dict 
+            of its arguments, to record only some of the steps.
+        :param list breakpoints: For adaptive steps, times where the 
+            right-hand side is discontinuous, optionally as tuples 
+            *(time, update)*. The solver stops exactly at each breakpoint, 
+            calls *update(self)* if given (e.g. to change parameters), 
+            re-initializes and continues. See :meth:`_integrate_segments`.
+        :param tuple spill: For adaptive steps, filenames *(tfile, Yfile)*. 
+            Output is written to these ``.npy`` files in chunks of 
+            *chunksize* rows as the solver proceeds, and read-only memmaps 
+            of them are returned. Memory use then stays flat however long 
+            the integration, see :class:`Spillbuffer`.
+        :param list events: For adaptive steps, :class:`Event` objects, or 
+            tuples or dicts of their arguments, to locate by rootfinding 
+            instead of *nrtfn*, *g_rtfn* and *g_data*. Every crossing is 
+            recorded as a :class:`Crossing` in attribute *crossings*. 
+            Integration stops only at terminal events. See :meth:`set_events`.
         :return tuple: 
             * **tout**: time vector 
               (equal to input time *t* if that has len > 2), 
@@ -614,6 +1306,31 @@ class Cvodeint(object):
         >>> print np.array2string(y, precision=3)
         [[ 0.3  ] [ 0.538] [ 0.76 ]]
         
+        Output can go to preallocated arrays:
+        
+        >>> tbuf, Ybuf = np.zeros(3), np.zeros((3, 1))
+        >>> t, y, flag = cvodeint.integrate(t=[0, 1, 2], y=[0.3], 
+        ...     out=(tbuf, Ybuf))
+        >>> y.base is Ybuf
+        True
+        
+        Recording only steps that are at least 0.5 time units apart 
+        (plus the first and last):
+        
+        >>> t, y, flag = cvodeint.integrate(t=[0, 2], y=[0.3], 
+        ...     record=dict(dt=0.5))
+        >>> bool(np.all(np.diff(t)[:-1] >= 0.5)), t[-1]
+        (True, 2.0)
+        
+        Dense output records CVODE's interpolating polynomial for each step, 
+        for evaluation at arbitrary times afterwards:
+        
+        >>> t, traj, flag = cvodeint.integrate(t=[0, 2], y=[0.3], 
+        ...     dense_output=True)
+        >>> traj([1, 2]).round(3)
+        array([[ 0.538],
+               [ 0.76 ]])
+        
         Example with discontinuous right-hand-side:
         
         >>> eps = [1, 10]
@@ -638,13 +1355,87 @@ class Cvodeint(object):
         >>> t, y, flag = cvodeint.integrate(t = [t_switch, tspan[1]])
         >>> t[0], t[-1], y[-1]
         (5.0, 10.0, array([-1.69...,  0.090...]))
+        
+        Declaring the discontinuity as a breakpoint does the same in a single 
+        call. The breakpoint time occurs twice in the output, as the end of 
+        one segment and the start of the next.
+        
+        >>> t, y, flag = cvodeint.integrate(t=tspan, y=[-2, 0], 
+        ...     breakpoints=[t_switch])
+        >>> t[t == t_switch], t[-1], y[-1]
+        (array([ 5.,  5.]), 10.0, array([-1.69...,  0.090...]))
         """
+        if self.backend != "cvode":
+            if ((out is not None) or dense_output or (record is not None) or 
+                (spill is not None) or (events is not None)):
+                raise ValueError("Backend %s supports only t, y, rootfinding "
+                    "and breakpoints" % (self.backend,))
+            return self._integrate_backend(t, y, nrtfn, g_rtfn, g_data, 
+                assert_flag, ignore_flags, breakpoints)
+        if self.next_method:
+            self._switch_method(self.next_method)
         self._ReInit_if_required(t, y)
+        if events is not None:
+            if (nrtfn is not None) or (g_rtfn is not None):
+                raise ValueError("events cannot be combined with nrtfn/g_rtfn")
+            if len(self.t) > 2:
+                raise ValueError("Events require len(t) <= 2")
+            self.set_events(events)
         self.RootInit(nrtfn, g_rtfn, g_data)
         if len(self.t) > 2:
-            result = self._integrate_fixed_steps()
+            self._forbid_events("len(t) > 2") # still set by an earlier call
+        self.crossings = []
+        if dense_output is True:
+            from .trajectory import Trajectory
+            traj = Trajectory(self.n, self.tret.value)
         else:
-            result = self._integrate_adaptive_steps()
+            traj = dense_output or None
+        if (len(self.t) > 2) and (traj is not None):
+            raise ValueError("Dense output requires len(t) <= 2")
+        if (traj is not None) and ((record is not None) or 
+            (out is not None) or (spill is not None)):
+            raise ValueError(
+                "Dense output cannot be combined with record, out or spill")
+        if record is not None:
+            if len(self.t) > 2:
+                raise ValueError("Recording policy requires len(t) <= 2")
+            if not isinstance(record, Recordpolicy):
+                record = Recordpolicy(**record)
+        if breakpoints is not None:
+            if len(self.t) > 2:
+                raise ValueError("Breakpoints require len(t) <= 2")
+            if out is not None:
+                raise ValueError("Breakpoints cannot be combined with out")
+            breakpoints = self._breakpoints(breakpoints)
+        if spill is not None:
+            if len(self.t) > 2:
+                raise ValueError("Spilling to disk requires len(t) <= 2")
+            if (out is not None) or (breakpoints is not None):
+                raise ValueError(
+                    "spill cannot be combined with out or breakpoints")
+        y0 = np.array(self.y) # initial state, in case of retry
+        # counters since (before, start), see _update_stats; breakpoints 
+        # restart the counters, see _integrate_segments
+        self._stats_since = self.solverstats(), time.time(), False
+        try:
+            try:
+                result = self._integrate_once(out, traj, record, interpolate, 
+                    breakpoints, spill)
+            except CvodeException:
+                # auto method: retry with BDF if Adams failed
+                if ((self.method != "auto") or (self.method_used != "adams") 
+                    or (traj is not None)):
+                    raise
+                self._update_stats(*self._stats_since)
+                self._switch_method("bdf")
+                self._ReInit_if_required(self.t, y0)
+                self._stats_since = self.solverstats(), time.time(), True
+                result = self._integrate_once(out, traj, record, interpolate, 
+                    breakpoints, spill)
+        finally:
+            self._update_stats(*self._stats_since)
+        if self.method == "auto":
+            self.next_method = self._auto_method()
         
         flag = result[-1]
         self.last_flag = flag
@@ -656,6 +1447,575 @@ class Cvodeint(object):
         else:
             raise CvodeException(flag, result)
     
+    def _integrate_once(self, out, traj, record, interpolate, 
+        breakpoints=None, spill=None):
+        """Dispatch :meth:`integrate` to the kind of output requested."""
+        if breakpoints:
+            return self._integrate_segments(breakpoints, traj, record)
+        if (len(self.t) > 2) and interpolate:
+            return self._integrate_interpolated(out)
+        elif len(self.t) > 2:
+            return self._integrate_fixed_steps(out)
+        elif traj is None:
+            return self._integrate_adaptive_steps(out, record=record, 
+                spill=spill)
+        try:
+            t, _Y, flag = self._integrate_adaptive_steps(out, traj, record, 
+                spill)
+        except CvodeException, exc:
+            t, _Y, flag = exc.result
+            exc.result = t, traj, flag
+            raise
+        return t, traj, flag
+    
+    def _breakpoints(self, breakpoints):
+        """
+        Sorted *(time, update)* for breakpoints within the current interval.
+        
+        Each item of *breakpoints* is a time or a tuple *(time, update)*. 
+        Breakpoints at or outside the ends of the interval are dropped.
+        
+        >>> from example_ode import vdp
+        >>> cvodeint = Cvodeint(vdp, t=[0, 10], y=[0, -2])
+        >>> f = lambda cvodeint: None
+        >>> cvodeint._breakpoints([(5, f), 2.5, 0, 12]) == [(2.5, None), (5, f)]
+        True
+        
+        Times may be given as one-element arrays, e.g. fields of a record 
+        array of parameters.
+        
+        >>> cvodeint._breakpoints([np.array([2.5])])
+        [(2.5, None)]
+        """
+        result = []
+        for b in breakpoints:
+            tb, update = b if isinstance(b, tuple) else (b, None)
+            # scalar, for CVodeSetStopTime() and comparison with self.tret
+            tb = float(np.squeeze(tb))
+            if self.tret.value < tb < self.tstop:
+                result.append((tb, self._breakpoint_update(update)))
+        return sorted(result, key=lambda b: b[0])
+    
+    def _breakpoint_update(self, update):
+        """
+        Function to call at a breakpoint, see :meth:`integrate`.
+        
+        Here, *update* must be None or a function of the integrator object. 
+        Subclasses can accept other specifications, see 
+        :meth:`cgp.cvodeint.namedcvodeint.Namedcvodeint._breakpoint_update`.
+        """
+        if (update is not None) and not callable(update):
+            raise TypeError("Breakpoint update must be a function of the "
+                "integrator, not %r" % (update,))
+        return update
+    
+    def _integrate_segments(self, breakpoints, traj=None, record=None):
+        """
+        Integrate to each breakpoint in turn, re-initializing the solver there.
+        
+        :param list breakpoints: Sorted *(time, update)* within the current 
+            interval, see :meth:`_breakpoints`.
+        :return tuple: *(t, Y, flag)*, concatenated over segments.
+        
+        Each segment is integrated with adaptive steps as in 
+        :meth:`_integrate_adaptive_steps`, and the solver is re-initialized 
+        at each breakpoint after calling *update*. This lets CVODE restart 
+        cleanly at a discontinuity of the right-hand side instead of 
+        stepping across it, without splitting the integration into 
+        separate calls to :meth:`integrate`.
+        
+        Integration stops early at a root or on error. Any remaining 
+        breakpoints apply only to this call, not to a later call that 
+        resumes after the root.
+        
+        In this example the growth rate changes at t=1; an update function 
+        sets the state too.
+        
+        >>> def ode(t, y, ydot, f_data):
+        ...     ydot[0] = 1.0 if t < 1 else -1.0
+        >>> def reset(cvodeint):
+        ...     cvodeint.y[0] = 0.0
+        >>> cvodeint = Cvodeint(ode, t=[0, 2], y=[0.0])
+        >>> t, Y, flag = cvodeint.integrate(breakpoints=[(1, reset)])
+        >>> print np.array2string(Y[t == 1].squeeze(), precision=6)
+        [ 1.  0.]
+        >>> t[-1], Y[-1].round(6), cvodeint.t
+        (2.0, array([-1.]), array([ 0.,  2.]))
+        """
+        t_full = self.t
+        tend = self.tstop
+        results = []
+        try:
+            for tb, update in breakpoints + [(tend, None)]:
+                self.tstop = tb
+                cvode.CVodeSetStopTime(self.cvode_mem, tb)
+                try:
+                    result = self._integrate_once(None, traj, record, False)
+                except CvodeException, exc:
+                    results.append(exc.result)
+                    exc.result = self._concatenate(results, traj)
+                    raise
+                results.append(result)
+                if (tb == tend) or (result[-1] != cvode.CV_TSTOP_RETURN):
+                    break
+                if update is not None:
+                    update(self)
+                # ReInit resets the CVODE counters, so record them first
+                self._update_stats(*self._stats_since)
+                self._ReInit_if_required([tb, tend])
+                self._stats_since = self.solverstats(), time.time(), True
+        finally:
+            self.t, self.tstop = t_full, tend
+        return self._concatenate(results, traj)
+    
+    def _integrate_backend(self, t, y, nrtfn, g_rtfn, g_data, assert_flag, 
+        ignore_flags, breakpoints):
+        """
+        :meth:`integrate` with :class:`~cgp.cvodeint.scipyint.Scipyint`.
+        
+        The backend solver is created on first use. Each call resumes from 
+        the time and state of this object, which may have been changed 
+        since, and updates them afterwards. At breakpoints, the backend 
+        is restarted as CVODE is in :meth:`_integrate_segments`.
+        
+        >>> from example_ode import logistic_growth, logistic_growth_sol
+        >>> cvodeint = Cvodeint(logistic_growth, t=[0, 2], y=[0.1], 
+        ...     backend="LSODA")
+        >>> t, y, flag = cvodeint.integrate()
+        >>> bool(abs(y.squeeze() - logistic_growth_sol(t, 0.1)).max() < 1e-6)
+        True
+        >>> t, y, flag = cvodeint.integrate(t=3)
+        >>> t[0], t[-1], cvodeint.tret.value, flag == cvode.CV_TSTOP_RETURN
+        (2.0, 3.0, 3.0, True)
+        """
+        s = self.scipyint
+        if s is None:
+            from .scipyint import Scipyint
+            abstol = (self.abstol.value if isinstance(self.abstol, 
+                cvode.realtype) else np.array(self.abstol))
+            s = self.scipyint = Scipyint(self.my_f_ode, self.t, 
+                np.array(self.y), self.reltol, abstol, f_data=self.f_data, 
+                maxsteps=self.maxsteps, method=self.backend)
+            s.RootInit(*self._rootinit)
+        s.y[:] = self.y
+        s.t, s.tret, s.tstop = self.t, self.tret.value, self.tstop
+        s.last_flag = self.last_flag
+        s.RootInit(nrtfn, g_rtfn, g_data)
+        s._reinit(t, y)
+        s.last_flag = None # t is interpreted already
+        t_full, tend = s.t, s.tstop
+        segments = []
+        if breakpoints is not None:
+            if len(t_full) > 2:
+                raise ValueError("Breakpoints require len(t) <= 2")
+            self.tret.value, self.tstop = s.tret, tend
+            segments = self._breakpoints(breakpoints)
+        results = []
+        self.stats = Solverstats()
+        try:
+            for tb, update in segments + [(tend, None)]:
+                if segments:
+                    s.t, s.tstop = np.array([s.tret, tb]), tb
+                try:
+                    results.append(s.integrate(ignore_flags=True))
+                except CvodeException, exc:
+                    results.append(exc.result)
+                    exc.result = self._concatenate(results)
+                    raise
+                finally:
+                    self.stats += s.stats
+                    self.y[:] = s.y
+                    self.tret.value = s.tret
+                    s.last_flag = None
+                if (tb == tend) or (results[-1][-1] != cvode.CV_TSTOP_RETURN):
+                    break
+                if update is not None:
+                    update(self)
+                    s.y[:] = self.y
+        finally:
+            self.totals += self.stats
+            self.t, self.tstop = t_full, tend
+            self.t0.value = t_full[0]
+        result = self._concatenate(results)
+        flag = result[-1]
+        self.last_flag = flag
+        if type(assert_flag) is int:
+            assert_flag = (assert_flag,)
+        if ignore_flags or (assert_flag is None) or (flag in assert_flag):
+            return result
+        else:
+            raise CvodeException(flag, result)
+    
+    @staticmethod
+    def _concatenate(results, traj=None):
+        """Join *(t, Y, flag)* of successive segments, see :meth:`integrate`."""
+        t = np.concatenate([ti for ti, _Yi, _flagi in results])
+        if traj is None:
+            Y = np.concatenate([Yi for _ti, Yi, _flagi in results])
+        else:
+            Y = traj
+        return t, Y, results[-1][-1]
+    
+    def _auto_method(self):
+        """
+        Method for the next :meth:`integrate` with ``method="auto"``.
+        
+        * Adams is too costly if error test failures and nonlinear 
+          convergence failures together exceed *max_fail_ratio* (default 
+          0.2) times the number of steps: functional iteration then 
+          struggles with stiffness. (If Adams fails altogether, 
+          :meth:`integrate` retries at once with BDF.)
+        * BDF is unnecessary if the problem is not stiff at the current 
+          step size, i.e. if step size times the spectral radius of the 
+          Jacobian is below *max_stiffness* (default 1.0), where functional 
+          iteration converges. The Jacobian is estimated by finite 
+          differences at the current state, which costs n + 1 evaluations 
+          of the right-hand side.
+        
+        :return str: "adams" or "bdf" if switching, otherwise None.
+        
+        The van der Pol equation with the default parameter is not stiff. 
+        Forcing a switch to BDF, the next integration finds that Adams would 
+        do.
+        
+        >>> from example_ode import vdp
+        >>> cvodeint = Cvodeint(vdp, t=[0, 20], y=[0, -2], method="auto")
+        >>> t, y, flag = cvodeint.integrate()
+        >>> cvodeint.method_used, cvodeint.next_method
+        ('adams', None)
+        >>> cvodeint.next_method = "bdf"
+        >>> t, y, flag = cvodeint.integrate(y=[0, -2])
+        >>> cvodeint.method_used, cvodeint.next_method
+        ('bdf', 'adams')
+        >>> sorted(k for k, v in cvodeint.method_totals.items() if v["nsteps"])
+        ['adams', 'bdf']
+        """
+        stats = self.stats
+        nsteps = stats["nsteps"]
+        if self.method_used == "adams":
+            fails = stats["netfails"] + stats["nncfails"]
+            if nsteps and (fails > self.max_fail_ratio * nsteps):
+                return "bdf"
+        elif self.method_used == "bdf":
+            h = cvode.CVodeGetCurrentStep(self.cvode_mem)
+            if (nsteps and np.isfinite(h) and 
+                h * self._spectral_radius() < self.max_stiffness):
+                return "adams"
+        return None
+    
+    def _spectral_radius(self):
+        """Largest absolute eigenvalue of the Jacobian at the current state."""
+        J = self._dq_jacobian(self.tret.value, np.array(self.y))
+        if not np.isfinite(J).all():
+            return np.inf
+        return abs(np.linalg.eigvals(J)).max()
+    
+    def _dq_jacobian(self, t, y, ydot0=None):
+        """
+        Difference-quotient Jacobian of the right-hand side at *(t, y)*.
+        
+        *ydot0* is the right-hand side at *(t, y)*, if already known.
+        
+        >>> from example_ode import vdp
+        >>> cvodeint = Cvodeint(vdp, t=[0, 1], y=[0, -2])
+        >>> cvodeint._dq_jacobian(0, np.array([2.0, 1.0])).round(6)
+        array([[ 0.,  1.],
+               [-5., -3.]])
+        """
+        ydot = nv(np.zeros(self.n))
+        if ydot0 is None:
+            self.my_f_ode(t, nv(y), ydot, self.f_data)
+            ydot0 = np.array(ydot)
+        J = np.empty((self.n, self.n))
+        for j in range(self.n):
+            yj = y.copy()
+            delta = np.sqrt(np.finfo(float).eps) * max(abs(y[j]), 1.0)
+            yj[j] += delta
+            self.my_f_ode(t, nv(yj), ydot, self.f_data)
+            J[:, j] = (np.array(ydot) - ydot0) / delta
+        return J
+    
+    def _switch_method(self, method):
+        """
+        Replace the CVODE solver object with one for *method*.
+        
+        Rootfinding settings are carried over; the solver is reinitialized 
+        by the next :meth:`integrate`.
+        """
+        self.next_method = None
+        if method == self.method_used:
+            return
+        log.debug("Switching from %s to %s" % (self.method_used, method))
+        self.release()
+        self.method_used = method
+        self._create_solver(*self._rootinit)
+    
+    def iterate(self, t=None, y=None, chunk=1000, nrtfn=None, g_rtfn=None, 
+        g_data=None, assert_flag=None, ignore_flags=False):
+        """
+        Integrate like :meth:`integrate`, yielding output in blocks.
+        
+        :param array_like t, y: as for :meth:`integrate`
+        :param int chunk: maximum number of time points per block
+        :param nrtfn, g_rtfn, g_data, assert_flag, ignore_flags: as for 
+            :meth:`integrate`; flags are checked after the last block.
+        :return: generator of tuples *(t, Y, flag)*, where *flag* is 
+            ``cvode.CV_SUCCESS`` for all but the last block.
+        
+        Only one block is held in memory at a time, so very long simulations 
+        can be processed (thinned, summarized, written to disk) as they go.
+        The initial state is the first row of the first block; concatenating 
+        the blocks gives the same result as :meth:`integrate`.
+        
+        >>> from example_ode import logistic_growth
+        >>> cvodeint = Cvodeint(logistic_growth, t=[0, 2], y=[0.1])
+        >>> blocks = list(cvodeint.iterate(chunk=50))
+        >>> max(len(ti) for ti, Yi, flag in blocks)
+        50
+        >>> t, Y, flag = cvodeint.integrate(y=[0.1])
+        >>> np.all(np.concatenate([Yi for ti, Yi, flag in blocks]) == Y)
+        True
+        >>> for ti, Yi, flag in cvodeint.iterate(t=np.linspace(0, 2, 5), 
+        ...     chunk=2):
+        ...     print ti, flag
+        [ 0.   0.5] 0
+        [ 1.   1.5] 0
+        [ 2.] 0
+        
+        The generator does not need to run to completion. While it is 
+        suspended, the solver object should not be used for anything else.
+        """
+        self._ReInit_if_required(t, y)
+        self.RootInit(nrtfn, g_rtfn, g_data)
+        self._forbid_events("iterate()")
+        fixed = len(self.t) > 2
+        if fixed:
+            tout = self.t
+            task = cvode.CV_NORMAL
+        else:
+            tstop = self.tstop
+            # (pysundials has a typo in the name of the ONE_STEP_TSTOP constant)
+            task = cvode.CV_ONE_STE_TSTOP
+        OK = cvode.CV_SUCCESS, cvode.CV_TSTOP_RETURN, cvode.CV_ROOT_RETURN
+        cvode_mem = self.cvode_mem
+        tret = self.tret
+        y = self.y
+        flag = cvode.CV_SUCCESS
+        self.stats = Solverstats()
+        before, start = self.solverstats(), time.time()
+        nstep = 0 # number of solver calls so far
+        t = np.empty(chunk)
+        Y = np.empty((chunk, self.n))
+        t[0], Y[0] = self.t0.value, y
+        i = 1 # rows filled in current block
+        if fixed:
+            done = len(tout) == 1
+        else:
+            done = tret.value >= tstop
+            if done:
+                flag = cvode.CV_TSTOP_RETURN
+        while not done:
+            if i == chunk:
+                # time spent by the consumer is not solver time
+                self._update_stats(before, start, accumulate=True)
+                yield t, Y, cvode.CV_SUCCESS
+                before, start = self.solverstats(), time.time()
+                t = np.empty(chunk)
+                Y = np.empty((chunk, self.n))
+                i = 0
+            if fixed:
+                flag = cvode.CVode(cvode_mem, tout[nstep + 1], y, 
+                    ctypes.byref(tret), task)
+            else:
+                if nstep >= self.maxsteps:
+                    raise CvodeException("Maximum number of steps exceeded", 
+                        (t[:i], Y[:i], flag))
+                flag = cvode.CVode(cvode_mem, tstop, y, ctypes.byref(tret), 
+                    task)
+            if flag not in OK:
+                self.last_flag = flag
+                self._update_stats(before, start, accumulate=True)
+                raise CvodeException(flag, (t[:i], Y[:i], flag))
+            t[i], Y[i] = tret.value, y
+            i += 1
+            nstep += 1
+            if fixed:
+                done = nstep == len(tout) - 1
+            else:
+                done = tret.value >= tstop
+            done = done or (flag == cvode.CV_ROOT_RETURN)
+        self._update_stats(before, start, accumulate=True)
+        self.last_flag = flag
+        result = t[:i], Y[:i], flag
+        if type(assert_flag) is int:
+            assert_flag = (assert_flag,)
+        if not (ignore_flags or (assert_flag is None) or (flag in assert_flag)):
+            raise CvodeException(flag, result)
+        yield result
+    
+    def ensemble(self, y, p=None, t=None, nrtfn=None, g_rtfn=None,
+        g_data=None, assert_flag=None, ignore_flags=False):
+        """
+        Integrate many initial states (and parameter sets) in one session.
+
+        :param array_like y: (N, n) array of initial states, one row per
+            ensemble member.
+        :param array_like p: optional (N, nparam) array of parameter vectors,
+            see :meth:`_set_parameters`.
+        :param array_like t: output times as for :meth:`integrate`, except
+            that every member starts afresh at ``t[0]``. A scalar *t*
+            integrates each member from the current time to *t*.
+        :param nrtfn, g_rtfn, g_data, assert_flag, ignore_flags: as for
+            :meth:`integrate`. Rootfinding is initialized once for all members.
+        :return tuple:
+            * **tout**: time vector if len(t) > 2,
+              otherwise list of one time vector per member
+            * **Y**: (N, len(t), n) array if len(t) > 2,
+              otherwise list of one state array per member
+            * **flag**: array of the last flag for each member
+
+        The solver object, output arrays and rootfinding are set up only once,
+        which saves most of the Python overhead of looping over
+        :meth:`integrate`. Time and state are restored afterwards.
+
+        >>> from example_ode import exp_growth
+        >>> cvodeint = Cvodeint(exp_growth, t=[0, 0.5, 1], y=[1])
+        >>> t, Y, flag = cvodeint.ensemble(y=[[1], [2], [3]])
+        >>> Y.shape
+        (3, 3, 1)
+        >>> Y[:, -1].round(4)
+        array([[ 2.7183],
+               [ 5.4366],
+               [ 8.1548]])
+        >>> flag
+        array([0, 0, 0])
+        >>> cvodeint.y
+        [1.0]
+
+        With only start and end times, results are returned as lists,
+        because the number of adaptive time steps differs between members.
+
+        >>> t, Y, flag = cvodeint.ensemble(y=[[1], [2]], t=[0, 1])
+        >>> [Yi[-1].round(4) for Yi in Y]
+        [array([ 2.7183]), array([ 5.4366])]
+        """
+        y = np.array(y, dtype=float, ndmin=2)
+        N = len(y)
+        if (p is not None) and (len(p) != N):
+            raise ValueError("Got %s initial states but %s parameter sets" %
+                (N, len(p)))
+        if t is None:
+            t = self.t
+        t = np.array(t, dtype=float, ndmin=1)
+        if len(t) == 1:
+            t = np.r_[self.tret.value, t]
+        if type(assert_flag) is int:
+            assert_flag = (assert_flag,)
+        fixed = len(t) > 2
+        if fixed:
+            tout = t
+            tbuf = np.empty(len(t))
+            Y = np.empty((N, len(t), self.n))
+            Y.fill(np.nan)
+        else:
+            tout, Y = [], []
+        flags = np.zeros(N, dtype=int)
+        oldt, oldy = self.t, np.copy(self.y)
+        self.RootInit(nrtfn, g_rtfn, g_data)
+        if fixed:
+            self._forbid_events("len(t) > 2")
+        self.stats = Solverstats()
+        try:
+            for i in range(N):
+                if p is not None:
+                    self._set_parameters(p[i])
+                self._ReInit_if_required(t, y[i])
+                # CVodeReInit() zeroes the counters, so snapshot after it
+                before, start = self.solverstats(), time.time()
+                try:
+                    if fixed:
+                        # write directly into this member's slice of Y
+                        result = self._integrate_fixed_steps(out=(tbuf, Y[i]))
+                    else:
+                        result = self._integrate_adaptive_steps()
+                except CvodeException, exc:
+                    if not ignore_flags:
+                        exc.result = tout, Y, flags
+                        raise
+                    result = exc.result
+                finally:
+                    self._update_stats(before, start, accumulate=True)
+                ti, Yi, flags[i] = result
+                if not fixed:
+                    tout.append(ti)
+                    Y.append(Yi)
+                self.last_flag = flags[i]
+                if not (ignore_flags or (assert_flag is None) or
+                    (flags[i] in assert_flag)):
+                    raise CvodeException(int(flags[i]), (tout, Y, flags))
+        finally:
+            self._ReInit_if_required(oldt, oldy)
+        return tout, Y, flags
+
+    def parareal(self, t=None, y=None, **kwargs):
+        """
+        Integrate in parallel over time slices (experimental).
+        
+        Long runs such as pacing to steady state are inherently serial. 
+        The parareal algorithm instead iterates a cheap serial sweep at 
+        loose tolerances, corrected by integrating all time slices 
+        concurrently in a process pool. This object is unchanged.
+        
+        :return tuple: *(T, U, niter)*: slice boundaries, states there, and 
+            the number of iterations used.
+        
+        See :func:`cgp.cvodeint.parareal.parareal` for the arguments.
+        
+        >>> from example_ode import vdp
+        >>> cvodeint = Cvodeint(vdp, t=[0, 4], y=[0, -2])
+        >>> T, U, niter = cvodeint.parareal(nslices=2, processes=2)
+        >>> U.shape
+        (3, 2)
+        """
+        from .parareal import parareal
+        return parareal(self, t, y, **kwargs)
+
+    def sensitivities(self, index, t=None, y=None, **kwargs):
+        """
+        Integrate with forward sensitivities to some parameters.
+        
+        :param array_like index: Indices of the parameters, see 
+            :meth:`_get_parameters`.
+        :return tuple: *(t, Y, S, flag)*, where *S[i, j]* is the derivative 
+            of the state at time *t[i]* with respect to parameter 
+            *index[j]*.
+        
+        See :func:`cgp.cvodeint.sensitivities.forward_sensitivities` for 
+        the arguments. This object is unchanged.
+        """
+        from .sensitivities import forward_sensitivities
+        return forward_sensitivities(self, index, t, y, **kwargs)
+
+    def _get_parameters(self):
+        """
+        Return a copy of the parameter vector, see :meth:`_set_parameters`.
+        
+        Plain :class:`Cvodeint` objects have no notion of parameters.
+        """
+        raise CvodeException("%s has no parameter vector" %
+            self.__class__.__name__)
+
+    def _set_parameters(self, p):
+        """
+        Set parameter vector for one member of an :meth:`ensemble`.
+
+        Plain :class:`Cvodeint` objects have no notion of parameters;
+        subclasses such as :class:`~cgp.cvodeint.namedcvodeint.Namedcvodeint`
+        override this method.
+        """
+        raise CvodeException("%s has no parameter vector" %
+            self.__class__.__name__)
+
     def _ReInit_if_required(self, t=None, y=None):
         """
         Interpret/set time, state; call SetStopTime(), ReInit() if needed.
@@ -664,6 +2024,10 @@ class Cvodeint(object):
         ``tret==t0==self.t[0], tstop = self.t[-1]``.
         If *y* is ``None``, the current *y* is used at time ``tret``.
         If *t* is a scalar, *t0* is initialized to the current ``tret.value``.
+        
+        If attribute *warm_restart* is True, CVODE starts from the step size 
+        it would have tried next (see :meth:`_warm_step`) instead of 
+        estimating a small one.
         """
         # cdef long lptret = ctypes.addressof(self.tret)
         # cdef double* ptret = <double*>lptret
@@ -705,16 +2069,126 @@ class Cvodeint(object):
         self.tstop = self.t[-1]
         if (y is not None) or (t is None) or (len(self.t) >= 2):
             cvode.CVodeSetStopTime(self.cvode_mem, self.tstop)
+            init_step = self.init_step
+            if self.warm_restart and not init_step:
+                init_step = self._warm_step()
+            if init_step is not None:
+                # One-shot initial step size, see restore(). Zero reverts to 
+                # CVODE's own estimate on the following ReInit.
+                cvode.CVodeSetInitStep(self.cvode_mem, init_step)
+                self.init_step = 0.0 if init_step else None
             cvode.CVodeReInit(self.cvode_mem, self.my_f_ode, self.t0, self.y, 
                 self.itol, self.reltol, self.abstol)
+            self._reinit_rhs()
         # self.tret.value = cvode.CVodeGetCurrentTime(self.cvode_mem)
 
-    def _integrate_adaptive_steps(self):
+    def _set_c_rhs(self, address, *arrays):
+        """
+        Let CVODE call a compiled right-hand side instead of :attr:`my_f_ode`.
+        
+        :param int address: Address of a C function with the signature of 
+            CVODE's CVRhsFn that does not need the GIL, e.g. ``nogil_rhs`` 
+            of a model module from :mod:`cgp.physmod.cythonize`.
+        :param arrays: Contiguous arrays whose data pointers are passed to 
+            the function as *f_data*, in an array of pointers. They are 
+            kept alive as long as the function is in use.
+        
+        Requires the compiled loop (:mod:`cgp.cvodeint._steploop`); 
+        otherwise this does nothing. Pass *address* = None to revert to 
+        the Python right-hand side.
+        
+        The compiled function must compute the same rates as 
+        :attr:`my_f_ode`, which is still used for evaluations in Python, 
+        e.g. by :meth:`_dq_jacobian` or event functions. CVODE no longer 
+        calls :attr:`my_f_ode`, so its exceptions are not captured, and 
+        *time_rhs* could not time it; the latter raises ValueError.
+        """
+        if (address is not None) and self.time_rhs:
+            raise ValueError(
+                "time_rhs needs the Python right-hand side, not a compiled one")
+        if (address is None) or (_steploop is None):
+            if self.c_rhs is not None:
+                self._reset_fdata()
+                self.c_rhs = None
+                self._ReInit_if_required(y=self.y)
+            return
+        pointers = np.array([a.ctypes.data for a in arrays], dtype=np.uintp)
+        self._c_rhs_arrays = arrays + (pointers,)
+        self.c_rhs = address, pointers.ctypes.data
+        self._reinit_rhs()
+
+    def _reinit_rhs(self):
+        """Switch to the compiled right-hand side after a CVodeReInit()."""
+        if self.c_rhs is None:
+            return
+        address = lambda p: ctypes.cast(p, ctypes.c_void_p).value
+        if isinstance(self.abstol, cvode.realtype):
+            abstol = ctypes.addressof(self.abstol)
+        else:
+            abstol = address(self.abstol.data)
+        flag = _steploop.set_rhs(address(self.cvode_mem.obj), 
+            self.c_rhs[0], self.c_rhs[1], ctypes.addressof(self.t0), 
+            address(self.y.data), self.itol, self.reltol, abstol)
+        if flag != cvode.CV_SUCCESS:
+            raise CvodeException(flag)
+
+    def _reset_fdata(self):
+        """Clear the *f_data* of a compiled RHS, which *my_f_ode* rejects."""
+        address = lambda p: ctypes.cast(p, ctypes.c_void_p).value
+        _steploop.set_rhs(address(self.cvode_mem.obj), 0, 0, 0, 0, 0, 0.0, 0)
+
+    def _warm_step(self):
+        """
+        Initial step size for a warm restart, or 0.0 to let CVODE estimate it.
+        
+        This is the last accepted step, scaled down for a restart at order 1, 
+        and limited to the new interval ``[t0, tstop]``. It is 0.0 if no 
+        steps were taken since the last reinitialization.
+        
+        CVodeReInit() always restarts at order 1, because the Nordsieck 
+        history of higher derivatives is not valid for a changed state or 
+        right-hand side, so the step is scaled by :func:`order1_step`. This 
+        is a heuristic; if warm restarts raise *netfails* in :attr:`stats` 
+        for a model, leave them off.
+        
+        >>> from example_ode import vdp
+        >>> cvodeint = Cvodeint(vdp, t=[0, 20], y=[0, -2])
+        >>> cvodeint._warm_step()
+        0.0
+        >>> t, Y, flag = cvodeint.integrate()
+        >>> hlast = cvode.CVodeGetLastStep(cvodeint.cvode_mem)
+        >>> qlast = cvode.CVodeGetLastOrder(cvodeint.cvode_mem)
+        >>> cvodeint._warm_step() == hlast * 0.5 ** (qlast - 1)
+        True
+        """
+        mem = self.cvode_mem
+        if cvode.CVodeGetNumSteps(mem) == 0:
+            return 0.0
+        h = order1_step(cvode.CVodeGetLastStep(mem), 
+            cvode.CVodeGetLastOrder(mem))
+        span = self.tstop - self.t0.value
+        if not np.isfinite(h):
+            return 0.0
+        return float(np.sign(span) * min(h, abs(span)))
+
+    def _integrate_adaptive_steps(self, out=None, traj=None, record=None, 
+        spill=None):
         """
         Repeatedly call CVode() with task CV_ONE_STEP_TSTOP and tout=tstop.
         
         Output: t, Y, flag. See Cvodeint.integrate().
         
+        Work arrays are reused between calls, see :class:`Stepbuffer`.
+        If *spill* is given, output goes to files instead, 
+        see :class:`Spillbuffer`.
+        If *traj* is a :class:`~cgp.cvodeint.trajectory.Trajectory`, 
+        the interpolating polynomial of each step is appended to it instead, 
+        and only the times of the first and last step are returned, with 
+        *Y* = None. Steps are then not copied into a :class:`Stepbuffer`, 
+        so memory is bounded by the *window* of the Trajectory.
+        If *record* is a :class:`Recordpolicy`, only the steps it selects 
+        are stored; *maxsteps* still counts all steps.
+        
         ..  plot::
             :include-source:
             :width: 400
@@ -726,11 +2200,24 @@ class Cvodeint(object):
             t, y, flag = cvodeint.integrate()
             plt.plot(t, y, '.-')
         """
-        Y = np.empty(shape=(self.chunksize, self.n)) # cdef np.ndarray
-        t = np.empty(shape=(self.chunksize,)) # cdef np.ndarray
-        d1 = self.chunksize # cdef int
+        if traj is not None:
+            return self._integrate_dense(traj)
+        if spill is not None:
+            buf = Spillbuffer(self.n, spill, self.chunksize)
+        elif out is not None:
+            buf = Stepbuffer(self.n, out=out)
+        else:
+            if self.stepbuffer is None:
+                self.stepbuffer = Stepbuffer(self.n, self.chunksize)
+            buf = self.stepbuffer
+        Y = buf.Y # cdef np.ndarray
+        t = buf.t # cdef np.ndarray
+        d1 = len(buf) # cdef int
         Y[0] = np.array(self.y, copy=True)
         t[0] = self.t0.value
+        if (self.compiled_loop and (record is None) and 
+            (self.events is None) and Y.flags.c_contiguous):
+            return self._integrate_compiled(buf)
         i = 1 # cdef int
         # cdef int flag
         # tret = self.tret
@@ -748,47 +2235,150 @@ class Cvodeint(object):
         CV_TSTOP_RETURN = cvode.CV_TSTOP_RETURN # cdef int
         CV_ONE_STEP_TSTOP = cvode.CV_ONE_STE_TSTOP # typo in cvode # cdef int
         flag = None
+        nstep = i # cdef int # steps so far, counting the initial point
+        if record is not None:
+            every, dt, dy = record
+            nskip = 0 # cdef int # steps since the last recorded one
         while self.tret < tstop:
-            if i >= maxsteps:
-                # truncate to drop unused array elements
-                Y.resize((i, self.n), refcheck=False)
-                t.resize(i, refcheck=False)
+            if nstep >= maxsteps:
+                # drop unused array elements
+                t, Y = buf.result(i)
                 raise CvodeException("Maximum number of steps exceeded", 
                                      (t, Y, flag))
             # solve ode for one internal time step
             # (pysundials has a typo in the name of the ONE_STEP_TSTOP constant)
             flag = CVode(cvode_mem, tstop, y, 
                 byref(self.tret), CV_ONE_STEP_TSTOP)
+            nstep += 1
             ## The top() function is hideously expensive, and gets evaluated 
             ## even if logging is set to ignore debug messages. Disable for now.
             # if (i % 10) == 0 and logging.DEBUG >= log.getEffectiveLevel():
             #     log.debug(top())
             if flag in (CV_SUCCESS, CV_TSTOP_RETURN, CV_ROOT_RETURN):
                 # log.debug("OK: %s: %s" % (i, flags[flag]))
+                if (record is not None) and (flag == CV_SUCCESS):
+                    # cheapest criteria first; skip without copying y
+                    nskip += 1
+                    if ((nskip < every) or 
+                        (self.tret.value - t[i - 1] < dt) or 
+                        ((dy is not None) and 
+                         (np.abs(np.subtract(y, Y[i - 1])).max() < dy))):
+                        continue
+                    nskip = 0
                 Y[i], t[i] = y, self.tret.value # copy solver state & time
                 if flag == CV_ROOT_RETURN:
-                    i += 1
-                    break
+                    # continue past non-terminal events, see set_events
+                    if (self.events is None) or self._event_crossings():
+                        i += 1
+                        break
             else:
                 log.debug("Exception: %s: %s" % (i, flags[flag]))
-                # truncate to drop unused array elements
-                Y.resize((i, self.n), refcheck=False)
-                t.resize(i, refcheck=False)
+                # drop unused array elements
+                t, Y = buf.result(i)
                 raise CvodeException(flag, (t, Y, flag))
             i += 1
-            if i >= d1: # enlarge arrays with a new chunk
-                d1 = len(t) + self.chunksize
-                log.warning("Enlarging arrays from %s to %s" % (i, d1))
-                Y.resize((d1, self.n), refcheck=False)
-                t.resize(d1, refcheck=False)
+            if i >= d1: # enlarge arrays by doubling, or spill to disk
+                i = buf.grow(i)
+                Y, t, d1 = buf.Y, buf.t, len(buf)
         else: # if the while loop was skipped because self.tret >= tstop
             flag = CV_TSTOP_RETURN
-        # truncate to drop unused array elements
-        Y.resize((i, self.n), refcheck=False)
-        t.resize(i, refcheck=False)
+        if (record is not None) and (t[i - 1] != self.tret.value):
+            # always record the last step
+            Y[i], t[i] = y, self.tret.value
+            i += 1
+        # drop unused array elements
+        t, Y = buf.result(i)
         return t, Y, flag
 
-    def _integrate_fixed_steps(self):
+    def _integrate_dense(self, traj):
+        """
+        Version of :meth:`_integrate_adaptive_steps` for dense output.
+        
+        Appends the interpolating polynomial of each step to the 
+        :class:`~cgp.cvodeint.trajectory.Trajectory` *traj*, without 
+        storing the steps themselves. Returns *(t, None, flag)*, where *t* 
+        holds the start time and the time of the last step.
+        """
+        t0 = self.t0.value
+        tstop = self.tstop
+        dky = nv(np.zeros(self.n))
+        OK = cvode.CV_SUCCESS, cvode.CV_TSTOP_RETURN, cvode.CV_ROOT_RETURN
+        flag = None
+        nstep = 1 # steps so far, counting the initial point
+        while self.tret < tstop:
+            if nstep >= self.maxsteps:
+                raise CvodeException("Maximum number of steps exceeded", 
+                    (np.array([t0, self.tret.value]), None, flag))
+            flag = cvode.CVode(self.cvode_mem, tstop, self.y, 
+                ctypes.byref(self.tret), cvode.CV_ONE_STE_TSTOP)
+            nstep += 1
+            if flag not in OK:
+                log.debug("Exception: %s: %s" % (nstep, flags[flag]))
+                raise CvodeException(flag, 
+                    (np.array([t0, self.tret.value]), None, flag))
+            self._append_step(traj, dky)
+            if flag == cvode.CV_ROOT_RETURN:
+                # continue past non-terminal events, see set_events
+                if (self.events is None) or self._event_crossings():
+                    break
+        else: # if the while loop was skipped because self.tret >= tstop
+            flag = cvode.CV_TSTOP_RETURN
+        return np.array([t0, self.tret.value]), None, flag
+
+    def _integrate_compiled(self, buf):
+        """
+        Compiled version of the loop in :meth:`_integrate_adaptive_steps`.
+        
+        :func:`cgp.cvodeint._steploop.adaptive_steps` calls CVode() directly 
+        and writes each step into the :class:`Stepbuffer` *buf* through raw 
+        pointers. It returns to Python only at the end, at a root, on error, 
+        or when the buffer is full or *maxsteps* is reached. 
+        Row 0 of *buf* must hold the initial state.
+        """
+        address = lambda p: ctypes.cast(p, ctypes.c_void_p).value
+        pointers = (address(self.cvode_mem.obj), address(self.y.data), 
+            ctypes.addressof(self.tret))
+        OK = cvode.CV_SUCCESS, cvode.CV_TSTOP_RETURN, cvode.CV_ROOT_RETURN
+        i = 1
+        flag = None
+        while self.tret.value < self.tstop:
+            if buf.offset + i >= self.maxsteps:
+                t, Y = buf.result(i)
+                raise CvodeException("Maximum number of steps exceeded", 
+                                     (t, Y, flag))
+            imax = int(min(len(buf), self.maxsteps - buf.offset))
+            i, flag = _steploop.adaptive_steps(*pointers + (buf.t, buf.Y, 
+                i, imax, self.tstop))
+            if flag not in OK:
+                log.debug("Exception: %s: %s" % (i, flags[flag]))
+                t, Y = buf.result(i)
+                raise CvodeException(flag, (t, Y, flag))
+            if flag == cvode.CV_ROOT_RETURN:
+                break
+            if i >= len(buf): # enlarge arrays by doubling, or spill to disk
+                i = buf.grow(i)
+        else: # also if the while loop was skipped because self.tret >= tstop
+            flag = cvode.CV_TSTOP_RETURN
+        t, Y = buf.result(i)
+        return t, Y, flag
+
+    def _append_step(self, traj, dky):
+        """
+        Append the interpolating polynomial of the last step to *traj*.
+        
+        The polynomial is expanded around the time of return, which is 
+        within the last step even after a root return. *dky* is a work vector.
+        """
+        tret = self.tret.value
+        q = cvode.CVodeGetLastOrder(self.cvode_mem)
+        coef = np.empty((q + 1, self.n))
+        for k in range(q + 1):
+            cvode.CVodeGetDky(self.cvode_mem, tret, k, dky)
+            coef[k] = dky
+            coef[k] /= factorial(k)
+        traj.append(tret, q, coef)
+    
+    def _integrate_fixed_steps(self, out=None):
         """
         Repeatedly call CVode() with task CV_ONE_STEP_TSTOP and tout=t[i]
         
@@ -809,8 +2399,11 @@ class Cvodeint(object):
             plt.plot(t, y, '.-')
         """
         imax = len(self.t)
-        Y = np.empty(shape=(imax, self.n))
-        t = np.empty(shape=(imax,))
+        if (out is not None) and (len(out[0]) >= imax):
+            t, Y = Stepbuffer(self.n, out=out).result(imax)
+        else:
+            Y = np.empty(shape=(imax, self.n))
+            t = np.empty(shape=(imax,))
         Y[0] = np.array(self.y).copy()
         t[0] = self.t0.value
         # tret = self.tret
@@ -830,14 +2423,199 @@ class Cvodeint(object):
                 continue
             else:
                 break
-        Y.resize((i + 1, self.n), refcheck=False)
-        t.resize(i + 1, refcheck=False)
-        result = t, Y, flag
+        result = t[:i + 1], Y[:i + 1], flag
         if flag in (cvode.CV_ROOT_RETURN, cvode.CV_SUCCESS):
             return result
         else:
             raise CvodeException(flag, result)
     
+    def _integrate_interpolated(self, out=None):
+        """
+        Fixed output times by interpolation within adaptive steps.
+        
+        Output: t, Y, flag. See :meth:`integrate`.
+        
+        :meth:`_integrate_fixed_steps` calls CVode() in ``CV_NORMAL`` mode 
+        once per output time, which is costly when output times are closer 
+        than the solver's steps. Here, CVode() takes one internal step at a 
+        time, and all output times within the step are filled from the 
+        solver's interpolating polynomial (the same one used by 
+        ``CV_NORMAL``), evaluated for all of them in one vectorized pass. 
+        As for :meth:`_integrate_fixed_steps`, *maxsteps* is ignored.
+        
+        >>> from example_ode import logistic_growth
+        >>> cvodeint = Cvodeint(logistic_growth, t=np.linspace(0, 2, 1001), 
+        ...     y=[0.1])
+        >>> t, Y, flag = cvodeint.integrate(interpolate=True)
+        >>> Y[[0, 500, 1000]].round(3)
+        array([[ 0.1  ],
+               [ 0.232],
+               [ 0.451]])
+        >>> flag
+        0
+        """
+        tout = np.asarray(self.t, dtype=float)
+        imax = len(tout)
+        if (out is not None) and (len(out[0]) >= imax):
+            t, Y = Stepbuffer(self.n, out=out).result(imax)
+        else:
+            Y = np.empty(shape=(imax, self.n))
+            t = np.empty(shape=(imax,))
+        Y[0] = self.y
+        t[0] = self.t0.value
+        cvode_mem = self.cvode_mem
+        tret = self.tret
+        y = self.y
+        dky = nv(np.zeros(self.n))
+        coef = np.empty((13, self.n)) # Taylor coefficients, order <= 12
+        OK = cvode.CV_SUCCESS, cvode.CV_TSTOP_RETURN, cvode.CV_ROOT_RETURN
+        flag = cvode.CV_SUCCESS
+        i = 1 # next output time to fill
+        while i < imax:
+            flag = cvode.CVode(cvode_mem, self.tstop, y, ctypes.byref(tret), 
+                cvode.CV_ONE_STE_TSTOP) # typo in pysundials
+            if flag not in OK:
+                raise CvodeException(flag, (t[:i], Y[:i], flag))
+            tn = tret.value
+            j = np.searchsorted(tout, tn, side="right")
+            if flag == cvode.CV_ROOT_RETURN:
+                # Output times before the root, then the root itself
+                j = np.searchsorted(tout, tn, side="left")
+            if j > i:
+                q = cvode.CVodeGetLastOrder(cvode_mem)
+                for k in range(q + 1):
+                    cvode.CVodeGetDky(cvode_mem, tn, k, dky)
+                    coef[k] = dky
+                    coef[k] /= factorial(k)
+                dt = (tout[i:j] - tn)[:, np.newaxis]
+                Yij = Y[i:j]
+                Yij[:] = coef[q]
+                for k in range(q - 1, -1, -1): # Horner's scheme
+                    Yij *= dt
+                    Yij += coef[k]
+                t[i:j] = tout[i:j]
+                i = j
+            if flag == cvode.CV_ROOT_RETURN:
+                Y[i], t[i] = y, tn
+                i += 1
+                break
+        else:
+            flag = cvode.CV_SUCCESS # as for CV_NORMAL mode
+        return t[:i], Y[:i], flag
+    
+    def set_events(self, events):
+        """
+        Initialize rootfinding for several named events at once.
+        
+        :param list events: :class:`Event` objects, or tuples or dicts of 
+            their arguments. An empty list disables rootfinding.
+        
+        The event functions are combined into one CVODE rootfinding 
+        function. Unlike plain rootfinding, :meth:`integrate` then records 
+        every crossing in attribute *crossings*, with the direction of 
+        crossing, and continues to integrate past non-terminal events. 
+        The events stay in effect for later calls to :meth:`integrate`, 
+        until rootfinding is changed by :meth:`RootInit`.
+        
+        Here, the van der Pol oscillator records every zero crossing of *x* 
+        and its extrema, stopping at the first maximum of *y*.
+        
+        >>> from example_ode import vdp
+        >>> cvodeint = Cvodeint(vdp, t=[0, 20], y=[1, 1])
+        >>> def x(t, y, gout, g_data):
+        ...     gout[0] = y[0]
+        ...     return 0
+        >>> events = [("x=0", x), Event("x extremum", cvodeint.ydoti(0)), 
+        ...     dict(name="y max", g=cvodeint.ydoti(1), direction=-1, 
+        ...     terminal=True)]
+        >>> t, Y, flag = cvodeint.integrate(events=events)
+        >>> for c in cvodeint.crossings:
+        ...     print "%.2f %s %s" % (c.t, c.name, c.direction)
+        0.69 x extremum -1
+        2.25 x=0 -1
+        3.46 x extremum 1
+        5.53 x=0 1
+        5.86 y max -1
+        >>> flag == cvode.CV_ROOT_RETURN, t[-1] == cvodeint.crossings[-1].t
+        (True, True)
+        """
+        events = [e if isinstance(e, Event) else 
+            Event(**e) if isinstance(e, dict) else Event(*e) for e in events]
+        if not events:
+            self.RootInit(0)
+            return
+        work = [0.0]
+        
+        @cvodefun
+        def g_rtfn(t, y, gout, g_data): # pylint: disable=W0613
+            """Evaluate all event functions."""
+            for k, event in enumerate(events):
+                event.g(t, y, work, event.g_data)
+                gout[k] = work[0]
+        
+        self.RootInit(len(events), g_rtfn)
+        self.events = events
+    
+    def _event_crossings(self):
+        """
+        Record the crossings at a root return; return True if one is terminal.
+        
+        The direction of each crossing is found by evaluating its event 
+        function just before and after the root, using CVODE's 
+        interpolating polynomial for the last step.
+        """
+        mem = self.cvode_mem
+        rootsfound = cvode.CVodeGetRootInfo(mem, len(self.events))
+        tret = self.tret.value
+        h = cvode.CVodeGetLastStep(mem)
+        tcur = cvode.CVodeGetCurrentTime(mem)
+        before, after = max(tret - 0.01 * h, tcur - h), min(tret + 0.01 * h, 
+            tcur)
+        stop = False
+        for found, event in zip(rootsfound, self.events):
+            if not found:
+                continue
+            direction = int(np.sign(self._event_value(event, after) - 
+                self._event_value(event, before)))
+            if event.direction and (direction != event.direction):
+                continue
+            self.crossings.append(Crossing(tret, np.array(self.y), 
+                event.name, direction))
+            if callable(event.terminal):
+                stop = event.terminal(self) or stop
+            else:
+                stop = event.terminal or stop
+        return stop
+    
+    def _event_value(self, event, t):
+        """
+        Value of the event function at time *t* within the last step.
+        
+        The state vector is set to the interpolated state while *g* is 
+        called, since some event functions read it rather than their 
+        argument (e.g. through a :class:`~.namedcvodeint.Recarraylink`).
+        """
+        y = np.array(self.y)
+        try:
+            cvode.CVodeGetDky(self.cvode_mem, t, 0, self.y)
+            work = [0.0]
+            event.g(t, self.y, work, event.g_data)
+            return work[0]
+        finally:
+            self.y[:] = y
+    
+    def _forbid_events(self, where):
+        """
+        Raise ValueError if :meth:`set_events` is in effect.
+        
+        Only adaptive steps (:meth:`_integrate_adaptive_steps`) continue 
+        past non-terminal events and record crossings; elsewhere an event 
+        would silently stop integration like plain rootfinding.
+        """
+        if self.events is not None:
+            raise ValueError("Events are not supported with %s; "
+                "disable them with RootInit(0)" % where)
+    
     def RootInit(self, nrtfn, g_rtfn=None, g_data=None):
         """
         Initialize rootfinding, disable rootfinding, or keep current settings.
@@ -870,10 +2648,98 @@ class Cvodeint(object):
         """
         if nrtfn is not None:
             cvode.CVodeRootInit(self.cvode_mem, int(nrtfn), g_rtfn, g_data)
+            self._rootinit = nrtfn, g_rtfn, g_data
+            self.events = None # see set_events
         elif (g_rtfn is not None) or (g_data is not None):
             raise CvodeException(
                 "If g_rtfn or g_data is given, nrtfn is required.")
+
+    def solverstats(self):
+        """
+        Current CVODE counters as a :class:`Solverstats` record.
+        
+        Counts are cumulative since the solver was last (re)initialized, 
+        which :meth:`integrate` does whenever it is given a new time 
+        interval or state. For the statistics of a single integration, use 
+        the *stats* attribute, and for totals over the lifetime of the 
+        object, *totals*.
+        
+        >>> from example_ode import vdp
+        >>> cvodeint = Cvodeint(vdp, t=[0, 20], y=[0, -2], time_rhs=True)
+        >>> t, y, flag = cvodeint.integrate()
+        >>> cvodeint.stats["nsteps"] == len(t) - 1
+        True
+        >>> cvodeint.stats["rhs_seconds"] < cvodeint.stats["seconds"]
+        True
+        >>> first = cvodeint.stats
+        >>> t, y, flag = cvodeint.integrate(t=30)
+        >>> cvodeint.totals["nsteps"] == first["nsteps"] + len(t) - 1
+        True
+        """
+        mem = self.cvode_mem
+        stats = Solverstats(
+            nsteps=cvode.CVodeGetNumSteps(mem),
+            nlinsetups=cvode.CVodeGetNumLinSolvSetups(mem),
+            netfails=cvode.CVodeGetNumErrTestFails(mem),
+            nniters=cvode.CVodeGetNumNonlinSolvIters(mem),
+            nncfails=cvode.CVodeGetNumNonlinSolvConvFails(mem),
+            hlast=cvode.CVodeGetLastStep(mem),
+            hcur=cvode.CVodeGetCurrentStep(mem),
+            tcur=cvode.CVodeGetCurrentTime(mem),
+            rhs_seconds=getattr(self.my_f_ode, "seconds", 0.0))
+        stats.update(self.jacobian_stats())
+        return stats
     
+    def _update_stats(self, before, start, accumulate=False):
+        """
+        Record statistics since the :meth:`solverstats` snapshot *before*.
+        
+        Sets *stats* (or adds to it if *accumulate*), and adds to *totals*. 
+        *start* is the wall-clock time when *before* was taken.
+        """
+        delta = self.solverstats() - before
+        delta["seconds"] = time.time() - start
+        self.stats = (self.stats + delta) if accumulate else delta
+        self.totals += delta
+        self.method_totals[self.method_used] += delta
+    
+    def jacobian_stats(self):
+        """
+        Count evaluations of the right-hand side and the Jacobian.
+
+        :return dict:
+            * **nfevals**: right-hand-side evaluations by the solver proper
+            * **nfevalsLS**: right-hand-side evaluations spent on
+              difference-quotient Jacobians (zero if *jac* was given)
+            * **njevals**: Jacobian evaluations (Jacobian-vector products
+              for the Krylov solver)
+
+        Counts are cumulative since the solver was last (re)initialized.
+
+        >>> from example_ode import vdp, vdp_jac
+        >>> cvodeint = Cvodeint(vdp, t=[0, 20], y=[0, -2], jac=vdp_jac)
+        >>> t, y, flag = cvodeint.integrate()
+        >>> stats = cvodeint.jacobian_stats()
+        >>> stats["njevals"] > 0, stats["nfevalsLS"]
+        (True, 0)
+        """
+        mem = self.cvode_mem
+        name = self.linsolver_choice.name
+        if self.method_used == "adams":
+            njevals = nfevalsLS = 0 # functional iteration, no linear solver
+        elif name == "dense":
+            njevals = cvode.CVDenseGetNumJacEvals(mem)
+            nfevalsLS = cvode.CVDenseGetNumRhsEvals(mem)
+        elif name == "band":
+            njevals = cvode.CVBandGetNumJacEvals(mem)
+            nfevalsLS = cvode.CVBandGetNumRhsEvals(mem)
+        else:
+            njevals = cvode.CVSpilsGetNumJtimesEvals(mem)
+            nfevalsLS = (cvode.CVSpilsGetNumRhsEvals(mem) + 
+                cvode.CVBandPrecGetNumRhsEvals(self.bp_data))
+        return dict(nfevals=cvode.CVodeGetNumRhsEvals(mem),
+            nfevalsLS=nfevalsLS, njevals=njevals)
+
     def __repr__(self):
         """
         String representation of Cvodeint object
@@ -149,12 +149,97 @@ def const_growth_sol(t, y0, k=1):
     """
     return y0 + k * t
 
+def markov_chain(t, y, ydot, f_data, k=1):
+    """
+    Linear chain of states with rate constant *k* between neighbours.
+    
+    Each rate depends only on its neighbours, so the Jacobian is tridiagonal. 
+    This is the structure of a simple Markov model of an ion channel.
+    
+    >>> t, y, ydot, f_data = 0, [1, 0, 0], [0, 0, 0], None
+    >>> markov_chain(t, y, ydot, f_data); ydot
+    [-1, 1, 0]
+    """
+    n = len(y)
+    for i in range(n):
+        flux = 0
+        if i > 0:
+            flux += k * (y[i - 1] - y[i])
+        if i < n - 1:
+            flux += k * (y[i + 1] - y[i])
+        ydot[i] = flux
+
 eps = [1]
 def vdp(t, y, ydot, f_data):
     """van der Pol equation"""
     ydot[0] = y[1]
     ydot[1] = eps[0] * (1 - y[0] * y[0]) * y[1] - y[0]
 
+def vdp_jac(t, y, fy, J, jac_data):
+    """
+    Jacobian of the van der Pol equation, see :func:`~cgp.cvodeint.core.jacfun`.
+    
+    >>> import numpy as np
+    >>> J = np.zeros((2, 2))
+    >>> vdp_jac(0, [2, 1], None, J, None); J
+    array([[ 0.,  1.],
+           [-5., -3.]])
+    """
+    J[0, 1] = 1
+    J[1, 0] = -2 * eps[0] * y[0] * y[1] - 1
+    J[1, 1] = eps[0] * (1 - y[0] * y[0])
+
+def stiff_vdp(t, y, ydot, f_data, mu=1000):
+    """
+    van der Pol equation with a large damping parameter *mu*, which is stiff.
+    
+    >>> t, y, ydot, f_data = 0, [2, 1], [0, 0], None
+    >>> stiff_vdp(t, y, ydot, f_data, mu=1); ydot
+    [1, -5]
+    """
+    ydot[0] = y[1]
+    ydot[1] = mu * (1 - y[0] * y[0]) * y[1] - y[0]
+
+def robertson(t, y, ydot, f_data):
+    """
+    Robertson's chemical kinetics, a classic stiff test problem.
+    
+    Use initial state [1, 0, 0]. The second component stays below 4e-5, 
+    so it needs a small absolute tolerance. The rates sum to zero.
+    
+    >>> t, y, ydot, f_data = 0, [1.0, 0.0, 0.0], [0, 0, 0], None
+    >>> robertson(t, y, ydot, f_data); ydot
+    [-0.04, 0.04, 0.0]
+    """
+    r1 = 0.04 * y[0]
+    r2 = 1e4 * y[1] * y[2]
+    r3 = 3e7 * y[1] * y[1]
+    ydot[0] = -r1 + r2
+    ydot[1] = r1 - r2 - r3
+    ydot[2] = r3
+
+def hires(t, y, ydot, f_data):
+    """
+    HIRES ("high irradiance responses") of photomorphogenesis in plants.
+    
+    A stiff problem with 8 state variables from the test set of Hairer & 
+    Wanner (1996), usually integrated over [0, 321.8122] from the initial 
+    state [1, 0, 0, 0, 0, 0, 0, 0.0057].
+    
+    >>> t, y, ydot, f_data = 0, [1, 0, 0, 0, 0, 0, 0, 0.0057], [0] * 8, None
+    >>> hires(t, y, ydot, f_data); ydot
+    [-1.7093, 1.71, 0.0, 0.0, 0.0, 0.0, 0.0, -0.0]
+    """
+    ydot[0] = -1.71 * y[0] + 0.43 * y[1] + 8.32 * y[2] + 0.0007
+    ydot[1] = 1.71 * y[0] - 8.75 * y[1]
+    ydot[2] = -10.03 * y[2] + 0.43 * y[3] + 0.035 * y[4]
+    ydot[3] = 8.32 * y[1] + 1.71 * y[2] - 1.12 * y[3]
+    ydot[4] = -1.745 * y[4] + 0.43 * y[5] + 0.43 * y[6]
+    ydot[5] = (-280 * y[5] * y[7] + 0.69 * y[3] + 1.71 * y[4] - 0.43 * y[5] 
+        + 0.69 * y[6])
+    ydot[6] = 280 * y[5] * y[7] - 1.81 * y[6]
+    ydot[7] = -ydot[6]
+
 
 if __name__ == "__main__":
     import doctest
@@ -3,11 +3,18 @@
 from contextlib import contextmanager
 from collections import namedtuple
 
+from pysundials import cvode
 import numpy as np
 
-from .core import Cvodeint
+from .core import Cvodeint, CvodeException, nv
+from .trajectory import Trajectory
 from ..utils.dotdict import Dotdict
 
+# Absolute tolerances from Namedcvodeint.calibrate_abstol(), keyed by
+# Namedcvodeint._abstol_key(). Assign a shelve object to keep them across
+# sessions.
+calibrated_abstol = {}
+
 class Namedcvodeint(Cvodeint):
     """
     Cvode wrapper with named state variables and parameters.
@@ -105,6 +112,11 @@ class Namedcvodeint(Cvodeint):
         Nt = namedtuple("Example", "ode t y p")
         return Nt(vanderpol, t, y, p)
     
+    in_thread = False # whether this is a clone for tmap(), see _thread_clone
+    # (address, pr, work arrays...) of a compiled right-hand side for tmap(), 
+    # see Cvodeint._set_c_rhs
+    nogil_rhs = None
+    
     def __init__(self, f_ode=None, t=None, y=None, p=None, 
         *args, **kwargs):
         if f_ode is None:
@@ -116,6 +128,15 @@ class Namedcvodeint(Cvodeint):
             # Simplest array that allows copying and [:] assignment, etc.
             # Shape (), dtype float, no dtype.names
             p = np.zeros(0)
+        # abstol="calibrated": reuse or compute a calibrated vector abstol
+        calibrate = isinstance(kwargs.get("abstol"), basestring)
+        if calibrate:
+            if kwargs["abstol"] != "calibrated":
+                raise ValueError("abstol must be a number, an array or "
+                    "'calibrated', not %r" % kwargs["abstol"])
+            key = self._abstol_key(f_ode, y.dtype)
+            calibrate = key not in calibrated_abstol
+            kwargs["abstol"] = 1e-8 if calibrate else calibrated_abstol[key]
         super(Namedcvodeint, self).__init__(f_ode, t, y.view(float), 
             *args, **kwargs)
         self.yr = Recarraylink(self.y, y.dtype)
@@ -132,6 +153,139 @@ class Namedcvodeint(Cvodeint):
         """
         self.originals = dict(pr=self.pr, y=self.y, yr=self.yr)
         self.dtype = Dotdict(y=y.dtype, p=p.dtype)
+        if calibrate:
+            self.calibrate_abstol()
+    
+    def __getstate__(self):
+        """
+        Compact state for pickling; adds the parameter values.
+        
+        >>> import pickle
+        >>> vdp = Namedcvodeint()
+        >>> vdp.pr.epsilon = 2.0
+        >>> pickle.loads(pickle.dumps(vdp)).pr.epsilon
+        array([ 2.])
+        """
+        state = super(Namedcvodeint, self).__getstate__()
+        state["pr"] = np.copy(self.pr)
+        return state
+    
+    def __setstate__(self, state):
+        """Restore state from :meth:`__getstate__`."""
+        super(Namedcvodeint, self).__setstate__(state)
+        self.pr[:] = state["pr"]
+    
+    def _clone_instance(self, f_ode, t, y, **kwargs):
+        """
+        Construct the object returned by :meth:`clone`.
+        
+        The clone is a plain :class:`Namedcvodeint` sharing the parameter 
+        array *pr* with this object, unless another is passed as keyword 
+        argument *p*. *y* may be a plain or record array.
+        
+        >>> vdp = Namedcvodeint()
+        >>> c = vdp.clone(y=[1.0, 2.0])
+        >>> c.yr.y, c.pr is vdp.pr
+        (array([ 2.]), True)
+        """
+        y = np.asarray(y)
+        if y.dtype.names is None:
+            y = y.astype(float).view(self.dtype.y)
+        p = kwargs.pop("p", self.pr)
+        return Namedcvodeint(f_ode, t, y, p, **kwargs)
+    
+    def _breakpoint_update(self, update):
+        """
+        Function to call at a breakpoint; a dict gives new parameter values.
+        
+        See :meth:`~cgp.cvodeint.core.Cvodeint.integrate`. Parameter 
+        changes remain in effect after the integration.
+        
+        >>> vdp = Namedcvodeint()
+        >>> with vdp.autorestore():
+        ...     t, Yr, flag = vdp.integrate(t=[0, 2], 
+        ...         breakpoints=[(1, dict(epsilon=3))])
+        ...     vdp.pr.epsilon
+        array([ 3.])
+        """
+        if isinstance(update, dict):
+            values = update
+            def update(self):
+                """Set parameter values at a breakpoint."""
+                for k, v in values.items():
+                    self.pr[k] = v
+        return super(Namedcvodeint, self)._breakpoint_update(update)
+    
+    def _abstol_key(self, f_ode=None, dtype=None):
+        """
+        Key for this model in :data:`calibrated_abstol`.
+        
+        The model name if available, else the name of the right-hand side, 
+        plus the names of the state variables.
+        
+        >>> Namedcvodeint()._abstol_key()
+        'vanderpol:x,y'
+        """
+        if f_ode is None:
+            f_ode = self.f_ode
+        if dtype is None:
+            dtype = self.dtype.y
+        name = getattr(self, "name", None) or f_ode.__name__
+        return "%s:%s" % (name, ",".join(dtype.names))
+    
+    def calibrate_abstol(self, t=None, scale=None, floor=1e-12, cache=None):
+        """
+        Set a vector *abstol* from the typical magnitude of each state variable.
+        
+        :param array_like t: Time span of the calibration run; default 
+            ``self.t``. It should be long enough for each state variable to 
+            take values of its typical size, e.g. one action potential.
+        :param float scale: abstol for each state variable is *scale* times 
+            its largest absolute value during the calibration run. Default: 
+            *reltol*, so that error is controlled relative to the typical 
+            magnitude even when a variable passes close to zero.
+        :param float floor: Lower bound on abstol, for variables that stay 
+            at zero.
+        :param dict cache: Store the result here under :meth:`_abstol_key`; 
+            default :data:`calibrated_abstol`.
+        :return: abstol as a record array with the fields of ``self.dtype.y``.
+        
+        A single scalar abstol is too strict for variables in large units 
+        (e.g. mV) and too loose for small ones (e.g. concentrations in mM).
+        Calibrated tolerances give similar accuracy in fewer steps than 
+        tightening tolerances all round. Time, state and parameters are 
+        restored after the calibration run, and rootfinding is cleared, 
+        as for :meth:`autorestore`.
+        
+        Models constructed with ``abstol="calibrated"`` reuse the stored 
+        tolerances, calibrating on first use.
+        
+        >>> vdp = Namedcvodeint(t=[0, 10])
+        >>> abstol = vdp.calibrate_abstol(cache={})
+        >>> abstol.dtype == vdp.dtype.y
+        True
+        >>> (abstol.view(float) / vdp.reltol).round(1)
+        array([ 2. ,  2.7])
+        >>> vdp.yr.x, vdp.itol == cvode.CV_SV
+        (array([-2.]), True)
+        """
+        if scale is None:
+            scale = self.reltol
+        if cache is None:
+            cache = calibrated_abstol
+        if t is None:
+            t = self.t # before autorestore() re-initializes at current time
+        with self.autorestore():
+            _t, Y, _flag = super(Namedcvodeint, self).integrate(t=t)
+            abstol = np.maximum(scale * abs(Y).max(axis=0), floor)
+            # The ReInit on leaving autorestore() puts abstol into effect
+            if self.itol == cvode.CV_SV:
+                self.abstol[:] = abstol
+            else:
+                self.abstol = nv(abstol)
+                self.itol = cvode.CV_SV
+        cache[self._abstol_key()] = abstol
+        return abstol.view(self.dtype.y, np.recarray)
     
     def ydoti(self, index):
         """
@@ -184,9 +338,268 @@ class Namedcvodeint(Cvodeint):
         if not all(self.__dict__[k] is v for k, v in self.originals.items()):
             raise AssertionError(self.reassignwarning)
         t, Y, flag = super(Namedcvodeint, self).integrate(**kwargs)
+        if isinstance(Y, Trajectory):
+            Y.dtype = self.dtype.y # evaluate to record arrays
+            return t, Y, flag
         Yr = Y.view(self.dtype.y, np.recarray)
         return t, Yr, flag
     
+    def iterate(self, **kwargs):
+        """
+        Generator of blocks *(t, Yr, flag)*, with state as recarray.
+        
+        :parameters: See :meth:`cgp.cvodeint.core.Cvodeint.iterate`
+        
+        >>> vdp = Namedcvodeint()
+        >>> for t, Yr, flag in vdp.iterate(t=np.linspace(0, 1, 5), chunk=3):
+        ...     print Yr.x.squeeze().round(3)
+        [-2.    -1.951 -1.838]
+        [-1.688 -1.508]
+        """
+        if not all(self.__dict__[k] is v for k, v in self.originals.items()):
+            raise AssertionError(self.reassignwarning)
+        for t, Y, flag in super(Namedcvodeint, self).iterate(**kwargs):
+            yield t, Y.view(self.dtype.y, np.recarray), flag
+    
+    def ensemble(self, y=None, p=None, **kwargs):
+        """
+        Integrate many initial states and/or parameter sets in one session.
+
+        :param array_like y: Initial states, one per member; plain (N, n)
+            array or record array with the fields of ``self.dtype.y``.
+            Default: the current state for every member.
+        :param array_like p: Parameter sets, one per member; plain
+            (N, nparam) array or record array with the fields of
+            ``self.dtype.p``. Default: the current parameters.
+        :parameters: Further arguments as for
+            :meth:`cgp.cvodeint.core.Cvodeint.ensemble`
+        :return tuple: As for :meth:`cgp.cvodeint.core.Cvodeint.ensemble`,
+            but with states as record arrays.
+
+        State and parameters are restored afterwards.
+
+        >>> vdp = Namedcvodeint()
+        >>> p = np.tile(vdp.pr, 3)
+        >>> p["epsilon"] = 0.5, 1.0, 2.0
+        >>> t, Yr, flag = vdp.ensemble(p=p, t=np.linspace(0, 1, 5))
+        >>> Yr.shape
+        (3, 5, 1)
+        >>> Yr.x[:, -1].round(3)
+        array([[-1.335],
+               [-1.508],
+               [-1.698]])
+        >>> vdp.pr.epsilon
+        array([ 1.])
+        """
+        if not all(self.__dict__[k] is v for k, v in self.originals.items()):
+            raise AssertionError(self.reassignwarning)
+        if y is None:
+            N = 1 if p is None else len(p)
+            y = np.tile(np.array(self.y), (N, 1))
+        y = np.asanyarray(y)
+        if y.dtype.names:
+            y = y.view(float).reshape(len(y), -1)
+        with self.autorestore():
+            t, Y, flag = super(Namedcvodeint, self).ensemble(y, p, **kwargs)
+        if isinstance(Y, list):
+            Yr = [Yi.view(self.dtype.y, np.recarray) for Yi in Y]
+        else:
+            Yr = Y.view(self.dtype.y, np.recarray)
+        return t, Yr, flag
+
+    def pmap(self, func, params, processes=None, chunksize=None):
+        """
+        Evaluate *func(model)* for each parameter set, in parallel processes.
+        
+        :param function func: Function of a model object, called with the 
+            parameters of one row of *params* in effect. Must be picklable, 
+            i.e. defined at module level. State, time and parameters are 
+            restored after each call, so every row starts from the same 
+            initial state.
+        :param array_like params: (N, nparam) plain array or record array 
+            with the fields of ``self.dtype.p``.
+        :param int processes: Number of worker processes; default: all 
+            CPUs. With ``processes=1``, rows are evaluated in this process.
+        :param int chunksize: Rows per task; default: enough for about four 
+            tasks per process.
+        :return: Results stacked into an array; a record array if *func* 
+            returns record arrays or structured scalars.
+        
+        Each worker gets its own copy of the model once, when the pool 
+        starts (by forking where available, otherwise by pickling; see 
+        :meth:`~cgp.cvodeint.core.Cvodeint.__reduce__` on reusing compiled 
+        model modules). After that, only parameter rows and results are 
+        sent between processes.
+        
+        >>> vdp = Namedcvodeint()
+        >>> p = np.tile(vdp.pr, 3)
+        >>> p["epsilon"] = 0.5, 1.0, 2.0
+        >>> vdp.pmap(lambda model: 2 * model.pr.epsilon, p, processes=1)
+        array([[ 1.],
+               [ 2.],
+               [ 4.]])
+        """
+        params = np.asanyarray(params)
+        if params.ndim < 2 and not params.dtype.names:
+            params = params.reshape(1, -1)
+        N = len(params)
+        if processes is None:
+            import multiprocessing
+            processes = multiprocessing.cpu_count()
+        processes = max(1, min(processes, N))
+        if chunksize is None:
+            chunksize = max(1, -(-N // (4 * processes))) # ceiling division
+        chunks = [params[i:i + chunksize] for i in range(0, N, chunksize)]
+        if processes == 1:
+            results = [_pmap_chunk(func, chunk, self) for chunk in chunks]
+        else:
+            import multiprocessing
+            pool = multiprocessing.Pool(processes, _pmap_init, (self,))
+            try:
+                results = pool.map(_pmap_apply, [(func, chunk) 
+                    for chunk in chunks], chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        return _stack([r for chunk in results for r in chunk])
+    
+    def tmap(self, func, params, threads=None):
+        """
+        Evaluate *func(model)* for each parameter set, in parallel threads.
+        
+        Arguments and return value are as for :meth:`pmap`, but *func* 
+        need not be picklable, and nothing is copied between processes. 
+        Each thread works on its own clone of this object, with a private 
+        parameter array and a compiled right-hand side that CVODE calls 
+        without the GIL (see 
+        :meth:`~cgp.cvodeint.core.Cvodeint._set_c_rhs`). This object itself 
+        keeps its Python right-hand side. This requires a 
+        :class:`~cgp.physmod.cellmlmodel.Cellmlmodel` with a Cython-compiled 
+        model module, which sets attribute *nogil_rhs*, and the compiled 
+        loop of :mod:`cgp.cvodeint._steploop`; otherwise 
+        :exc:`CvodeException` is raised.
+        
+        The Python right-hand side of the model keeps its parameters in 
+        module-level arrays, which the threads cannot share. *func* may 
+        therefore only integrate: Python rate evaluation (e.g. 
+        :meth:`rates`, :meth:`ydoti` or the Jacobian estimate of 
+        ``method="auto"``), rootfinding and events raise 
+        :exc:`CvodeException` on the clones. Use :meth:`pmap` for such work.
+        
+        >>> vdp = Namedcvodeint()
+        >>> vdp.tmap(lambda model: model.integrate(), vdp.pr) # doctest: +ELLIPSIS
+        Traceback (most recent call last):
+        CvodeException: tmap() needs a compiled right-hand side...
+        """
+        from .core import _steploop
+        if (self.nogil_rhs is None) or (_steploop is None):
+            raise CvodeException("tmap() needs a compiled right-hand side "
+                "and the compiled loop; see Cellmlmodel(use_cython=True) "
+                "and cgp/cvodeint/setup_steploop.py")
+        import Queue
+        from multiprocessing.pool import ThreadPool
+        params = np.asanyarray(params)
+        if params.ndim < 2 and not params.dtype.names:
+            params = params.reshape(1, -1)
+        if threads is None:
+            import multiprocessing
+            threads = multiprocessing.cpu_count()
+        threads = max(1, min(threads, len(params)))
+        clones = Queue.Queue()
+        for _i in range(threads):
+            clones.put(self._thread_clone())
+        def apply(p):
+            """Evaluate one row with a clone that no other thread is using."""
+            model = clones.get()
+            try:
+                return _pmap_chunk(func, [p], model)[0]
+            finally:
+                clones.put(model)
+        pool = ThreadPool(threads)
+        try:
+            results = pool.map(apply, list(params), chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+            while not clones.empty():
+                clones.get().release()
+        return _stack(results)
+    
+    def _thread_clone(self):
+        """
+        Clone for :meth:`tmap`, with its own compiled right-hand side data.
+        
+        The clone gets a copy of the parameter array *pr*, and of the work 
+        arrays in *nogil_rhs*. The Python right-hand side would use the 
+        arrays of this object, so the clone gets :func:`_thread_rhs` 
+        instead, and refuses rootfinding. Timing the right-hand side 
+        (*time_rhs*) needs the Python one and is turned off.
+        """
+        if self.jac is not None:
+            raise CvodeException("tmap() cannot use a Python Jacobian")
+        address, work = self.nogil_rhs[0], self.nogil_rhs[2:]
+        pr = np.copy(self.pr).view(np.recarray)
+        clone = self.clone(p=pr, time_rhs=False)
+        clone._set_c_rhs(address, pr, *[np.copy(a) for a in work])
+        clone.f_ode = clone.my_f_ode = _thread_rhs
+        clone.in_thread = True
+        return clone
+    
+    def RootInit(self, nrtfn, g_rtfn=None, g_data=None):
+        """
+        As :meth:`~cgp.cvodeint.core.Cvodeint.RootInit`, but refused in 
+        :meth:`tmap` threads.
+        """
+        if self.in_thread and nrtfn:
+            raise CvodeException(
+                "Rootfinding and events are not available in tmap() threads")
+        super(Namedcvodeint, self).RootInit(nrtfn, g_rtfn, g_data)
+    
+    def _set_parameters(self, p):
+        """Set parameters for one :meth:`ensemble` member (record or plain)."""
+        p = np.asanyarray(p)
+        if p.dtype.names:
+            self.pr[:] = p
+        else:
+            self.pr.view(float)[:] = p
+
+    def _get_parameters(self):
+        """Return a copy of the parameters as a plain float vector."""
+        return np.copy(self.pr).view(float)
+    
+    def sensitivities(self, names, **kwargs):
+        """
+        Integrate with forward sensitivities to the named parameters.
+        
+        :param list names: Names of parameters in ``self.dtype.p``.
+        :parameters: Further arguments as for 
+            :meth:`cgp.cvodeint.core.Cvodeint.sensitivities`
+        :return tuple: 
+            * **t** : time vector
+            * **Yr** : state recarray, as for :meth:`integrate`
+            * **Sr** : sensitivity recarray with the fields of 
+              ``self.dtype.y``; ``Sr.V[i, j]`` is the derivative of *V* at 
+              time ``t[i]`` with respect to parameter ``names[j]``
+            * **flag** : last flag returned by CVode
+        
+        >>> vdp = Namedcvodeint()
+        >>> t, Yr, Sr, flag = vdp.sensitivities(["epsilon"])
+        >>> Sr.shape == (len(t), 1)
+        True
+        >>> Sr.y[-1].round(3)
+        array([-0.588])
+        """
+        if not all(self.__dict__[k] is v for k, v in self.originals.items()):
+            raise AssertionError(self.reassignwarning)
+        if isinstance(names, basestring):
+            names = [names]
+        index = [self.dtype.p.names.index(k) for k in names]
+        t, Y, S, flag = super(Namedcvodeint, self).sensitivities(index, 
+            **kwargs)
+        Yr = Y.view(self.dtype.y, np.recarray)
+        Sr = S.view(self.dtype.y, np.recarray)[..., 0]
+        return t, Yr, Sr, flag
+
     @contextmanager
     def autorestore(self, _p=None, _y=None, **kwargs):
         """
@@ -296,7 +709,10 @@ class Namedcvodeint(Cvodeint):
         False
         
         However, changes in state are copied to the original on exiting the 
-        'with' block.
+        'with' block. The clamped model is a :meth:`clone` of the original, 
+        and its solver object is :meth:`released <release>` on exit, so that 
+        repeated clamping (e.g. one pulse after another) does not allocate 
+        new CVODE memory each time.
         
         >>> vdp.yr.x
         array([ 0.5])
@@ -339,11 +755,9 @@ class Namedcvodeint(Cvodeint):
         for k, v in kwargs.items():
             y[k] = v
         
-        # Use original options when rerunning the Cvodeint initialization.
-        oldkwargs = dict((k, getattr(self, k)) 
-            for k in "chunksize maxsteps reltol abstol".split())
-        
-        clamped = Namedcvodeint(clamped, self.t, y, self.pr, **oldkwargs)
+        # The new RHS calls the validated one; an analytic Jacobian of the 
+        # original would ignore the clamping.
+        clamped = self.clone(clamped, y=y, validate=False, jac=None)
         
         # Disable any hard-coded stimulus protocol
         if "stim_amplitude" in clamped.dtype.p.names:
@@ -355,6 +769,7 @@ class Namedcvodeint(Cvodeint):
             for k in clamped.dtype.y.names:
                 if k in self.dtype.y.names:
                     setattr(self.yr, k, getattr(clamped.yr, k))
+            clamped.release()
     
     def rates(self, t, y, par=None):
         """
@@ -380,6 +795,40 @@ class Namedcvodeint(Cvodeint):
         ydot = ydot.squeeze().view(self.dtype.y, np.recarray)
         return ydot
 
+# Model object of a pmap() worker process, set once by _pmap_init()
+_pmap_model = None
+
+def _pmap_init(model):
+    """Initialize a :meth:`Namedcvodeint.pmap` worker process."""
+    global _pmap_model # pylint: disable=W0603
+    _pmap_model = model
+
+def _pmap_apply(args):
+    """Evaluate a chunk of a :meth:`Namedcvodeint.pmap` in a worker."""
+    func, chunk = args
+    return _pmap_chunk(func, chunk, _pmap_model)
+
+def _pmap_chunk(func, chunk, model):
+    """Evaluate *func(model)* for each parameter row in *chunk*."""
+    results = []
+    for p in chunk:
+        with model.autorestore():
+            model._set_parameters(p)
+            results.append(func(model))
+    return results
+
+def _thread_rhs(t, y, ydot, f_data):
+    """Python right-hand side of :meth:`Namedcvodeint.tmap` clones."""
+    raise CvodeException("Python rates are not available in tmap() threads; "
+        "use pmap() instead")
+
+def _stack(results):
+    """Stack :meth:`Namedcvodeint.pmap` results, as a recarray if possible."""
+    if all(getattr(np.asanyarray(r).dtype, "names", None) for r in results):
+        return np.concatenate([np.atleast_1d(r) for r in results]).view(
+            np.recarray)
+    return np.array(results)
+
 class Recarraylink(object):
     """
     Dynamic link between a Numpy recarray and any array-like object.
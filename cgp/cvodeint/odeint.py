@@ -34,7 +34,7 @@ def odeint(func, y0_in, t_in, args=()):
         ydot[:] = func(y, t, args) if args else func(y, t)
         return 0
     cvodeint = Cvodeint(ode, t_in, y0_in)
-    result = cvodeint.integrate()
+    result = cvodeint.integrate(interpolate=True)
     return result[1]
 
 
@@ -0,0 +1,146 @@
+"""
+Parallel-in-time integration by the parareal algorithm (experimental).
+
+The time interval is split into slices. A coarse propagator *G*, the model at
+loose tolerances, sweeps serially across all slices. Fine propagators *F*,
+the model at its own tolerances, integrate all slices concurrently in a pool
+of processes, each from the slice's initial state in the previous iteration.
+The states at slice boundaries are then corrected by
+
+    U[i+1] = G(U[i]) + F(U_old[i]) - G(U_old[i])
+
+(:doi:`Lions et al. 2001 <10.1016/S0764-4442(00)01793-6>`;
+:doi:`Gander and Vandewalle 2007 <10.1137/05064607X>`). After *k*
+iterations the first *k* slices equal the serial fine solution, so
+iteration can stop when the boundary states no longer change.
+Wall-clock time is saved only if this happens in far fewer iterations than
+there are slices, and if *G* is much cheaper than *F*.
+
+>>> from cgp.cvodeint.core import Cvodeint
+>>> from example_ode import vdp
+>>> cvodeint = Cvodeint(vdp, t=[0, 4], y=[0, -2])
+>>> T, U, niter = parareal(cvodeint, nslices=4, processes=1)
+>>> T
+array([ 0.,  1.,  2.,  3.,  4.])
+>>> t, Y, flag = cvodeint.integrate(t=[0, 4], y=[0, -2])
+>>> bool(np.allclose(U[-1], Y[-1], rtol=1e-5, atol=1e-5)), niter <= 4
+(True, True)
+"""
+
+import numpy as np
+from pysundials import cvode
+
+__all__ = ("parareal",)
+
+def parareal(integrator, t=None, y=None, nslices=None, breakpoints=None,
+    coarse_tolfactor=100.0, rtol=None, atol=None, maxiter=None,
+    processes=None):
+    """
+    Integrate by the parareal algorithm, in parallel over time slices.
+
+    :param integrator: :class:`~cgp.cvodeint.core.Cvodeint` or subclass
+        instance. It is cloned for the coarse and fine propagators, and its
+        own time and state are left unchanged.
+    :param array_like t: Either [start, end] (default: ``integrator.t``),
+        to be split into *nslices* equal slices, or slice boundaries.
+    :param array_like y: Initial state; default: the current state.
+    :param int nslices: Number of slices if *t* is [start, end]; default:
+        one per process.
+    :param list breakpoints: Times passed to
+        :meth:`~cgp.cvodeint.core.Cvodeint.integrate` for each slice.
+        Each slice uses the breakpoints inside it. Updates at breakpoints
+        are not supported, as slices are not integrated in order.
+    :param float coarse_tolfactor: The coarse propagator uses tolerances
+        this many times those of *integrator*.
+    :param float rtol, atol: Iteration stops when successive iterates of
+        the boundary states agree within these tolerances, see
+        :func:`numpy.allclose`. Default: ten times the tolerances of
+        *integrator*.
+    :param int maxiter: Maximum number of iterations; default *nslices*,
+        for which the result equals that of the fine propagator applied
+        serially. With ``maxiter=0``, the coarse solution is returned.
+    :param int processes: Number of worker processes for the fine
+        propagators; default: all CPUs. With ``processes=1``, slices are
+        integrated in this process.
+    :return tuple:
+        * **T**: slice boundaries
+        * **U**: states at the slice boundaries; *U[-1]* is the final state
+        * **niter**: number of iterations used
+
+    Rootfinding is disabled in both propagators.
+    """
+    if t is None:
+        t = integrator.t
+    if y is None:
+        y = np.array(integrator.y)
+    if processes is None:
+        import multiprocessing
+        processes = multiprocessing.cpu_count()
+    T = np.array(t, dtype=float)
+    if len(T) <= 2:
+        T = np.linspace(T[0], T[-1], (nslices or processes) + 1)
+    N = len(T) - 1
+    if maxiter is None:
+        maxiter = N
+    if any(isinstance(b, tuple) for b in breakpoints or ()):
+        raise ValueError("Parareal does not support breakpoint updates")
+    abstol = np.array(integrator.abstol.value if
+        isinstance(integrator.abstol, cvode.realtype) else integrator.abstol)
+    if rtol is None:
+        rtol = 10 * integrator.reltol
+    if atol is None:
+        atol = 10 * abstol
+    coarse = integrator.clone(reltol=coarse_tolfactor * integrator.reltol,
+        abstol=coarse_tolfactor * abstol)
+    fine = integrator.clone()
+
+    U = np.empty((N + 1, integrator.n))
+    U[0] = np.array(y, dtype=float).ravel()
+    G = np.empty((N, integrator.n)) # coarse result for each slice
+    for i in range(N):
+        G[i] = U[i + 1] = _propagate(coarse, T[i], T[i + 1], U[i], 
+            breakpoints)
+
+    if processes > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(processes, N), _parareal_init, (fine,))
+    k = 0
+    try:
+        for k in range(1, maxiter + 1):
+            # Slices before k - 1 start from converged states
+            tasks = [(T[i], T[i + 1], U[i], breakpoints) 
+                for i in range(k - 1, N)]
+            if processes > 1:
+                F = pool.map(_parareal_apply, tasks, chunksize=1)
+            else:
+                F = [_propagate(fine, *task) for task in tasks]
+            Uold = U.copy()
+            for i, Fi in zip(range(k - 1, N), F):
+                Gi = _propagate(coarse, T[i], T[i + 1], U[i], breakpoints)
+                U[i + 1] = Gi + Fi - G[i]
+                G[i] = Gi
+            if np.allclose(U, Uold, rtol=rtol, atol=atol):
+                break
+    finally:
+        if processes > 1:
+            pool.close()
+            pool.join()
+    return T, U, k
+
+def _propagate(integrator, t0, t1, y0, breakpoints=None):
+    """State at time *t1*, integrating from *y0* at time *t0*."""
+    integrator.integrate(t=[t0, t1], y=y0, nrtfn=0, breakpoints=breakpoints,
+        record=dict(dt=np.inf)) # record only the first and last step
+    return np.array(integrator.y)
+
+# Fine propagator in a worker process
+_parareal_integrator = None
+
+def _parareal_init(integrator):
+    """Initialize a :func:`parareal` worker process."""
+    global _parareal_integrator # pylint: disable=W0603
+    _parareal_integrator = integrator
+
+def _parareal_apply(args):
+    """Fine propagation of one slice in a :func:`parareal` worker."""
+    return _propagate(_parareal_integrator, *args)
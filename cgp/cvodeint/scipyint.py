@@ -0,0 +1,325 @@
+"""
+Integrator backend using :mod:`scipy.integrate` instead of CVODE.
+
+:class:`Scipyint` takes the same arguments as
+:class:`~cgp.cvodeint.core.Cvodeint`, and its :meth:`~Scipyint.integrate`
+follows the same conventions for the time argument *t*, resuming from the
+current state, rootfinding with CVODE-style functions
+*g_rtfn(t, y, gout, g_data)*, return flags and
+:exc:`~cgp.cvodeint.common.CvodeException`. Thus either backend can 
+integrate a given right-hand side *f_ode(t, y, ydot, f_data)*; see
+:mod:`cgp.cvodeint.benchmark` for comparing them. This module needs only 
+:mod:`cgp.cvodeint.common`, not :mod:`pysundials`. The model classes can 
+use it through the *backend* argument of 
+:class:`~cgp.cvodeint.core.Cvodeint`.
+
+The solver classes behind :func:`scipy.integrate.solve_ivp` (LSODA, BDF,
+Radau, RK45, ...) are stepped one internal step at a time, just as
+:class:`~cgp.cvodeint.core.Cvodeint` steps CVODE. Output at fixed times and
+roots are computed from each step's interpolating polynomial, as
+:func:`~scipy.integrate.solve_ivp` does, but without giving up the partial
+solution if the right-hand side fails.
+
+>>> from example_ode import logistic_growth, logistic_growth_sol
+>>> s = Scipyint(logistic_growth, t=[0, 2], y=[0.1])
+>>> t, Y, flag = s.integrate()
+>>> err = Y.squeeze() - logistic_growth_sol(t, Y[0])
+>>> bool(abs(err).max() < 1e-6), t[-1], flag_name(flag)
+(True, 2.0, 'CV_TSTOP_RETURN')
+"""
+
+import time
+
+import numpy as np
+
+from .common import (CvodeException, Solverstats, cvodefun, flag_name, 
+    CV_SUCCESS, CV_TSTOP_RETURN, CV_ROOT_RETURN, CV_ERR_FAILURE, 
+    CV_RHSFUNC_FAIL)
+
+__all__ = ("Scipyint",)
+
+class _RhsFailure(StandardError):
+    """The right-hand side returned a negative value; see :func:`cvodefun`."""
+
+class Scipyint(object):
+    """
+    :class:`~cgp.cvodeint.core.Cvodeint` work-alike using :mod:`scipy.integrate`
+
+    :param function f_ode: Function of (t, y, ydot, f_data),
+        which writes rates-of-change to *ydot*, as for
+        :class:`~cgp.cvodeint.core.Cvodeint`. Here *y* and *ydot* are numpy
+        arrays.
+    :param array_like t: Time, either [start end] or a vector of desired
+        return times.
+    :param array_like y: Initial value of state vector.
+    :param float reltol: Relative tolerance.
+    :param float abstol: Absolute tolerance, scalar or one per state variable.
+    :param int nrtfn: Number of components of the rootfinding function.
+    :param function g_rtfn: Rootfinding function of (t, y, gout, g_data).
+    :param f_data: User data for *f_ode*.
+    :param g_data: User data for *g_rtfn*.
+    :param int maxsteps: Maximum number of internal steps for adaptive output.
+    :param method: Name of a solver class in :mod:`scipy.integrate`, e.g.
+        "LSODA", "BDF", "Radau" or "RK45", or the class itself.
+    :param options: Other keyword arguments to the solver class, e.g.
+        *first_step* or *max_step*.
+
+    Attributes *t*, *y*, *t0*, *tret*, *tstop*, *last_flag*, *stats* and
+    *totals* mean the same as for
+    :class:`~cgp.cvodeint.core.Cvodeint`, except that times are plain floats
+    and *y* is a numpy array. Only the counts that the scipy solvers keep
+    are filled in the :class:`~cgp.cvodeint.common.Solverstats`.
+    """
+
+    def __init__(self, f_ode, t, y, reltol=1e-8, abstol=1e-8, nrtfn=None,
+        g_rtfn=None, f_data=None, g_data=None, maxsteps=1e4, method="LSODA",
+        **options):
+        t = np.array(t, dtype=float, ndmin=1)
+        try:
+            y = np.array(y, dtype=float, ndmin=1)
+        except ValueError:
+            raise ValueError("State vector y not interpretable as float: %s" % y)
+        self.f_ode = f_ode # store this for use in __repr__ etc.
+        if hasattr(f_ode, "traceback"):
+            self.my_f_ode = f_ode
+        else:
+            self.my_f_ode = cvodefun(f_ode)
+        if isinstance(method, basestring):
+            import scipy.integrate
+            method = getattr(scipy.integrate, method)
+        self.method = method
+        self.options = options
+        self.y = y.copy()
+        self.t = t
+        self.t0 = self.tret = t[0]
+        self.tstop = t[-1]
+        self.n = len(y)
+        self.reltol = reltol
+        self.abstol = abstol
+        self.f_data = f_data
+        self.maxsteps = maxsteps
+        self.last_flag = None
+        self.nrtfn = 0
+        self.g_rtfn = None
+        self.g_data = g_data
+        self.stats = Solverstats()
+        self.totals = Solverstats()
+        self.RootInit(nrtfn, g_rtfn, g_data)
+
+    def __repr__(self):
+        """Used for both repr(x) and str(x)."""
+        return "%s(f_ode=%s, t=%s, y=%s, method=%s)" % (self.__class__.__name__,
+            self.f_ode.__name__, self.t, self.y, self.method.__name__)
+
+    def RootInit(self, nrtfn, g_rtfn=None, g_data=None):
+        """
+        Initialize rootfinding, disable rootfinding, or keep current settings.
+
+        Same as :meth:`cgp.cvodeint.core.Cvodeint.RootInit`.
+
+        >>> import ctypes
+        >>> from example_ode import exp_growth, g_rtfn_y
+        >>> g_data = ctypes.c_float(2.5)
+        >>> s = Scipyint(exp_growth, t=[0, 3], y=[1],
+        ...     nrtfn=1, g_rtfn=g_rtfn_y, g_data=ctypes.byref(g_data))
+        >>> t, y, flag = s.integrate()
+        >>> y[-1].round(6), flag_name(flag)
+        (array([ 2.5]), 'CV_ROOT_RETURN')
+        """
+        if nrtfn is not None:
+            self.nrtfn = int(nrtfn)
+            self.g_rtfn = g_rtfn if self.nrtfn else None
+            self.g_data = g_data
+        elif (g_rtfn is not None) or (g_data is not None):
+            raise CvodeException(
+                "If g_rtfn or g_data is given, nrtfn is required.")
+
+    def integrate(self, t=None, y=None, nrtfn=None, g_rtfn=None, g_data=None,
+        assert_flag=None, ignore_flags=False):
+        """
+        Integrate over time interval, init'ing solver or rootfinding as needed.
+
+        Arguments, time conventions and return value *(t, Y, flag)* are as
+        for :meth:`cgp.cvodeint.core.Cvodeint.integrate`.
+
+        >>> from example_ode import exp_growth
+        >>> s = Scipyint(exp_growth, t=[0, 2], y=[0.1])
+        >>> t, Y, flag = s.integrate()
+        >>> t2, Y2, flag2 = s.integrate(t=3); t2[0], t2[-1]
+        (2.0, 3.0)
+        >>> t, Y, flag = s.integrate(t=[0, 1, 2], y=[0.1])
+        >>> t, Y.ravel().round(4), flag_name(flag)
+        (array([ 0.,  1.,  2.]), array([ 0.1   ,  0.2718,  0.7389]), 'CV_SUCCESS')
+        """
+        self._reinit(t, y)
+        self.RootInit(nrtfn, g_rtfn, g_data)
+        start = time.time()
+        self.solver, self.nsteps = None, 0
+        try:
+            result = self._integrate()
+        finally:
+            self._update_stats(start)
+        flag = result[-1]
+        self.last_flag = flag
+        # ensure assert_flag is iterable (or None):
+        if type(assert_flag) is int:
+            assert_flag = (assert_flag,)
+        if ignore_flags or (assert_flag is None) or (flag in assert_flag):
+            return result
+        else:
+            raise CvodeException(flag, result)
+
+    def _reinit(self, t=None, y=None):
+        """
+        Interpret/set time and state as for :meth:`Cvodeint.integrate`.
+
+        See :meth:`cgp.cvodeint.core.Cvodeint._ReInit_if_required`.
+        """
+        if (t is None) and (self.last_flag ==
+            CV_ROOT_RETURN) and (self.tret < self.tstop):
+            t = self.tstop
+        if t is not None:
+            t = np.array(t, dtype=float, ndmin=1)
+            if len(t) == 1:
+                self.t = np.array([self.tret, t[0]])
+            else:
+                self.t = t
+        if y is not None:
+            try:
+                self.y[:] = y
+            except TypeError:
+                self.y[:] = y.item() # for numpy structured or record array
+        self.t0 = self.tret = self.t[0]
+        self.tstop = self.t[-1]
+
+    def _rhs(self, t, y):
+        """Right-hand side as a function of (t, y), for the scipy solvers."""
+        ydot = np.empty(self.n)
+        result = self.my_f_ode(t, y, ydot, self.f_data)
+        if (result is not None) and (result < 0):
+            raise _RhsFailure()
+        return ydot
+
+    def _g(self, t, y):
+        """Rootfinding function as a function of (t, y)."""
+        gout = np.zeros(self.nrtfn)
+        self.g_rtfn(t, y, gout, self.g_data)
+        return gout
+
+    def _update_stats(self, start):
+        """Set *stats* for the integration that began at *start*."""
+        self.stats = Solverstats(nsteps=self.nsteps, 
+            seconds=time.time() - start)
+        if self.solver is not None:
+            s = self.solver
+            self.stats.update(nfevals=s.nfev, njevals=s.njev, 
+                nlinsetups=s.nlu, hlast=s.step_size, tcur=s.t)
+        self.totals += self.stats
+
+    def _integrate(self):
+        """
+        Step the solver from *t0* to *tstop*, collecting output.
+
+        Output: t, Y, flag. See :meth:`integrate`.
+        As for :class:`~cgp.cvodeint.core.Cvodeint`, the *maxsteps* setting
+        is ignored when using fixed time steps.
+        """
+        fixed = len(self.t) > 2
+        tout = self.t
+        if fixed:
+            t = np.empty(len(tout))
+            Y = np.empty((len(tout), self.n))
+            t[0], Y[0] = self.t0, self.y
+        else:
+            t, Y = [self.t0], [self.y.copy()]
+        i = 1 # next row of output
+        flag = CV_SUCCESS if fixed else CV_TSTOP_RETURN
+        if self.tstop <= self.t0:
+            return self._result(t, Y, i, flag)
+        self.solver = solver = self.method(self._rhs, self.t0, self.y.copy(), 
+            self.tstop, rtol=self.reltol, atol=self.abstol, **self.options)
+        g_old = self._g(self.t0, self.y) if self.nrtfn else None
+        while solver.status == "running":
+            if (not fixed) and (i >= self.maxsteps):
+                raise CvodeException("Maximum number of steps exceeded",
+                    self._result(t, Y, i, None))
+            told = solver.t
+            try:
+                message = solver.step()
+            except _RhsFailure:
+                raise CvodeException(CV_RHSFUNC_FAIL,
+                    self._result(t, Y, i, CV_RHSFUNC_FAIL))
+            self.nsteps += 1
+            if solver.status == "failed":
+                raise CvodeException("%s failed: %s" % (
+                    self.method.__name__, message),
+                    self._result(t, Y, i, CV_ERR_FAILURE))
+            sol = solver.dense_output() if fixed or self.nrtfn else None
+            tnew, ynew = solver.t, solver.y
+            troot = None
+            if self.nrtfn:
+                g_new = self._g(tnew, ynew)
+                troot = self._find_root(sol, told, tnew, g_old, g_new)
+                g_old = g_new
+            if fixed:
+                # output times within this step, but not past a root
+                if troot is None:
+                    j = np.searchsorted(tout, tnew, side="right")
+                else:
+                    j = np.searchsorted(tout, troot, side="left")
+                if j > i:
+                    t[i:j] = tout[i:j]
+                    Y[i:j] = sol(tout[i:j]).T
+                    i = j
+            if troot is not None:
+                yroot = sol(troot)
+                if fixed:
+                    t[i], Y[i] = troot, yroot
+                else:
+                    t.append(troot)
+                    Y.append(yroot)
+                i += 1
+                flag = CV_ROOT_RETURN
+                self.tret, self.y[:] = troot, yroot
+                break
+            if not fixed:
+                t.append(tnew)
+                Y.append(ynew.copy())
+                i += 1
+            self.tret, self.y[:] = tnew, ynew
+        return self._result(t, Y, i, flag)
+
+    @staticmethod
+    def _result(t, Y, i, flag):
+        """Return the first *i* rows of output as arrays *t, Y, flag*."""
+        return np.array(t[:i], dtype=float), np.array(Y[:i], dtype=float), flag
+
+    def _find_root(self, sol, told, tnew, g_old, g_new):
+        """
+        Earliest root of the rootfinding function within a step, or None.
+
+        A component has a root if it changes sign from *g_old* at *told* to
+        *g_new* at *tnew*. Components that are zero at the start of the step
+        are ignored, as CVODE does. The root is reported at the first time
+        where the component has changed sign, so that rootfinding does not
+        trigger again when integration resumes from the root.
+        """
+        from scipy.optimize import brentq
+        crossed = np.nonzero((g_old != 0) &
+            (np.sign(g_old) != np.sign(g_new)))[0]
+        if not len(crossed):
+            return None
+        roots = []
+        for k in crossed:
+            gk = lambda tk: self._g(tk, sol(tk))[k] # pylint: disable=W0640
+            xtol = 4 * np.finfo(float).eps * max(abs(told), abs(tnew), 1.0)
+            tk = brentq(gk, told, tnew, xtol=xtol)
+            while (np.sign(gk(tk)) == np.sign(g_old[k])) and (tk < tnew):
+                tk = min(tk + xtol, tnew)
+                xtol *= 2
+            roots.append(tk)
+        return min(roots)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE)
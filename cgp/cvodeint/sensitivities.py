@@ -0,0 +1,170 @@
+"""
+Forward sensitivities of the state with respect to model parameters.
+
+The sensitivity *s_j = dy/dp_j* of the state to parameter *p_j* obeys
+
+    ds_j/dt = J s_j + df/dp_j
+
+where *J = df/dy* is the Jacobian of the right-hand side *f*. Integrating
+these equations alongside the model gives local derivatives of the whole
+trajectory in one solve, instead of one extra solve per parameter for
+finite differences of separate simulations.
+
+The right-hand side of the sensitivity equations is computed as a
+directional difference quotient, which needs one extra evaluation of *f*
+per parameter:
+
+    J s_j + df/dp_j ~ (f(t, y + h s_j, p + h e_j) - f(t, y, p)) / h
+
+State and sensitivities are integrated together as one system by CVODE,
+i.e. the "simultaneous corrector" method of CVODES (:doi:`Hindmarsh et al.
+2005 <10.1145/1089014.1089020>`). The Newton matrix is approximated as
+block-diagonal, with the model's Jacobian in every block. It is stored in a
+band of half-width *n - 1*, so that factoring it costs O(k n^3) for *k*
+parameters, not O(k^3 n^3) as for the full matrix. (CVODES factors a single
+*n* by *n* block, which this ctypes wrapper cannot do.)
+
+>>> from cgp.cvodeint.namedcvodeint import Namedcvodeint
+>>> vdp = Namedcvodeint(t=[0, 1])
+>>> t, Y, S, flag = forward_sensitivities(vdp, [0])
+>>> S.shape == (len(t), 1, 2)
+True
+
+Compare with a central difference of two separate solutions:
+
+>>> def final_state(epsilon):
+...     with vdp.autorestore(epsilon=epsilon):
+...         t, Yr, flag = vdp.integrate(t=[0, 1])
+...     return Yr[-1].view(float)
+>>> dp = 1e-4
+>>> fd = (final_state(1 + dp) - final_state(1 - dp)) / (2 * dp)
+>>> bool(np.allclose(S[-1, 0], fd, rtol=1e-4, atol=1e-6))
+True
+"""
+
+import numpy as np
+from pysundials import cvode
+
+from .core import Cvodeint, CvodeException, cvodefun, nv
+
+__all__ = ("forward_sensitivities",)
+
+def forward_sensitivities(integrator, index, t=None, y=None, s0=None,
+    pbar=None, **kwargs):
+    """
+    Integrate a model together with its sensitivities to some parameters.
+
+    :param integrator: :class:`~cgp.cvodeint.core.Cvodeint` subclass
+        instance with a parameter vector, e.g.
+        :class:`~cgp.cvodeint.namedcvodeint.Namedcvodeint`. Its time and
+        state are left unchanged.
+    :param array_like index: Indices of the parameters in the vector
+        returned by ``integrator._get_parameters()``.
+    :param array_like t: Output times as for
+        :meth:`~cgp.cvodeint.core.Cvodeint.integrate`; default
+        ``integrator.t``.
+    :param array_like y: Initial state; default: the current state.
+    :param array_like s0: Initial sensitivities, shape (len(index), n);
+        default zero, i.e. the initial state does not depend on the
+        parameters.
+    :param array_like pbar: Typical magnitude of each parameter, used to
+        scale difference increments and the absolute tolerance of the
+        sensitivities (*abstol / pbar*). Default: the absolute value of each
+        parameter, or 1 if it is zero.
+    :param ``**kwargs``: Further arguments to
+        :meth:`~cgp.cvodeint.core.Cvodeint.integrate` for the augmented
+        system, e.g. *assert_flag* or *breakpoints* (as times only, since 
+        updates would be applied to the augmented system). Rootfinding is 
+        not supported.
+    :return tuple:
+        * **t**: time vector
+        * **Y**: (len(t), n) array of states
+        * **S**: (len(t), len(index), n) array of sensitivities;
+          ``S[i, j, k]`` is the derivative of state variable *k* at time
+          ``t[i]`` with respect to parameter ``index[j]``
+        * **flag**: last flag returned by CVode
+
+    If the integration fails, the :exc:`~cgp.cvodeint.core.CvodeException`
+    has a *result* attribute of *(t, Y, S, flag)* so far.
+    """
+    index = np.array(index, dtype=int, ndmin=1)
+    n, k = integrator.n, len(index)
+    if t is None:
+        t = integrator.t
+    if y is None:
+        y = np.array(integrator.y)
+    z0 = np.zeros((k + 1, n))
+    z0[0] = y
+    if s0 is not None:
+        z0[1:] = s0
+    p0 = integrator._get_parameters()
+    if pbar is None:
+        pbar = np.where(p0[index] == 0, 1.0, abs(p0[index]))
+    pbar = np.array(pbar, dtype=float, ndmin=1)
+    if integrator.itol == cvode.CV_SV:
+        atol = np.array(integrator.abstol)
+    else:
+        atol = np.tile(integrator.abstol.value, n)
+    abstol = np.concatenate([atol] + [atol / pb for pb in pbar])
+
+    f_ode, f_data = integrator.my_f_ode, integrator.f_data
+    sqrteps = np.sqrt(np.finfo(float).eps)
+    yv, ydot0, ydot = nv(np.zeros(n)), nv(np.zeros(n)), nv(np.zeros(n))
+
+    @cvodefun
+    def augmented(t, z, zdot, f_data):
+        """Right-hand side of the model and its sensitivity equations."""
+        z = np.array(z).reshape(k + 1, n)
+        y = z[0]
+        zd = np.empty_like(z)
+        yv[:] = y
+        result = f_ode(t, yv, ydot0, f_data)
+        if result:
+            return result
+        zd[0] = np.array(ydot0)
+        p = integrator._get_parameters()
+        scale = sqrteps * np.maximum(abs(y), 1.0)
+        try:
+            for j, i in enumerate(index):
+                s = z[j + 1]
+                # keep the state increment h * s within sqrt(eps) * |y|
+                h = sqrteps * pbar[j]
+                h /= max(1.0, (h * abs(s) / scale).max())
+                yv[:] = y + h * s
+                p[i] += h
+                integrator._set_parameters(p)
+                p[i] -= h
+                result = f_ode(t, yv, ydot, f_data)
+                if result:
+                    return result
+                zd[j + 1] = (np.array(ydot) - zd[0]) / h
+        finally:
+            integrator._set_parameters(p)
+        zdot[:] = zd.ravel()
+        return 0
+
+    def jacobian(t, z, fz, J, jac_data): # pylint: disable=W0613
+        """Block-diagonal approximation, ignoring the coupling to the state."""
+        y = np.array(z)[:n]
+        if integrator.jac is None:
+            Jy = integrator._dq_jacobian(t, y, np.array(fz)[:n])
+        else:
+            Jy = np.zeros((n, n))
+            integrator.jac(t, y, nv(np.array(fz)[:n]), Jy, jac_data)
+        for j in range(k + 1):
+            J[j * n:(j + 1) * n, j * n:(j + 1) * n] = Jy
+
+    aug = Cvodeint(augmented, t, z0.ravel(), reltol=integrator.reltol,
+        abstol=abstol, chunksize=integrator.chunksize,
+        maxsteps=integrator.maxsteps, jac=jacobian, validate=False,
+        method=integrator.method, f_data=f_data, linsolver="band",
+        mupper=max(n - 1, 0), mlower=max(n - 1, 0))
+    # contiguous copies, so that they can be viewed as record arrays
+    split = lambda Z: (Z[:, :n].copy(), Z[:, n:].reshape(len(Z), k, n).copy())
+    try:
+        tout, Z, flag = aug.integrate(t=t, **kwargs)
+    except CvodeException, exc:
+        tout, Z, flag = exc.result
+        exc.result = (tout,) + split(Z) + (flag,)
+        raise
+    return (tout,) + split(Z) + (flag,)
@@ -0,0 +1,32 @@
+"""
+Build the optional compiled integration loop, :mod:`cgp.cvodeint._steploop`.
+Usage: python setup_steploop.py build_ext --inplace
+
+Run this in the cgp/cvodeint directory. SUNDIALS 2.3 headers and libraries
+are looked for under the prefix in the SUNDIALS_DIR environment variable
+(default /usr/local), as for Cython-compiled CellML models (see
+:mod:`cgp.physmod.cythonize`). Remove _steploop.so (or .pyd) to go back to
+the pure Python loop.
+"""
+
+if __name__ == "__main__":
+    # Imports are deferred so that importing this module (e.g. when 
+    # collecting doctests) neither requires Cython nor runs setup().
+    from distutils.core import setup
+    from distutils.extension import Extension
+    from Cython.Distutils import build_ext
+    import numpy as np
+    import os
+    
+    prefix = os.environ.get("SUNDIALS_DIR", "/usr/local")
+    
+    ext_modules = [Extension("_steploop", ["_steploop.pyx"],
+        include_dirs=[os.path.join(prefix, "include"), np.get_include()],
+        library_dirs=[os.path.join(prefix, "lib")],
+        libraries=["sundials_cvode", "sundials_nvecserial"])]
+    
+    setup(
+        name="_steploop",
+        cmdclass={"build_ext": build_ext},
+        ext_modules=ext_modules
+    )
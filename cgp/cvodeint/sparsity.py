@@ -0,0 +1,246 @@
+"""
+Jacobian sparsity detection and automatic choice of CVODE linear solver.
+
+CVODE's Newton iteration solves linear systems with the matrix
+``I - gamma * J``, where *J* is the Jacobian of the ODE right-hand side.
+The default dense solver costs O(n^3) per factorization, although models with
+many states, such as Markov models of ion channels, usually have very sparse
+Jacobians. :func:`jacobian_pattern` finds out which rates depend on which
+states by probing the right-hand side, and :func:`choose_linsolver` picks
+dense, band or preconditioned Krylov (sparse) solvers accordingly.
+Use ``Cvodeint(..., linsolver="auto")`` to do this automatically.
+
+>>> from example_ode import markov_chain
+>>> pattern = jacobian_pattern(markov_chain, np.ones(5))
+>>> pattern.astype(int)
+array([[1, 1, 0, 0, 0],
+       [1, 1, 1, 0, 0],
+       [0, 1, 1, 1, 0],
+       [0, 0, 1, 1, 1],
+       [0, 0, 0, 1, 1]])
+>>> bandwidth(pattern)
+(1, 1)
+
+A band solver only pays off if the state variables are ordered so that the
+nonzeros cluster around the diagonal. Here the states of the chain have been
+shuffled; :func:`reverse_cuthill_mckee` finds an ordering that restores the
+narrow band.
+
+>>> shuffle = np.array([3, 0, 4, 2, 1])
+>>> shuffled = pattern[shuffle][:, shuffle]
+>>> bandwidth(shuffled)
+(3, 3)
+>>> perm = reverse_cuthill_mckee(shuffled)
+>>> bandwidth(shuffled, perm)
+(1, 1)
+
+Cvodeint keeps the state vector in the model's own order, because named
+views of the state (see :class:`~cgp.cvodeint.namedcvodeint.Recarraylink`)
+depend on it. To integrate in the reordered variables, wrap the right-hand
+side with :func:`permuted_ode` and permute the initial state.
+"""
+
+from collections import namedtuple, deque
+
+import numpy as np
+
+__all__ = ("jacobian_pattern", "bandwidth", "reverse_cuthill_mckee",
+    "coverage_bandwidth", "choose_linsolver", "permuted_ode", "Linsolver")
+
+Linsolver = namedtuple("Linsolver", "name mupper mlower")
+
+def jacobian_pattern(f_ode, y, t=0.0, f_data=None, nprobe=3, seed=0):
+    """
+    Find which rates of change depend on which state variables.
+
+    :param function f_ode: ODE right-hand side of *(t, y, ydot, f_data)*.
+    :param array_like y: State vector around which to probe.
+    :param float t: Time at which to probe.
+    :param int nprobe: Number of probe points: *y* itself and *nprobe - 1*
+        random perturbations of it. Several points guard against
+        dependencies that happen to vanish at *y*, e.g. ``y[0] * y[1]``
+        with ``y[1] == 0``.
+    :param int seed: Seed for the random perturbations.
+    :return: Boolean (n, n) array, where element *(i, j)* is True if
+        ``ydot[i]`` changed when ``y[j]`` was perturbed. The diagonal is
+        always True, since CVODE's iteration matrix includes the identity.
+
+    Each probe point costs n + 1 evaluations of *f_ode*.
+
+    >>> from example_ode import vdp
+    >>> jacobian_pattern(vdp, [0, -2]).astype(int)
+    array([[1, 1],
+           [1, 1]])
+    """
+    y = np.array(y, dtype=float, ndmin=1)
+    n = len(y)
+    pattern = np.eye(n, dtype=bool)
+    rng = np.random.RandomState(seed)
+    f0 = np.empty(n)
+    f1 = np.empty(n)
+    for k in range(nprobe):
+        if k == 0:
+            yk = y
+        else:
+            # Relative perturbation keeps the sign of each state variable;
+            # states that are exactly zero get a small positive value.
+            yk = y * (1 + 0.1 * rng.uniform(-1, 1, n))
+            yk[y == 0] = 1e-3 * rng.uniform(0, 1, (y == 0).sum())
+        f_ode(t, yk, f0, f_data)
+        if not np.isfinite(f0).all():
+            continue
+        for j in range(n):
+            yj = yk.copy()
+            yj[j] += np.sqrt(np.finfo(float).eps) * max(abs(yk[j]), 1.0)
+            f_ode(t, yj, f1, f_data)
+            pattern[:, j] |= (f1 != f0)
+    return pattern
+
+def bandwidth(pattern, perm=None):
+    """
+    Upper and lower bandwidth of a sparsity pattern.
+
+    :param array_like pattern: Boolean (n, n) array.
+    :param array_like perm: Optional ordering of the state variables.
+    :return tuple: *(mupper, mlower)* as for
+        :func:`~pysundials.cvode.CVBand`.
+
+    >>> bandwidth(np.tril(np.ones((4, 4))))
+    (0, 3)
+    """
+    pattern = np.asarray(pattern, dtype=bool)
+    if perm is not None:
+        pattern = pattern[perm][:, perm]
+    i, j = np.nonzero(pattern)
+    if len(i) == 0:
+        return 0, 0
+    return int(max(0, (j - i).max())), int(max(0, (i - j).max()))
+
+def reverse_cuthill_mckee(pattern):
+    """
+    Ordering of state variables that tends to minimize bandwidth.
+
+    Reverse Cuthill-McKee: Breadth-first search of the (symmetrized)
+    dependency graph, starting from a node of minimum degree and visiting
+    neighbours in order of increasing degree. The resulting order is reversed.
+    Disconnected parts of the graph are ordered one after another.
+
+    :param array_like pattern: Boolean (n, n) array.
+    :return: Integer array *perm* such that ``pattern[perm][:, perm]`` has
+        small bandwidth.
+
+    >>> reverse_cuthill_mckee(np.eye(3, dtype=bool))
+    array([2, 1, 0])
+    """
+    A = np.asarray(pattern, dtype=bool)
+    A = A | A.T
+    n = len(A)
+    degree = A.sum(axis=1)
+    visited = np.zeros(n, dtype=bool)
+    order = []
+    for start in np.argsort(degree, kind="mergesort"):
+        if visited[start]:
+            continue
+        visited[start] = True
+        queue = deque([start])
+        while queue:
+            i = queue.popleft()
+            order.append(i)
+            neighbours = np.nonzero(A[i] & ~visited)[0]
+            neighbours = neighbours[np.argsort(degree[neighbours],
+                                               kind="mergesort")]
+            visited[neighbours] = True
+            queue.extend(neighbours)
+    return np.array(order[::-1], dtype=int)
+
+def coverage_bandwidth(pattern, coverage=0.9):
+    """
+    Half-bandwidth of the narrowest band containing a fraction of nonzeros.
+
+    Used for CVODE's band preconditioner, which ignores elements outside the 
+    band.
+
+    >>> pattern = np.eye(10, dtype=bool)
+    >>> pattern[0, 9] = True
+    >>> coverage_bandwidth(pattern), coverage_bandwidth(pattern, 1.0)
+    (0, 9)
+    """
+    i, j = np.nonzero(pattern)
+    return int(np.ceil(np.percentile(abs(i - j), 100 * coverage)))
+
+def choose_linsolver(pattern, krylov=True, min_krylov=40, max_density=0.1,
+    coverage=0.9):
+    """
+    Choose a CVODE linear solver for a Jacobian sparsity pattern.
+
+    :param array_like pattern: Boolean (n, n) array, see
+        :func:`jacobian_pattern`.
+    :param bool krylov: Whether the Krylov solver is an option. (It cannot
+        use an analytic Jacobian.)
+    :param int min_krylov: Smallest system for which the Krylov solver is
+        considered.
+    :param float max_density: Largest fraction of nonzeros in the Jacobian
+        for which the Krylov solver is considered.
+    :param float coverage: Fraction of the nonzeros that the band
+        preconditioner of the Krylov solver should capture.
+    :return: A :class:`Linsolver` namedtuple *(name, mupper, mlower)*, where
+        *name* is one of:
+
+        * **"band"**: `CVBand` if the band is narrow enough that banded LU
+          is much cheaper than dense
+        * **"spgmr"**: CVODE 2.3 has no sparse direct solver, so large,
+          sparse systems get the preconditioned Krylov solver `CVSpgmr`
+          with CVODE's band preconditioner (`CVBandPre`). The bandwidths are
+          those of the preconditioner, see :func:`coverage_bandwidth`.
+        * **"dense"**: `CVDense` otherwise.
+
+    >>> from example_ode import markov_chain
+    >>> choose_linsolver(jacobian_pattern(markov_chain, np.ones(12)))
+    Linsolver(name='band', mupper=1, mlower=1)
+    >>> choose_linsolver(np.ones((12, 12), dtype=bool))
+    Linsolver(name='dense', mupper=None, mlower=None)
+    """
+    pattern = np.asarray(pattern, dtype=bool)
+    n = len(pattern)
+    mupper, mlower = bandwidth(pattern)
+    if mupper + mlower + 1 <= n // 4:
+        return Linsolver("band", mupper, mlower)
+    if krylov and (n >= min_krylov) and (pattern.mean() <= max_density):
+        width = coverage_bandwidth(pattern, coverage)
+        return Linsolver("spgmr", width, width)
+    return Linsolver("dense", None, None)
+
+def permuted_ode(f_ode, perm):
+    """
+    Wrap an ODE right-hand side to work on reordered state variables.
+
+    :param function f_ode: ODE right-hand side of *(t, y, ydot, f_data)*.
+    :param array_like perm: Ordering of state variables, e.g. from
+        :func:`reverse_cuthill_mckee`.
+    :return function: Right-hand side for the state vector ``y[perm]``.
+
+    >>> from example_ode import vdp
+    >>> ode = permuted_ode(vdp, [1, 0])
+    >>> ydot = [0.0, 0.0]
+    >>> vdp(0, [1.0, 2.0], ydot, None); ydot
+    [2.0, -1.0]
+    >>> ode(0, [2.0, 1.0], ydot, None); ydot
+    [-1.0, 2.0]
+    """
+    perm = np.asarray(perm, dtype=int)
+    inverse = np.argsort(perm)
+    ydot_orig = np.empty(len(perm))
+
+    def ode(t, y, ydot, f_data):
+        """Right-hand side in permuted state variables."""
+        result = f_ode(t, np.array(y, dtype=float)[inverse], ydot_orig, f_data)
+        ydot[:] = list(ydot_orig[perm])
+        return result
+
+    ode.__name__ = f_ode.__name__
+    return ode
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod(optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE)
@@ -0,0 +1,166 @@
+"""
+Continuous (dense-output) solution built from CVODE's interpolation data.
+
+After each internal time step, CVODE can evaluate the solution and its
+derivatives anywhere within that step by :func:`~pysundials.cvode.CVodeGetDky`.
+This is the same polynomial that CVODE itself uses to produce output at
+requested times. A :class:`Trajectory` records the polynomial for each step,
+so that the solution can be evaluated at arbitrary times afterwards, with the
+accuracy of CVODE's own interpolation, without requesting fine output up
+front.
+
+Use ``Cvodeint.integrate(..., dense_output=True)`` to obtain one.
+"""
+
+import numpy as np
+
+__all__ = ["Trajectory"]
+
+class Trajectory(object):
+    """
+    Piecewise polynomial solution, one polynomial per solver step.
+
+    :param int n: Number of state variables.
+    :param float t0: Start time.
+    :param float window: If given, keep only the polynomials needed to
+        evaluate the last *window* time units. This bounds memory during long
+        burn-in runs where only the end of the trajectory is of interest.
+    :param int size: Initial capacity in steps; grows by doubling. Room 
+        for coefficients starts at two per step (order 1) and also grows 
+        as needed.
+    :param dtype: Optional record dtype for the state; if given, evaluation
+        returns a record array.
+
+    For step *i*, ending at ``tend[i]``, the solution is
+
+    .. math:: y(t) = \\sum_{k=0}^{q_i} c_{ik} (t - t_{end,i})^k
+
+    where the Taylor coefficients are ``c_ik = D^k y(tend[i]) / k!`` and
+    :math:`q_i` is the method order used for that step. Each step thus costs
+    :math:`(q_i + 1) n` stored values, more than the *n* values per step of 
+    plain :meth:`~cgp.cvodeint.core.Cvodeint.integrate` output. Memory is 
+    saved only if *window* is given; see :attr:`nbytes`.
+
+    >>> traj = Trajectory(n=1, t0=0.0)
+    >>> traj.append(1.0, 2, [[1.0], [1.0], [0.5]]) # exp(t) expanded at t=1
+    >>> traj(0.5)
+    array([ 0.625])
+    >>> traj([0, 1])
+    array([[ 0.5],
+           [ 1. ]])
+    >>> traj.t
+    array([ 0.,  1.])
+    """
+
+    def __init__(self, n, t0, window=None, size=1000, dtype=None):
+        self.n = n
+        self.t0 = float(t0)
+        self.window = window
+        self.dtype = dtype
+        self.nstep = 0
+        self.nrow = 0
+        self.tend = np.empty(size)
+        self.order = np.empty(size, dtype=int)
+        self.offset = np.empty(size, dtype=int)
+        self.coef = np.empty((2 * size, n))
+
+    def __len__(self):
+        """Number of solver steps stored."""
+        return self.nstep
+
+    @property
+    def nbytes(self):
+        """Bytes allocated for the stored steps, including spare capacity."""
+        return sum(getattr(self, k).nbytes 
+            for k in ("tend", "order", "offset", "coef"))
+
+    @property
+    def t(self):
+        """Start time followed by the end time of each stored step."""
+        return np.r_[self.t0, self.tend[:self.nstep]]
+
+    def append(self, tend, order, coef):
+        """
+        Add the polynomial for a step ending at *tend*.
+
+        :param float tend: End of step (CVODE's current internal time).
+        :param int order: Method order for the step.
+        :param array_like coef: Taylor coefficients, shape (order + 1, n).
+        """
+        if self.nstep == len(self.tend):
+            self._make_room(self.nstep)
+        if self.nrow + order + 1 > len(self.coef):
+            self._make_room(self.nrow + order + 1, rows=True)
+        i = self.nstep
+        self.tend[i] = tend
+        self.order[i] = order
+        self.offset[i] = self.nrow
+        self.coef[self.nrow:self.nrow + order + 1] = coef
+        self.nstep += 1
+        self.nrow += order + 1
+
+    def _make_room(self, needed, rows=False):
+        """Forget steps outside the window if possible, otherwise grow."""
+        if self.window is not None:
+            cutoff = self.tend[self.nstep - 1] - self.window
+            # first step whose interval reaches past cutoff
+            first = np.searchsorted(self.tend[:self.nstep], cutoff)
+            if first > 0:
+                self.t0 = self.tend[first - 1]
+                row0 = self.offset[first]
+                keep = slice(first, self.nstep)
+                m = self.nstep - first
+                self.tend[:m] = self.tend[keep]
+                self.order[:m] = self.order[keep]
+                self.offset[:m] = self.offset[keep] - row0
+                self.coef[:self.nrow - row0] = self.coef[row0:self.nrow]
+                self.nstep = m
+                self.nrow -= row0
+                # grow anyway if that freed less than half the capacity
+                full = (self.nrow if rows else self.nstep)
+                if 2 * full < (len(self.coef) if rows else len(self.tend)):
+                    return
+        if rows:
+            coef = np.empty((2 * max(needed, len(self.coef)), self.n))
+            coef[:self.nrow] = self.coef[:self.nrow]
+            self.coef = coef
+        else:
+            size = 2 * len(self.tend)
+            for name in "tend", "order", "offset":
+                old = getattr(self, name)
+                new = np.empty(size, dtype=old.dtype)
+                new[:self.nstep] = old[:self.nstep]
+                setattr(self, name, new)
+
+    def __call__(self, t):
+        """
+        Evaluate the solution at time(s) *t*.
+
+        :return: State vector for scalar *t*, otherwise array with one row per
+            element of *t*. A record array if *dtype* was given.
+        """
+        t = np.asarray(t, dtype=float)
+        scalar = (t.ndim == 0)
+        t = np.atleast_1d(t)
+        if self.nstep == 0:
+            raise ValueError("Trajectory is empty")
+        tend = self.tend[:self.nstep]
+        eps = 1e-12 * max(1.0, abs(tend[-1]))
+        if (t.min() < self.t0 - eps) or (t.max() > tend[-1] + eps):
+            raise ValueError("Time outside trajectory [%s, %s]" %
+                (self.t0, tend[-1]))
+        i = np.searchsorted(tend, t).clip(0, self.nstep - 1)
+        dt = (t - tend[i])[:, np.newaxis]
+        q = self.order[i]
+        y = np.zeros((len(t), self.n))
+        # Horner's scheme over steps of varying order
+        for k in range(q.max(), -1, -1):
+            has = q >= k
+            y[has] = y[has] * dt[has] + self.coef[self.offset[i[has]] + k]
+        if self.dtype is not None:
+            y = y.view(self.dtype, np.recarray)
+        return y[0] if scalar else y
+
+    def __repr__(self):
+        return "Trajectory(n=%s, t=[%s, %s], steps=%s)" % (self.n, self.t0,
+            self.tend[self.nstep - 1] if self.nstep else self.t0, self.nstep)
@@ -464,6 +464,12 @@ class Cellmlmodel(Namedcvodeint):
         self.originals["y0r"] = self.y0r
         if p:
             self.model.p[:] = p
+        nogil_rhs = getattr(self.model, "nogil_rhs", None)
+        if nogil_rhs is not None:
+            # Same arrays as model.ode(), but CVODE need not hold the GIL. 
+            # Used only by thread clones, see Namedcvodeint.tmap(); this 
+            # instance keeps the Python right-hand side.
+            self.nogil_rhs = nogil_rhs, self.pr, self.algebraic
     
     def save_legend(self, *args, **kwargs):
         """
@@ -36,12 +36,20 @@ from pysundials.cvode import NVector
 ftype = np.float64 # explicit type declaration, can be used with cython
 ctypedef np.float64_t dtype_t
 
-cdef extern from "math.h":
+cdef extern from "math.h" nogil:
     dtype_t log(dtype_t x)
     dtype_t exp(dtype_t x)
     dtype_t floor(dtype_t x)
     dtype_t fabs(dtype_t x)
 
+cdef extern from "sundials/sundials_nvector.h":
+    ctypedef struct _generic_N_Vector:
+        pass
+    ctypedef _generic_N_Vector* N_Vector
+
+cdef extern from "nvector/nvector_serial.h":
+    dtype_t* NV_DATA_S(N_Vector v) nogil
+
 cdef extern from "Python.h":
     ctypedef struct PyObject
     void* PyLong_AsVoidPtr(PyObject *pylong)
@@ -93,6 +101,31 @@ cpdef int ode(dtype_t t, y, ydot, f_data):
     compute_rates(t, py, pydot, pp, palgebraic)
     return 0
 
+cdef int rhs(dtype_t t, N_Vector y, N_Vector ydot, void* f_data) nogil:
+    """
+    Version of ode() that CVODE can call directly, without the GIL.
+    
+    Parameters and algebraic variables are not the global arrays, but come 
+    from f_data, an array of two pointers: (constants, algebraic). Each 
+    solver object can thus have its own, see 
+    cgp.cvodeint.core.Cvodeint._set_c_rhs().
+    """
+    cdef dtype_t** data = <dtype_t**>f_data
+    cdef dtype_t* pydot
+    cdef int i
+    if data == NULL:
+        return -1
+    pydot = NV_DATA_S(ydot)
+    for i in range(sizeStates):
+        pydot[i] = 0.0
+    for i in range(sizeAlgebraic):
+        data[1][i] = 0.0
+    compute_rates(t, NV_DATA_S(y), pydot, data[0], data[1])
+    return 0
+
+# Address of rhs(), for Cellmlmodel
+nogil_rhs = <size_t><void*>rhs
+
 def rates_and_algebraic(np.ndarray[dtype_t, ndim=1] t, y):
     """
     Compute rates and algebraic variables for a given state trajectory.
@@ -158,24 +191,24 @@ def computeRates(voi, states, constants):
 
 ## BEGIN Added by cythonize_model() ##
 
-cdef inline bint cy_equal(dtype_t x, dtype_t y):
+cdef inline bint cy_equal(dtype_t x, dtype_t y) nogil:
     return x == y
 
-cdef inline bint cy_greater(dtype_t x, dtype_t y):
+cdef inline bint cy_greater(dtype_t x, dtype_t y) nogil:
     return x > y
 
-cdef inline bint cy_less(dtype_t x, dtype_t y):
+cdef inline bint cy_less(dtype_t x, dtype_t y) nogil:
     return x < y
 
-cdef inline bint cy_greater_equal(dtype_t x, dtype_t y):
+cdef inline bint cy_greater_equal(dtype_t x, dtype_t y) nogil:
     return x >= y
 
-cdef inline bint cy_less_equal(dtype_t x, dtype_t y):
+cdef inline bint cy_less_equal(dtype_t x, dtype_t y) nogil:
     return x <= y
 
 cimport cython
 @cython.cdivision(True)
-cdef void compute_rates(dtype_t voi, dtype_t* states, dtype_t* rates, dtype_t* constants, dtype_t* algebraic):
+cdef void compute_rates(dtype_t voi, dtype_t* states, dtype_t* rates, dtype_t* constants, dtype_t* algebraic) nogil:
 """) + "\n"
 
 
@@ -6,6 +6,7 @@ from nose.tools import assert_equal
 
 from ..physmod import cellmlmodel
 from ..physmod.cellmlmodel import Cellmlmodel, Legend, parse_legend
+from ..cvodeint.core import CvodeException
 
 vdp = Cellmlmodel()
 vdp_compiled = Cellmlmodel(use_cython=True)
@@ -77,6 +78,33 @@ def test_properties():
     finally:
         vdp.y0r.x = -2.0  # undo change
 
+def final_x(model):
+    """Function to map over parameter sets in test_tmap."""
+    _t, Yr, _flag = model.integrate(t=[0, 5])
+    return Yr.x[-1]
+
+def test_tmap():
+    """Threads with the GIL-free right-hand side match a serial loop."""
+    # Ordinary instances keep the Python right-hand side
+    assert vdp_compiled.c_rhs is None
+    timed = Cellmlmodel(use_cython=True, time_rhs=True)
+    timed.integrate()
+    assert timed.stats["rhs_seconds"] > 0
+    if (vdp_compiled.nogil_rhs is None) or not vdp_compiled.compiled_loop:
+        from nose.plugins.skip import SkipTest
+        raise SkipTest("nogil_rhs or cgp.cvodeint._steploop not built")
+    p = vdp_compiled.pr.view(float) * np.linspace(0.5, 2.5, 6)[:, np.newaxis]
+    old = np.copy(vdp_compiled.pr)
+    actual = vdp_compiled.tmap(final_x, p, threads=3)
+    desired = vdp_uncompiled.pmap(final_x, p, processes=1)
+    np.testing.assert_allclose(actual, desired, rtol=1e-5)
+    np.testing.assert_equal(vdp_compiled.pr, old)
+    # Python evaluations would use the parameters of vdp_compiled
+    for func in (lambda m: m.rates(0, m.y), 
+                 lambda m: m.RootInit(1, m.ydoti(0))):
+        np.testing.assert_raises(CvodeException, vdp_compiled.tmap, func, 
+            p[:1])
+
 def test_get_all_workspaces():
     w = cellmlmodel.get_all_workspaces()
     assert "A Primer on Modular Mass Action Modelling with CellML" in w.title
@@ -7,7 +7,7 @@ from nose.tools import raises
 from pysundials import cvode
 
 from ..cvodeint import (  # pylint: disable=F0401
-    Cvodeint, CvodeException, example_ode)
+    Cvodeint, CvodeException, Solverstats, Recordpolicy, example_ode)
 import pickle
 
 def test_CvodeException():
@@ -218,4 +218,407 @@ def test_pickling():
     new = pickle.loads(s)
     for desired, actual in zip(old.integrate(), new.integrate()):
         np.testing.assert_array_equal(desired, actual)
-    
\ No newline at end of file
+
+def test_pickling_state():
+    """Unpickled objects resume from the current time and state."""
+    old = Cvodeint(example_ode.logistic_growth, t=[0, 2], y=[0.1], reltol=1e-3)
+    old.integrate(t=1)
+    old.reltol = 1e-6
+    new = pickle.loads(pickle.dumps(old))
+    assert new.reltol == old.reltol
+    for desired, actual in zip(old.integrate(t=2), new.integrate(t=2)):
+        np.testing.assert_array_equal(desired, actual)
+    # Warm unpickling reuses one instance per process
+    old.warm_unpickle = True
+    s = pickle.dumps(old)
+    a = pickle.loads(s)
+    a.integrate(t=3)
+    b = pickle.loads(s)
+    assert b is a
+    np.testing.assert_equal(b.tret.value, 2)
+    np.testing.assert_array_equal(b.y, old.y)
+    
+def test_ensemble():
+    """Ensemble members agree with separate calls to integrate()."""
+    c = Cvodeint(example_ode.logistic_growth, t=[0, 1, 2], y=[0.1])
+    y0 = [[0.1], [0.2], [0.3]]
+    t, Y, flags = c.ensemble(y0)
+    for y0i, Yi in zip(y0, Y):
+        _t, desired, _flag = c.integrate(t=[0, 1, 2], y=y0i)
+        np.testing.assert_allclose(Yi, desired)
+    np.testing.assert_equal(flags, cvode.CV_SUCCESS)
+
+def test_jac():
+    """An analytic Jacobian gives the same solution without extra RHS calls."""
+    t = np.linspace(0, 10, 11)
+    _t, desired, _flag = Cvodeint(example_ode.vdp, t, [0, -2]).integrate()
+    for kwargs in dict(), dict(mupper=1, mlower=1):
+        c = Cvodeint(example_ode.vdp, t, [0, -2], jac=example_ode.vdp_jac, 
+            **kwargs)
+        _t, actual, _flag = c.integrate()
+        np.testing.assert_allclose(actual, desired, rtol=1e-4, atol=1e-6)
+        stats = c.jacobian_stats()
+        assert stats["njevals"] > 0
+        assert stats["nfevalsLS"] == 0
+
+def test_linsolver_auto():
+    """Automatic choice of a band solver agrees with the dense solver."""
+    t = np.linspace(0, 1, 5)
+    y0 = np.arange(12.0)
+    _t, desired, _flag = Cvodeint(example_ode.markov_chain, t, y0).integrate()
+    c = Cvodeint(example_ode.markov_chain, t, y0, linsolver="auto")
+    assert c.linsolver_choice.name == "band"
+    _t, actual, _flag = c.integrate()
+    np.testing.assert_allclose(actual, desired, rtol=1e-5, atol=1e-8)
+
+def test_reverse_cuthill_mckee():
+    """Reordering recovers the bandwidth of a shuffled band matrix."""
+    from ..cvodeint.sparsity import bandwidth, reverse_cuthill_mckee
+    i, j = np.indices((30, 30))
+    pattern = abs(i - j) <= 2
+    shuffle = np.random.RandomState(0).permutation(30)
+    shuffled = pattern[shuffle][:, shuffle]
+    assert sum(bandwidth(shuffled)) > 4
+    assert sum(bandwidth(shuffled, reverse_cuthill_mckee(shuffled))) <= 4
+
+def test_stepbuffer():
+    """Reused and caller-supplied output arrays give the same result."""
+    c = Cvodeint(example_ode.vdp, [0, 20], [0, -2], chunksize=10)
+    desired = c.integrate()
+    again = c.integrate(t=[0, 20], y=[0, -2])
+    assert len(c.stepbuffer) > 10 # grown by doubling, kept for reuse
+    m = 10 * len(desired[0])
+    tbuf, Ybuf = np.zeros(m), np.zeros((m, 2))
+    viewed = c.integrate(t=[0, 20], y=[0, -2], out=(tbuf, Ybuf))
+    assert viewed[1].base is Ybuf
+    for actual in again, viewed:
+        np.testing.assert_array_equal(actual[0], desired[0])
+        np.testing.assert_array_equal(actual[1], desired[1])
+    # room for the initial state and at least one step
+    np.testing.assert_raises(ValueError, c.integrate, t=[0, 20], y=[0, -2], 
+        out=(tbuf[:1], Ybuf[:1]))
+
+def test_dense_output():
+    """Trajectory agrees with the exact solution between solver steps."""
+    c = Cvodeint(example_ode.logistic_growth, [0, 2], [0.1])
+    t, traj, _flag = c.integrate(dense_output=True)
+    np.testing.assert_array_equal(t, [0, 2])
+    np.testing.assert_array_equal(traj.t[[0, -1]], t)
+    tnew = np.linspace(0, 2, 7)
+    desired = example_ode.logistic_growth_sol(tnew, 0.1)
+    np.testing.assert_allclose(traj(tnew).squeeze(), desired, rtol=1e-6)
+    np.testing.assert_raises(ValueError, c.integrate, t=[0, 2], y=[0.1], 
+        dense_output=True, record=dict(every=2))
+
+def test_dense_output_memory():
+    """A windowed trajectory of a long run needs less memory than its steps."""
+    from ..cvodeint.trajectory import Trajectory
+    c = Cvodeint(example_ode.vdp, [0, 2000], [0, -2])
+    t, Y, _flag = c.integrate()
+    plain = t.nbytes + Y.nbytes
+    traj = Trajectory(c.n, 0.0, window=20.0, size=100)
+    tdense, _Y, _flag = c.integrate(t=[0, 2000], y=[0, -2], dense_output=traj)
+    assert _Y is None
+    dense = tdense.nbytes + traj.nbytes
+    assert dense < plain / 10, (dense, plain)
+    # the end of the trajectory is still available at full accuracy
+    np.testing.assert_allclose(traj(t[-10:]), Y[-10:], rtol=1e-5, atol=1e-6)
+
+def test_trajectory_window():
+    """A windowed trajectory forgets old steps but evaluates recent ones."""
+    from ..cvodeint.trajectory import Trajectory
+    traj = Trajectory(n=1, t0=0.0, window=5.0, size=4)
+    for tend in range(1, 101):
+        traj.append(tend, 1, [[tend], [1.0]]) # y = t
+    assert len(traj) < 20
+    np.testing.assert_allclose(traj([95.5, 100]).squeeze(), [95.5, 100])
+    try:
+        traj(50)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Evaluation outside window should fail")
+
+def test_iterate():
+    """Blocks from iterate() add up to the output of integrate()."""
+    c = Cvodeint(example_ode.vdp, [0, 20], [0, -2])
+    t, Y, flag = c.integrate()
+    blocks = list(c.iterate(y=[0, -2], chunk=10))
+    assert all(len(ti) == 10 for ti, _Yi, _flag in blocks[:-1])
+    assert [fl for _ti, _Yi, fl in blocks[:-1]] == [cvode.CV_SUCCESS] * (
+        len(blocks) - 1)
+    assert blocks[-1][-1] == flag
+    np.testing.assert_equal(np.concatenate([b[0] for b in blocks]), t)
+    np.testing.assert_equal(np.concatenate([b[1] for b in blocks]), Y)
+    # Stops at roots like integrate()
+    t, Y, flag = c.integrate(t=[0, 20], y=[0, -2], nrtfn=1, 
+        g_rtfn=c.ydoti(0))
+    blocks = list(c.iterate(t=[0, 20], y=[0, -2], chunk=10))
+    assert blocks[-1][-1] == cvode.CV_ROOT_RETURN
+    np.testing.assert_equal(np.concatenate([b[0] for b in blocks]), t)
+
+def test_solverstats():
+    """Statistics per integration add up to the totals."""
+    c = Cvodeint(example_ode.vdp, [0, 20], [0, -2], time_rhs=True)
+    t, _Y, _flag = c.integrate()
+    first = c.stats
+    assert first["nsteps"] == len(t) - 1
+    assert first["nfevals"] >= first["nsteps"]
+    assert 0 < first["rhs_seconds"] <= first["seconds"]
+    np.testing.assert_equal(first["tcur"], 20)
+    c.integrate(t=30)
+    for k in Solverstats._counts:
+        assert c.totals[k] == first[k] + c.stats[k]
+    # Ensemble statistics cover all members
+    c.ensemble(y=[[0, -2], [0, -2]], t=[0, 20])
+    assert c.stats["nsteps"] == 2 * first["nsteps"]
+    rec = np.array(c.totals)
+    assert rec.dtype.names == tuple(Solverstats._fields)
+
+def test_clone():
+    """Clones reuse released solver objects and integrate like new ones."""
+    c = Cvodeint(example_ode.vdp, [0, 20], [0, -2], reltol=1e-6)
+    _t, desired, _flag = c.clone().integrate()
+    # A released solver object keeps no rootfinding from its previous owner
+    c.integrate(nrtfn=1, g_rtfn=c.ydoti(0))
+    mem = c.cvode_mem
+    c.release()
+    assert c.cvode_mem is None
+    clone = c.clone(y=[0, -2])
+    assert clone.cvode_mem is mem
+    _t, actual, flag = clone.integrate()
+    assert flag == cvode.CV_TSTOP_RETURN
+    np.testing.assert_allclose(actual, desired)
+
+def test_checkpoint():
+    """Resuming from a checkpoint continues the solution and statistics."""
+    import os
+    import tempfile
+    c = Cvodeint(example_ode.vdp, [0, 20], [0, -2])
+    c.integrate(t=10)
+    path = os.path.join(tempfile.mkdtemp(), "checkpoint.npz")
+    c.checkpoint(path)
+    resumed = Cvodeint(example_ode.vdp, [0, 20], [0, -2])
+    resumed.restore(path)
+    assert resumed.totals == c.totals
+    # last accepted step, scaled for the restart at order 1
+    from ..cvodeint.core import order1_step
+    saved = np.load(path)
+    assert resumed.init_step == order1_step(saved["hlast"], saved["qlast"]) > 0
+    saved.close()
+    _t, desired, _flag = c.integrate(t=20)
+    _t, actual, _flag = resumed.integrate(t=20)
+    np.testing.assert_allclose(actual[-1], desired[-1], rtol=1e-5, atol=1e-6)
+    # The saved step size is used once only
+    assert resumed.init_step == 0
+    os.remove(path)
+
+def test_interpolate():
+    """Interpolated fixed-time output agrees with CV_NORMAL mode."""
+    t = np.linspace(0, 20, 2001)
+    c = Cvodeint(example_ode.vdp, t, [0, -2])
+    t0, desired, flag0 = c.integrate()
+    t1, actual, flag1 = c.integrate(y=[0, -2], interpolate=True)
+    np.testing.assert_equal(t1, t0)
+    np.testing.assert_allclose(actual, desired, rtol=1e-6, atol=1e-8)
+    assert flag1 == flag0
+    # Stop at root, after the output times that precede it
+    kwargs = dict(t=t, y=[0, -2], nrtfn=1, g_rtfn=c.ydoti(0))
+    t0, desired, flag0 = c.integrate(**kwargs)
+    t1, actual, flag1 = c.integrate(interpolate=True, **kwargs)
+    assert flag0 == flag1 == cvode.CV_ROOT_RETURN
+    np.testing.assert_allclose(t1, t0)
+    np.testing.assert_allclose(actual, desired, rtol=1e-6, atol=1e-8)
+    # Adams goes up to order 12, BDF only to 5
+    c = Cvodeint(example_ode.vdp, t, [0, -2], method="adams")
+    t0, desired, flag0 = c.integrate()
+    t1, actual, flag1 = c.integrate(y=[0, -2], interpolate=True)
+    np.testing.assert_equal(t1, t0)
+    np.testing.assert_allclose(actual, desired, rtol=1e-6, atol=1e-8)
+    assert flag1 == flag0
+
+def test_record_policy():
+    """Record only some adaptive steps, but always the first and last."""
+    c = Cvodeint(example_ode.vdp, [0, 20], [0, -2])
+    t0, Y0, flag0 = c.integrate()
+    t, Y, flag = c.integrate(y=[0, -2], record=dict(every=5))
+    assert flag == flag0
+    assert t[0] == t0[0]
+    assert len(t) < len(t0) // 4
+    np.testing.assert_equal(t[:-1], t0[:-1:5])
+    np.testing.assert_equal(Y[-1], Y0[-1])
+    t, Y, flag = c.integrate(y=[0, -2], record=Recordpolicy(dt=1.0))
+    assert (np.diff(t)[:-1] >= 1.0).all()
+    assert t[-1] == 20
+    t, Y, flag = c.integrate(y=[0, -2], record=dict(dy=0.5))
+    assert (abs(np.diff(Y, axis=0)[:-1]).max(axis=1) >= 0.5).all()
+    np.testing.assert_raises(ValueError, c.integrate, t=[0, 1, 2], 
+        record=dict(every=2))
+
+import unittest
+from ..cvodeint import core
+
+@unittest.skipIf(core._steploop is None, "cgp.cvodeint._steploop not built")
+def test_compiled_loop():
+    """Compiled and Python loops give the same steps, roots and errors."""
+    c = Cvodeint(example_ode.vdp, [0, 20], [0, -2], chunksize=50)
+    g_rtfn = c.ydoti(0)
+    result = {}
+    for compiled in True, False:
+        c.compiled_loop = compiled
+        c.maxsteps = 1e4
+        t, Y, flag = c.integrate(t=[0, 20], y=[0, -2], nrtfn=0)
+        t1, Y1, flag1 = c.integrate(t=[0, 20], y=[0, -2], nrtfn=1, 
+            g_rtfn=g_rtfn)
+        c.maxsteps = 100
+        try:
+            c.integrate(t=[0, 20], y=[0, -2], nrtfn=0)
+        except CvodeException, exc:
+            t2 = exc.result[0]
+        result[compiled] = t, Y, flag, t1, Y1, flag1, t2
+    for actual, desired in zip(result[True], result[False]):
+        np.testing.assert_equal(actual, desired)
+
+def test_method():
+    """Adams and BDF agree; "auto" retries with BDF if Adams fails."""
+    result = {}
+    for method in "adams", "bdf":
+        c = Cvodeint(example_ode.vdp, [0, 20], [0, -2], method=method)
+        t, Y, flag = c.integrate()
+        assert c.method_used == method
+        assert c.method_totals[method]["nsteps"] == c.totals["nsteps"] > 0
+        result[method] = Y[-1]
+    np.testing.assert_allclose(result["adams"], result["bdf"], rtol=1e-4, 
+        atol=1e-6)
+    def ode(t, y, ydot, f_data):
+        assert c.method_used == "bdf"
+        example_ode.vdp(t, y, ydot, f_data)
+    c = Cvodeint(ode, [0, 20], [0, -2], method="auto", validate=False)
+    assert c.method_used == "adams"
+    t, Y, flag = c.integrate()
+    assert c.method_used == "bdf"
+    np.testing.assert_allclose(Y[-1], result["bdf"], rtol=1e-4, atol=1e-6)
+    assert c.totals["nsteps"] == c.method_totals["bdf"]["nsteps"] + \
+        c.method_totals["adams"]["nsteps"]
+    np.testing.assert_raises(ValueError, Cvodeint, example_ode.vdp, [0, 1], 
+        [0, -2], method="rk45")
+
+def test_breakpoints():
+    """Breakpoints give the same result as separate integrate() calls."""
+    c = Cvodeint(example_ode.vdp, [0, 10], [0, -2])
+    t0, Y0, _flag0 = c.integrate(t=[0, 2.5], y=[0, -2])
+    t1, Y1, _flag1 = c.integrate(t=[2.5, 5])
+    t2, Y2, flag2 = c.integrate(t=[5, 10])
+    t, Y, flag = c.integrate(t=[0, 10], y=[0, -2], breakpoints=[5, 2.5, 20])
+    np.testing.assert_equal(t, np.concatenate([t0, t1, t2]))
+    np.testing.assert_equal(Y, np.concatenate([Y0, Y1, Y2]))
+    assert flag == flag2 == cvode.CV_TSTOP_RETURN
+    np.testing.assert_equal(c.t, [0, 10])
+    # Statistics cover all segments, although each ReInit resets CVODE's
+    assert c.stats["nsteps"] == len(t) - 1 - 2
+    totals = c.totals["nsteps"]
+    c.integrate(t=[0, 10], y=[0, -2], breakpoints=[5, 2.5])
+    assert c.totals["nsteps"] - totals == c.stats["nsteps"] > 0
+    # Output so far is returned on error, as without breakpoints
+    def ode(t, y, ydot, f_data):
+        example_ode.vdp(t, y, ydot, f_data)
+        return -1 if t > 7 else 0
+    c = Cvodeint(ode, [0, 10], [0, -2], validate=False)
+    try:
+        c.integrate(breakpoints=[5])
+    except CvodeException, exc:
+        t, _Y, _flag = exc.result
+    assert 5 <= t[-1] <= 7
+    assert (t == 5).sum() == 2
+    np.testing.assert_raises(ValueError, c.integrate, t=[0, 5, 10], 
+        breakpoints=[2.5])
+
+def test_spill():
+    """Spilling to disk gives the same result as in-memory output."""
+    import tempfile, os, shutil
+    dtemp = tempfile.mkdtemp()
+    try:
+        filenames = [os.path.join(dtemp, s) for s in ("t.npy", "Y.npy")]
+        for compiled in True, False:
+            c = Cvodeint(example_ode.vdp, [0, 20], [0, -2], chunksize=10)
+            c.compiled_loop = compiled and c.compiled_loop
+            t, Y, flag = c.integrate()
+            t1, Y1, flag1 = c.integrate(t=[0, 20], y=[0, -2], 
+                spill=filenames)
+            assert isinstance(Y1, np.memmap)
+            np.testing.assert_equal(t1, t)
+            np.testing.assert_equal(Y1, Y)
+            np.testing.assert_equal(np.load(filenames[1]), Y)
+            assert flag1 == flag
+            del t1, Y1
+        np.testing.assert_raises(ValueError, c.integrate, t=[0, 5, 10], 
+            spill=filenames)
+    finally:
+        shutil.rmtree(dtemp)
+
+def test_events():
+    """Events continue past crossings that plain rootfinding stops at."""
+    def x(t, y, gout, g_data):
+        gout[0] = y[0]
+        return 0
+    c = Cvodeint(example_ode.vdp, [0, 20], [1, 1])
+    # one integrate() call per root with plain rootfinding
+    troots = []
+    t, Y, flag = c.integrate(nrtfn=1, g_rtfn=x)
+    while flag == cvode.CV_ROOT_RETURN:
+        troots.append(t[-1])
+        t, Y, flag = c.integrate()
+    t, Y, flag = c.integrate(t=[0, 20], y=[1, 1], events=[("x=0", x)])
+    assert flag == cvode.CV_TSTOP_RETURN
+    assert len(c.crossings) == len(troots) > 2
+    np.testing.assert_allclose([cr.t for cr in c.crossings], troots, 
+        rtol=1e-6)
+    assert all(cr.t in t for cr in c.crossings)
+    np.testing.assert_allclose([cr.y[0] for cr in c.crossings], 0, 
+        atol=1e-6)
+    # directions alternate, starting with the first crossing from x=1
+    assert [cr.direction for cr in c.crossings][:2] == [-1, 1]
+    # only rising crossings, stopping at the second of them
+    rising = dict(name="up", g=x, direction=1, 
+        terminal=lambda c: len(c.crossings) == 2)
+    t, Y, flag = c.integrate(t=[0, 20], y=[1, 1], events=[rising])
+    assert flag == cvode.CV_ROOT_RETURN
+    assert [cr.direction for cr in c.crossings] == [1, 1]
+    assert t[-1] == c.crossings[-1].t
+    # events stay in effect until rootfinding is changed
+    c.integrate(t=[0, 20], y=[1, 1])
+    assert len(c.crossings) == 2
+    # ...but are refused by output modes that cannot continue past them
+    np.testing.assert_raises(ValueError, c.integrate, t=[0, 1, 2], y=[1, 1])
+    np.testing.assert_raises(ValueError, c.integrate, t=[0, 1, 2], y=[1, 1], 
+        interpolate=True)
+    np.testing.assert_raises(ValueError, list, c.iterate(t=[0, 20], y=[1, 1]))
+    np.testing.assert_raises(ValueError, c.ensemble, [[1, 1]], t=[0, 1, 2])
+    c.ensemble([[1, 1]], t=[0, 20])
+    c.RootInit(0)
+    assert c.events is None
+    np.testing.assert_raises(ValueError, c.integrate, t=[0, 1, 2], 
+        events=[("x=0", x)])
+    np.testing.assert_raises(ValueError, c.integrate, nrtfn=1, g_rtfn=x, 
+        events=[("x=0", x)])
+
+def test_warm_restart():
+    """Warm restarts reuse the step size, within the new interval."""
+    c = Cvodeint(example_ode.vdp, [0, 5], [0, -2], reltol=1e-8, abstol=1e-8)
+    _t, Ycold, _flag = c.integrate(t=[0, 5], y=[0, -2])
+    c.warm_restart = True
+    _t, Ywarm, _flag = c.integrate(t=[0, 5], y=[0, -2])
+    np.testing.assert_allclose(Ywarm[-1], Ycold[-1], rtol=1e-5, atol=1e-6)
+    # the step size is a one-shot setting, reverting when switched off
+    assert c.init_step == 0.0
+    c.warm_restart = False
+    c.integrate(t=[0, 5], y=[0, -2])
+    assert c.init_step is None
+    # last accepted step, scaled for order 1, within the interval
+    h = cvode.CVodeGetLastStep(c.cvode_mem)
+    h *= 0.5 ** (cvode.CVodeGetLastOrder(c.cvode_mem) - 1)
+    assert 0 < c._warm_step() == h
+    c.tstop = c.t0.value + h / 4
+    assert c._warm_step() == h / 4
+    c.tstop = c.t0.value - 2 * h
+    assert c._warm_step() == -h
@@ -4,6 +4,7 @@
 from nose.tools import raises
 import numpy as np
 
+from ..cvodeint import namedcvodeint
 from ..cvodeint.namedcvodeint import Namedcvodeint
 
 def test_autorestore():
@@ -34,3 +35,71 @@ def test_no_p():
     n = Namedcvodeint(ode, t=[0, 1], y=np.ones(1.0).view([("y", float)]))
     with n.autorestore():
         n.integrate()
+
+def test_ensemble():
+    """Parameter sets in an ensemble are applied, then restored."""
+    n = Namedcvodeint()
+    p = np.tile(n.pr, 2)
+    p["epsilon"] = 0.5, 2.0
+    t = np.linspace(0, 1, 5)
+    _t, Yr, _flags = n.ensemble(p=p, t=t)
+    for pi, Yri in zip(p, Yr):
+        with n.autorestore(_p=pi):
+            _t, desired, _flag = n.integrate(t=t)
+        np.testing.assert_allclose(Yri.view(float), desired.view(float))
+    np.testing.assert_equal(n.pr.epsilon, 1.0)
+
+def test_dense_output():
+    """Dense output of a named model evaluates to record arrays."""
+    n = Namedcvodeint()
+    with n.autorestore():
+        _t, traj, _flag = n.integrate(t=[0, 1], dense_output=True)
+    _t, desired, _flag = n.integrate(t=[0, 0.5, 1])
+    actual = traj([0, 0.5, 1])
+    assert actual.dtype == desired.dtype
+    np.testing.assert_allclose(actual.view(float), desired.view(float), 
+        rtol=1e-6, atol=1e-8)
+
+def final_x(model):
+    """Final value of x, as a record (for test_pmap)."""
+    _t, Yr, _flag = model.integrate(t=[0, 1])
+    return np.rec.fromrecords([(Yr.x[-1].item(), model.pr.epsilon.item())], 
+        names="x,epsilon")
+
+def test_pmap():
+    """Parallel map gives the same results as a serial loop."""
+    n = Namedcvodeint()
+    p = np.tile(n.pr, 5)
+    p["epsilon"] = np.linspace(0.5, 2.5, 5)
+    actual = n.pmap(final_x, p, processes=2, chunksize=2)
+    desired = np.concatenate([final_x_with(n, pi) for pi in p])
+    np.testing.assert_equal(actual.epsilon, p.epsilon)
+    np.testing.assert_allclose(actual.x, desired["x"])
+    np.testing.assert_equal(n.pr.epsilon, 1.0)
+
+def final_x_with(model, p):
+    """Serial reference for test_pmap."""
+    with model.autorestore(_p=p):
+        return final_x(model)
+
+def test_calibrate_abstol():
+    """Calibrated abstol scales with each variable and is reused."""
+    def mixed_units(_t, y, ydot, _f_data):
+        """Decay of a large and a small quantity."""
+        ydot[0] = -y[0]
+        ydot[1] = -2 * y[1]
+    
+    y = np.array([(100.0, 1e-4)], dtype=[("V", float), ("Ca", float)])
+    n = Namedcvodeint(mixed_units, [0, 1], y, reltol=1e-6)
+    key = n._abstol_key()
+    try:
+        abstol = n.calibrate_abstol()
+        np.testing.assert_allclose(abstol.view(float), [1e-4, 1e-10])
+        np.testing.assert_equal(n.y, [100.0, 1e-4])
+        _t, Y, _flag = n.integrate()
+        np.testing.assert_allclose(Y.Ca[-1], 1e-4 * np.exp(-2), rtol=1e-4)
+        m = Namedcvodeint(mixed_units, [0, 1], y, reltol=1e-6, 
+            abstol="calibrated")
+        np.testing.assert_equal(np.array(m.abstol), abstol.view(float))
+    finally:
+        namedcvodeint.calibrated_abstol.pop(key, None)
@@ -0,0 +1,33 @@
+"""Tests for :mod:`cgp.cvodeint.parareal`."""
+# pylint: disable=C0111
+
+import numpy as np
+
+from ..cvodeint.namedcvodeint import Namedcvodeint
+
+def test_parareal():
+    """Parareal agrees with serial integration, breakpoints included."""
+    n = Namedcvodeint(t=[0, 8], reltol=1e-8)
+    breakpoints = [1, 3.5, 4]
+    with n.autorestore():
+        _t, Yr, _flag = n.integrate(t=[0, 8], breakpoints=breakpoints)
+        desired = Yr[-1].view(float)
+    y0 = np.array(n.y)
+    for processes in 1, 2:
+        T, U, niter = n.parareal(t=[0, 8], nslices=4, 
+            breakpoints=breakpoints, processes=processes)
+        np.testing.assert_equal(T, [0, 2, 4, 6, 8])
+        np.testing.assert_equal(U[0], y0)
+        np.testing.assert_allclose(U[-1], desired, rtol=1e-6, atol=1e-6)
+        assert 1 <= niter <= 4
+        np.testing.assert_equal(n.y, y0)
+    np.testing.assert_raises(ValueError, n.parareal, 
+        breakpoints=[(4, dict(epsilon=2.0))])
+
+def test_parareal_coarse_only():
+    """With maxiter=0, parareal returns the coarse solution."""
+    n = Namedcvodeint(t=[0, 8])
+    T, U, niter = n.parareal(nslices=4, maxiter=0, processes=1)
+    assert niter == 0
+    assert len(T) == len(U) == 5
+    assert np.isfinite(U).all()
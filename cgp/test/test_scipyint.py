@@ -0,0 +1,67 @@
+"""Tests for :mod:`cgp.cvodeint.scipyint`."""
+# pylint: disable=C0111
+
+import numpy as np
+from pysundials import cvode
+
+from ..cvodeint import Cvodeint, CvodeException, example_ode
+from ..cvodeint.scipyint import Scipyint
+
+def test_same_semantics():
+    """Roots, resuming and fixed output times as for Cvodeint."""
+    g_rtfn = Cvodeint(example_ode.vdp, [0, 1], [0, -2]).ydoti(0)
+    roots = {}
+    for cls in Cvodeint, Scipyint:
+        integrator = cls(example_ode.vdp, [0, 20], [0, -2], nrtfn=1, 
+            g_rtfn=g_rtfn)
+        roots[cls] = []
+        flag = cvode.CV_ROOT_RETURN
+        while flag == cvode.CV_ROOT_RETURN:
+            t, Y, flag = integrator.integrate()
+            roots[cls].append(t[-1])
+        assert flag == cvode.CV_TSTOP_RETURN
+    np.testing.assert_allclose(roots[Scipyint], roots[Cvodeint], rtol=1e-5)
+    tout = np.linspace(0, 20, 41)
+    s = Scipyint(example_ode.vdp, tout, [0, -2], nrtfn=1, g_rtfn=g_rtfn)
+    t, Y, flag = s.integrate()
+    assert flag == cvode.CV_ROOT_RETURN
+    np.testing.assert_equal(t[:-1], tout[:len(t) - 1])
+    assert tout[len(t) - 2] < t[-1] < tout[len(t) - 1]
+    t, Y, flag = s.integrate(t=tout, y=[0, -2], nrtfn=0)
+    assert flag == cvode.CV_SUCCESS
+    np.testing.assert_equal(t, tout)
+    t, Y, flag = s.integrate(t=25)
+    assert (t[0], t[-1], flag) == (20, 25, cvode.CV_TSTOP_RETURN)
+
+def test_rhs_failure():
+    """Partial solution is returned if the right-hand side fails."""
+    def ode(t, y, ydot, f_data):
+        ydot[0] = 1.0 if t < 1 else 1 / 0
+    s = Scipyint(ode, [0, 2], [0.0], method="RK45")
+    try:
+        s.integrate()
+    except CvodeException, exc:
+        t, Y, flag = exc.result
+        assert flag == cvode.CV_RHSFUNC_FAIL
+        assert 0 < t[-1] < 1
+        np.testing.assert_allclose(Y[:, 0], t)
+        assert "ZeroDivisionError" in s.my_f_ode.traceback
+    else:
+        raise AssertionError("CvodeException not raised")
+
+def test_backend():
+    """Model classes integrate with Scipyint through the backend argument."""
+    from ..cvodeint.namedcvodeint import Namedcvodeint
+    last = {}
+    for backend in "cvode", "LSODA":
+        vdp = Namedcvodeint(t=[0, 10], backend=backend)
+        with vdp.autorestore():
+            t, Y, flag = vdp.integrate(breakpoints=[(5, dict(epsilon=2))])
+            assert flag == cvode.CV_TSTOP_RETURN
+            assert (t == 5).sum() == 2
+            assert vdp.tret.value == 10 and vdp.pr.epsilon == 2
+            np.testing.assert_equal(np.array(vdp.y), Y.view(float)[-1])
+            last[backend] = Y.view(float)[-1]
+        assert vdp.clone().backend == backend
+    np.testing.assert_allclose(last["LSODA"], last["cvode"], rtol=1e-4)
+    np.testing.assert_raises(ValueError, vdp.integrate, events=[])
@@ -0,0 +1,34 @@
+"""Tests for :mod:`cgp.cvodeint.sensitivities`."""
+# pylint: disable=C0111
+
+import numpy as np
+from nose.tools import raises
+
+from ..cvodeint import Cvodeint, CvodeException, example_ode
+from ..cvodeint.namedcvodeint import Namedcvodeint
+
+def test_sensitivities():
+    """Forward sensitivities agree with finite differences."""
+    n = Namedcvodeint(t=[0, 5], reltol=1e-10, abstol=1e-10)
+    y0 = np.array(n.y)
+    t = np.linspace(0, 5, 11)
+    tout, Yr, Sr, _flag = n.sensitivities(["epsilon"], t=t)
+    np.testing.assert_equal(tout, t)
+    np.testing.assert_equal(n.y, y0)
+    np.testing.assert_equal(n.pr.epsilon, 1.0)
+    with n.autorestore():
+        _t, Yr0, _flag = n.integrate(t=t)
+    np.testing.assert_allclose(Yr.view(float), Yr0.view(float), 
+        rtol=1e-6, atol=1e-8)
+    dp = 1e-5
+    Y = {}
+    for sign in 1, -1:
+        with n.autorestore(epsilon=1 + sign * dp):
+            Y[sign] = n.integrate(t=t)[1].view(float)
+    fd = (Y[1] - Y[-1]) / (2 * dp)
+    np.testing.assert_allclose(Sr.view(float).squeeze(), fd, rtol=1e-4, 
+        atol=1e-5)
+
+@raises(CvodeException)
+def test_no_parameters():
+    Cvodeint(example_ode.vdp, [0, 1], [0, -2]).sensitivities([0])
@@ -24,6 +24,9 @@ array([ 0,  1,  2, 42, 42, 42, 42,  7,  8,  9])
 array([  0,   1,   2,  42,  42,  42,  42, 123,   8,   9])
 >>> shutil.rmtree(dtemp)
 """
+import struct
+import sys
+
 import numpy as np
 _file = file  # Hack borrowed from Numpy 1.4.0 np.lib.io
 from numpy.lib.format import magic, read_magic, dtype_to_descr
@@ -201,6 +204,83 @@ def open_memmap(filename, mode='r+', dtype=None, shape=None,
 
     return marray
 
+def create_appendable(filename, dtype, shape=()):
+    """
+    Create a .npy file for appending rows of given dtype and shape.
+    
+    Returns the file object, positioned after the header. Write rows with 
+    e.g. ``x.tofile(fp)``, then call :func:`update_shape` to make the file 
+    readable, with as many rows as have been written.
+    
+    The header is padded to make room for any number of rows, so that 
+    :func:`update_shape` can rewrite it in place. Thus an array of unknown 
+    length can be written in chunks, without holding it all in memory.
+    
+    >>> import tempfile, os, shutil
+    >>> dtemp = tempfile.mkdtemp()
+    >>> filename = os.path.join(dtemp, "test.npy")
+    >>> fp = create_appendable(filename, float, shape=(2,))
+    >>> np.arange(4.0).tofile(fp)
+    >>> update_shape(fp)
+    2
+    >>> np.load(filename)
+    array([[ 0.,  1.],
+           [ 2.,  3.]])
+    >>> np.arange(4.0, 6.0).tofile(fp)
+    >>> update_shape(fp), open_memmap(filename, mode="r")[-1]
+    (3, memmap([ 4.,  5.]))
+    >>> fp.close()
+    >>> shutil.rmtree(dtemp)
+    """
+    dtype = np.dtype(dtype)
+    length = len(_header(dtype, (sys.maxint,) + tuple(shape)))
+    fp = open(filename, "w+b")
+    fp.write(_header(dtype, (0,) + tuple(shape), length))
+    return fp
+
+def update_shape(fp):
+    """
+    Write the number of rows into the header of a :func:`create_appendable` file.
+    
+    Returns the number of rows. The file is flushed, and left positioned at 
+    its end for further appending.
+    """
+    fp.flush()
+    end = fp.tell()
+    fp.seek(0)
+    read_magic(fp)
+    shape, _fortran_order, dtype = read_array_header_1_0(fp)
+    start = fp.tell()
+    rowsize = dtype.itemsize * int(np.prod(shape[1:]))
+    nrows = (end - start) // rowsize
+    fp.seek(0)
+    fp.write(_header(dtype, (nrows,) + tuple(shape[1:]), start))
+    fp.seek(end)
+    fp.flush()
+    return nrows
+
+def _header(dtype, shape, length=None):
+    """
+    Version 1.0 .npy header, padded with spaces to *length* bytes if given.
+    
+    Otherwise the header is padded to a multiple of 16 bytes, as in the 
+    .npy format specification.
+    
+    >>> header = _header(float, (3,))
+    >>> header[10:].strip(), len(header) % 16
+    ("{'descr': '<f8', 'fortran_order': False, 'shape': (3,), }", 0)
+    >>> len(_header(float, (3,), 96))
+    96
+    """
+    d = dict(descr=dtype_to_descr(np.dtype(dtype)), fortran_order=False, 
+        shape=tuple(shape))
+    text = "{%s}" % "".join("'%s': %r, " % (k, v) for k, v in sorted(d.items()))
+    if length is None:
+        # magic string and version (8 bytes), header length (2 bytes), text
+        length = 16 * -(-(10 + len(text) + 1) // 16) # ceiling division
+    text = text.ljust(length - 11) + "\n"
+    return magic(1, 0) + struct.pack("<H", len(text)) + text
+
 def load(file, mmap_mode=None, offset=0, shape=None): # pylint: disable=W0622
     """
     Load a pickled, ``.npy``, or ``.npz`` binary file.
@@ -27,7 +27,6 @@ except ImportError:
     
     r = DummyR()
 
-from ...cvodeint.namedcvodeint import Namedcvodeint
 from . import paceable
 from .ap_stats import apd
 from ...utils.ordereddict import OrderedDict
@@ -643,12 +642,9 @@ class Clampable(object):
         
         y = np.array(self.y).view(self.dtype.y)
         
-        # Use original options when rerunning the Cvodeint initialization.
-        oldkwargs = dict((k, getattr(self, k)) 
-            for k in "chunksize maxsteps reltol abstol".split())
-        
         pr_old = self.pr.copy()
-        clamped = Namedcvodeint(dynclamped, self.t, y, self.pr, **oldkwargs)
+        # The new RHS calls the validated one, see Namedcvodeint.clamp()
+        clamped = self.clone(dynclamped, y=y, validate=False, jac=None)
         
         # Disable any hard-coded stimulus protocol
         if "stim_amplitude" in clamped.dtype.p.names:
@@ -661,6 +657,7 @@ class Clampable(object):
             for k in clamped.dtype.y.names:
                 if k in self.dtype.y.names:
                     setattr(self.yr, k, getattr(clamped.yr, k))
+            clamped.release()
 
     def vclamp(self, protocol, nthin=None):
         """
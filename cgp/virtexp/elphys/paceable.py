@@ -38,6 +38,7 @@ import numpy as np
 from pysundials import cvode
 
 from . import ap_stats
+from ...cvodeint.core import Event
 
 class Paceable(object):
     """
@@ -196,17 +197,14 @@ class Paceable(object):
             assert_flag=cvode.CV_TSTOP_RETURN, ignore_flags=ignore_flags))
         
         # integrate from stimulus to peak
-        j_peak = 0 # index to "result" item ending with peak
-        # make sure we don't stop at a minor peak at end of stimulus
-        # repeat until we are at an extremum with V > 0
-        while True:
-            j_peak += 1
-            result.append(self.integrate(t=self.pr.stim_period, 
-                nrtfn=1, g_rtfn=self.ydoti("V"), assert_flag=cvode.CV_ROOT_RETURN, 
-                ignore_flags=ignore_flags))
-            _tj, yj, flagj = result[-1]
-            if (flagj == cvode.CV_TSTOP_RETURN) or (yj.V[-1] > 0):
-                break
+        j_peak = 1 # index to "result" item ending with peak
+        # make sure we don't stop at a minor peak at end of stimulus:
+        # continue until we are at an extremum with V > 0
+        peak = Event("peak", self.ydoti("V"), 
+            terminal=lambda self: bool(self.yr.V > 0))
+        result.append(self.integrate(t=self.pr.stim_period, events=[peak], 
+            assert_flag=cvode.CV_ROOT_RETURN, ignore_flags=ignore_flags))
+        _tj, yj, _flagj = result[-1]
         
         # compute repolarization thresholds
         Vmin = result[0][1][0].V # 1st integration, 2nd return var, 1st step
@@ -236,8 +234,7 @@ class Paceable(object):
         # The items of the tuples refer to these intervals, assuming the
         # default p_repol specifying four thresholds:
         # 0) stimulus
-        # ...+ possibly more here, waiting for some extremum V >= 0...
-        # 1) stimulus to peak,
+        # 1) stimulus to peak, passing any minor extrema with V <= 0
         # 2) peak to first repolarization threshold
         # 3) first to second repolarization threshold
         # 4) second to third repolarization threshold
@@ -333,32 +330,12 @@ class Paceable(object):
          'ttp': 1.844189...}
         """
         
-        result = [] # list to keep results from integration subintervals
-
-        # integrate over stimulus
-        # logging.debug("integrate over stimulus")
-        result.append(self.integrate(t=[0, self.pr.stim_duration], 
-            nrtfn=0, assert_flag=cvode.CV_TSTOP_RETURN, 
-            ignore_flags=ignore_flags))
-        
-        # integrate from the end of this stimulus to the start of the next one:
-        # logging.debug("integrate from end of stimulus to start of next")
-        # RHS discontinuity here, so force the solver to re-initialize: len(t)>1
-        result.append(self.integrate(
-            t=[self.pr.stim_duration, self.pr.stim_period], 
-            nrtfn=0, assert_flag=cvode.CV_TSTOP_RETURN, 
-            ignore_flags=ignore_flags))
-        
-        # logging.debug("integration finished")
-        t, Y, _flag = zip(*result) # (t, Y, flag), where each is a tuple
-        
-        # The items of the tuples refer to these intervals
-        # 0) stimulus
-        # 1) stimulus to just before next stimulus
-        
-        # concatenation converts recarray to ndarray, so need to convert back
-        Y = np.concatenate(Y).view(np.recarray)
-        t = np.concatenate(t)
+        # integrate over stimulus and on to the start of the next one.
+        # RHS discontinuity at the end of the stimulus, so make the solver 
+        # stop and re-initialize there.
+        t, Y, _flag = self.integrate(t=[0, self.pr.stim_period], 
+            breakpoints=[self.pr.stim_duration], nrtfn=0, 
+            assert_flag=cvode.CV_TSTOP_RETURN, ignore_flags=ignore_flags)
         # logging.debug("computing action potential duration")
         stats = ap_stats.apd(t, Y.V, p_repol=p_repol)
         assert t[stats["i"]][0] == stats["ttp"]
@@ -477,6 +454,42 @@ class Paceable(object):
             for k, tol in reltol.items()])
         return relconv and absconv
         
+    def burnin(self, n=1000, nslices=None, processes=None, **kwargs):
+        """
+        Pace for *n* beats, in parallel over time (experimental).
+        
+        :param int n: Number of beats.
+        :param int nslices: Number of time slices, each a whole number of 
+            beats; default: one per process.
+        :param int processes: Number of worker processes; default: all CPUs.
+        :return int: Number of parareal iterations used.
+        
+        The state is set to that after *n* beats, e.g. as a starting point 
+        for :meth:`steady`; time starts again at 0 with the next :meth:`ap`.
+        Further arguments are passed to 
+        :func:`~cgp.cvodeint.parareal.parareal`. The start and end of each 
+        stimulus are breakpoints.
+        
+        >>> from cgp.virtexp.elphys.examples import Bond
+        >>> bond = Bond()
+        >>> with bond.autorestore():
+        ...     niter = bond.burnin(n=8, processes=2)
+        ...     t, y, stats = bond.ap()
+        """
+        if processes is None:
+            import multiprocessing
+            processes = multiprocessing.cpu_count()
+        period = float(self.pr.stim_period)
+        beats = np.unique(np.round(np.linspace(0, n, 
+            min(n, nslices or processes) + 1)))
+        onsets = period * np.arange(n)
+        breakpoints = sorted(np.r_[onsets[1:], 
+            onsets + float(self.pr.stim_duration)])
+        _T, U, niter = self.parareal(t=period * beats, y=np.array(self.y), 
+            breakpoints=breakpoints, processes=processes, **kwargs)
+        self.y[:] = U[-1]
+        return niter
+    
     def steady(self, winwidth=10, max_nap=1000, reltol=0.001):
         """
         Run heart cell to approximate steady state.
@@ -490,6 +503,8 @@ class Paceable(object):
         
         If dynamics does not converge within *max_nap* intervals, *period* is zero.
         
+        Starting from a state after :meth:`burnin` may save many intervals.
+        
         To speed up the doctest, we use a precomputed approximate steady state.
         
         >>> from cgp.virtexp.elphys.examples import Bond